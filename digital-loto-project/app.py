@@ -16,6 +16,9 @@ try:
    from routes.web_routes import web_bp
    from routes.api_routes import api_bp
    from routes.admin_routes import admin_bp
+   from models.jobs import get_settlement_jobs
+   from utils.request_metrics import register_request_metrics
+   from utils.request_profiler import register_request_profiler
 except ImportError as e:
    print(f"Ошибка импорта: {e}")
    print("Убедитесь, что все файлы созданы правильно")
@@ -34,12 +37,20 @@ def create_app():
    app.register_blueprint(api_bp)
    app.register_blueprint(admin_bp)
    
+   # Метрики запросов для /api/admin/metrics
+   register_request_metrics(app)
+   # Профилирование запросов по ?__profile и выборочное
+   register_request_profiler(app)
+   
    # ПРОВЕРКА ЗАРЕГИСТРИРОВАННЫХ МАРШРУТОВ
    print("=== ЗАРЕГИСТРИРОВАННЫЕ МАРШРУТЫ ===")
    for rule in app.url_map.iter_rules():
        print(f"{rule.endpoint}: {rule.rule}")
    print("===================================")
    
+   # Продолжаем задачи проведения розыгрышей, прерванные падением процесса
+   get_settlement_jobs().resume_unfinished()
+   
    # Обработчики ошибок
    @app.errorhandler(404)
    def not_found_error(error):
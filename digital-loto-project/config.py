@@ -19,6 +19,126 @@ JSON_FILES = {
     'packages': 'data/packages.json'
 }
 
+# Хранилище данных: 'json' (файлы из JSON_FILES) или 'sqlite'
+STORAGE_BACKEND = 'json'
+# Файл базы для STORAGE_BACKEND = 'sqlite'
+# (перенос данных: python -m models.sqlite_storage migrate)
+SQLITE_DB_FILE = 'data/loto.db'
+
+# Журнал изменений билетов (дозапись вместо перезаписи tickets.json)
+TICKETS_JOURNAL_FILE = 'data/tickets.journal.jsonl'
+# Журнал сворачивается в снимок, когда его размер достигает этой доли размера снимка
+TICKETS_JOURNAL_COMPACT_RATIO = 0.5
+# ... но не раньше, чем журнал вырастет до этого размера (байт)
+TICKETS_JOURNAL_COMPACT_MIN_BYTES = 1024 * 1024
+
+# Журнал баланса: списание дописывает строку вместо перезаписи balance.json
+BALANCE_JOURNAL_FILE = 'data/balance.journal.jsonl'
+# Размер журнала баланса (байт), после которого он сворачивается в balance.json
+BALANCE_JOURNAL_MAX_BYTES = 64 * 1024
+
+# Надежность записи на диск
+FSYNC_WRITES = True
+# Окно групповой фиксации (сек.): записи одного файла за это время
+# объединяются в одну запись и один fsync; 0 отключает группировку
+GROUP_COMMIT_WINDOW = 0.002
+# Каталог файлов межпроцессных блокировок (fcntl.flock)
+LOCK_DIR = 'data/locks'
+
+# Файл счетчиков версий данных (ETag ответов, общий для воркеров через mmap)
+VERSIONS_FILE = 'data/versions.bin'
+
+# События /api/events (Server-Sent Events)
+# Общий для воркеров файл публикуемых событий (проведенные розыгрыши)
+EVENTS_FILE = 'data/events.jsonl'
+# Размер файла событий, после которого он переименовывается в .1 (предыдущий
+# файл остается для переподключившихся клиентов с Last-Event-ID)
+EVENTS_FILE_MAX_BYTES = 1048576
+# Как часто брокер процесса проверяет файл событий и версии данных (сек.)
+EVENTS_POLL_INTERVAL = 0.5
+# Сколько неотправленных событий ждет клиента, прежде чем он будет отключен
+EVENTS_QUEUE_SIZE = 256
+# Интервал комментария-пинга в тихом потоке (сек.) и пауза переподключения клиента (мс)
+EVENTS_KEEPALIVE_INTERVAL = 15
+EVENTS_RETRY_MS = 3000
+# Сколько клиентов /api/events держит один воркер: каждый занимает поток
+# воркера (threads в gunicorn.conf.py), часть потоков остается обычным запросам
+EVENTS_MAX_SUBSCRIBERS = 24
+
+# Журнал изменений /api/admin/changes
+CHANGES_FILE = 'data/changes.jsonl'
+# Размер файла журнала, после которого он переименовывается в .1 (хранятся
+# текущий и предыдущий файл; более старые версии получают reset)
+CHANGES_FILE_MAX_BYTES = 4194304
+# Изменение большего числа билетов записывается списком их розыгрышей
+CHANGES_MAX_IDS = 1000
+# Наибольшее число записей в одном ответе /api/admin/changes
+CHANGES_PAGE_SIZE = 1000
+
+# Метрики /api/admin/metrics (текстовый формат Prometheus)
+# Каталог файлов значений метрик (у каждого процесса свой файл, отображенный в память)
+METRICS_DIR = 'data/metrics'
+# Границы корзин гистограммы длительности HTTP запросов (сек.)
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Границы корзин гистограммы длительности проведения розыгрыша (сек.)
+METRICS_SETTLEMENT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Профилирование запросов cProfile (utils/request_profiler.py)
+# Разрешить ?__profile=1 у любого маршрута
+PROFILE_ENABLED = False
+# Ключ для ?__profile=<ключ> (работает и при PROFILE_ENABLED = False; None - отключено)
+PROFILE_KEY = None
+# Доля запросов, профилируемых постоянно (0 - выборочное профилирование отключено)
+PROFILE_SAMPLE_RATE = 0.0
+# Обработчики, которые не профилируются выборочно (долгие потоковые соединения)
+PROFILE_SAMPLE_EXCLUDE = ('api.events', 'static')
+# Каталог файлов профилей и сколько последних профилей хранится
+PROFILE_DIR = 'data/profiles'
+PROFILE_MAX_FILES = 200
+# Число функций в отчете профиля и в заголовке X-Profile-Summary
+PROFILE_TOP_FUNCTIONS = 40
+PROFILE_HEADER_FUNCTIONS = 5
+
+# Последовательности ID записей
+SEQUENCES_FILE = 'data/sequences.json'
+# Сколько ID процесс резервирует за одно обращение к файлу последовательностей
+# (остаток блока при перезапуске пропускается). ID билетов выдаются не
+# отсюда, а под блокировкой записи билетов - по порядку записи, на нем
+# держатся курсоры страниц /api/tickets
+ID_BLOCK_SIZES = {
+    'draws': 1,
+    'packages': 1
+}
+
+# Параллельный расчет розыгрышей
+# Количество процессов расчета (0 - по числу ядер, 1 - без пула процессов)
+SETTLEMENT_WORKERS = 0
+# Розыгрыши с меньшим числом билетов считаются в текущем процессе (части - SETTLEMENT_JOB_CHUNK_SIZE)
+SETTLEMENT_PARALLEL_MIN_TICKETS = 200000
+
+# Фоновые задачи проведения розыгрышей
+# Каталог файлов задач (состояние и контрольные точки)
+JOBS_DIR = 'data/jobs'
+# Количество потоков выполнения задач в процессе
+SETTLEMENT_JOB_WORKERS = 1
+# Билетов в одной части; после каждой части сохраняется контрольная точка
+SETTLEMENT_JOB_CHUNK_SIZE = 50000
+
+# Максимум билетов в одной покупке /api/buy_tickets
+MAX_TICKETS_PER_PURCHASE = 1000
+
+# Постраничная выдача /api/tickets (с параметрами limit или cursor): размер
+# страницы по умолчанию и наибольший (билеты отдаются потоком, поэтому
+# большие выгрузки не собираются в памяти)
+TICKETS_PAGE_SIZE = 50
+TICKETS_PAGE_MAX_SIZE = 1000000
+# Сколько билетов читается из хранилища за раз при потоковой выдаче
+TICKETS_STREAM_BATCH = 1000
+# Сколько последних билетов каждого розыгрыша выводится на странице /tickets
+MY_TICKETS_GROUP_PREVIEW = 20
+# Размер части потокового JSON ответа (байт)
+JSON_STREAM_CHUNK_SIZE = 65536
+
 # Цены билетов
 TICKET_PRICES = {
     'big': 10,
@@ -39,11 +159,37 @@ PRIZE_TABLE = {
 }
 
 # Настройка логирования
+# Журналирование: строки JSON, запись в отдельном потоке через очередь
+# (utils/structured_logging.py)
+LOG_LEVEL = 'INFO'
+# Файл журнала (None - stderr)
+LOG_FILE = None
+# Сколько записей может ждать записи; при переполнении записи отбрасываются с подсчетом
+LOG_QUEUE_SIZE = 10000
+# Сколько записей ниже WARNING в секунду проходит с одного места вызова
+LOG_RATE_LIMIT = 10
+# Запас записей места вызова сверх частоты (всплеск после затишья)
+LOG_RATE_BURST = 50
+# Сверх ограничения проходит каждая N-я запись места вызова (0 - ни одной)
+LOG_SAMPLE_EVERY = 1000
+# Частота для логгеров по префиксу имени (None - без ограничения)
+LOG_LOGGER_RATE_LIMITS = {
+    'werkzeug': None,
+    'models.data_manager': 5,
+    'utils.helpers': 5
+}
+
 def setup_logging():
     """Настройка системы логирования"""
-    logging.basicConfig(
-        level=logging.INFO, 
-        format='%(asctime)s - %(levelname)s - %(message)s'
+    from utils.structured_logging import configure_logging
+    configure_logging(
+        level=LOG_LEVEL,
+        log_file=LOG_FILE,
+        queue_size=LOG_QUEUE_SIZE,
+        rate=LOG_RATE_LIMIT,
+        burst=LOG_RATE_BURST,
+        sample_every=LOG_SAMPLE_EVERY,
+        logger_rates=LOG_LOGGER_RATE_LIMITS
     )
     return logging.getLogger(__name__)
 
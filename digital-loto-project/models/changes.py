@@ -0,0 +1,117 @@
+"""
+Журнал изменений записей для /api/admin/changes
+
+Каждая запись розыгрышей, пакетов, билетов и баланса добавляет в общий
+журнал CHANGES_FILE (models/sequenced_log.py) строку с номером - версией
+изменения, которая растет через все процессы:
+
+    {"id": 42, "entity": "tickets", "op": "upsert", "ids": [101, 102], "time": ...}
+
+Клиент хранит версию последней синхронизации и запрашивает только
+изменения после нее. Журнал хранит ID, а не сами записи: ответ собирается
+из текущих записей хранилища, и отсутствующая запись означает удаление.
+Пересчет розыгрыша меняет все его билеты, поэтому изменение больше
+CHANGES_MAX_IDS билетов записывается списком розыгрышей (draw_ids) -
+билеты этих розыгрышей клиент перечитывает целиком.
+
+Хранится от CHANGES_FILE_MAX_BYTES до двух таких объемов последних
+изменений. Если версия клиента старше хранящихся изменений, ответ
+содержит reset: клиент перечитывает все данные и продолжает с новой
+версии.
+"""
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+from models.sequenced_log import SequencedLog
+from config import CHANGES_FILE, CHANGES_FILE_MAX_BYTES, CHANGES_MAX_IDS
+
+logger = logging.getLogger(__name__)
+
+# Записи, изменения которых попадают в журнал
+ENTITIES = ('draws', 'packages', 'tickets', 'balance')
+
+
+class ChangeLog:
+    """Журнал изменений записей с глобальной версией"""
+
+    def __init__(self, changes_file: str = CHANGES_FILE):
+        self.log = SequencedLog(changes_file, 'changes', CHANGES_FILE_MAX_BYTES)
+
+    def record(self, entity: str, op: str, ids: Iterable[int] = (),
+               draw_ids: Iterable[int] = ()) -> Optional[int]:
+        """Записать изменение после записи данных; возвращает его версию
+
+        Если ID больше CHANGES_MAX_IDS и известны розыгрыши (для билетов),
+        вместо ID записываются розыгрыши.
+        """
+        try:
+            change = {'entity': entity, 'op': op, 'time': datetime.now().isoformat()}
+            ids = list(ids)
+            draw_ids = sorted(set(draw_ids))
+            if draw_ids and len(ids) > CHANGES_MAX_IDS:
+                change['draw_ids'] = draw_ids
+            elif ids:
+                change['ids'] = ids
+            return self.log.append([change])[0]['id']
+        except Exception as e:
+            # Данные уже записаны; клиенты увидят их при следующем reset
+            logger.error(f"Ошибка записи в журнал изменений {entity}: {e}")
+            return None
+
+    def version(self) -> int:
+        """Версия последнего изменения (0 - журнал пуст)"""
+        return self.log.last_id()
+
+    def collect(self, since: int, max_records: int) -> Dict:
+        """Изменения после версии since, сведенные по записям
+
+        Возвращает version (до какой версии собраны изменения), reset
+        (since старше хранящихся изменений), has_more, ids - {entity:
+        множество ID}, ticket_draws - розыгрыши с перечитываемыми билетами
+        и balance - менялся ли баланс. Собирается не больше max_records ID
+        (но не меньше одного изменения).
+        """
+        last = self.version()
+        first = self.log.first_id()
+        if since > last or (first is not None and since < first - 1) or (first is None and since > 0):
+            return {'version': last, 'reset': True}
+
+        collected = {
+            'version': since,
+            'reset': False,
+            'has_more': False,
+            'ids': {entity: set() for entity in ENTITIES if entity != 'balance'},
+            'ticket_draws': set(),
+            'balance': False
+        }
+        records = 0
+        for change in self.log.read_since(since, limit=max_records):
+            size = len(change.get('ids', ())) + len(change.get('draw_ids', ()))
+            if records and records + size > max_records:
+                collected['has_more'] = True
+                break
+            records += size
+            collected['version'] = change['id']
+            entity = change.get('entity')
+            if entity == 'balance':
+                collected['balance'] = True
+            elif entity in collected['ids']:
+                collected['ids'][entity].update(change.get('ids', ()))
+                if entity == 'tickets':
+                    collected['ticket_draws'].update(change.get('draw_ids', ()))
+        collected['has_more'] = collected['has_more'] or collected['version'] < last
+        return collected
+
+
+_change_log: Optional[ChangeLog] = None
+_change_log_lock = threading.Lock()
+
+
+def get_change_log() -> ChangeLog:
+    """Общий для процесса журнал изменений"""
+    global _change_log
+    with _change_log_lock:
+        if _change_log is None:
+            _change_log = ChangeLog()
+        return _change_log
@@ -1,30 +1,299 @@
 """
 Модуль для работы с JSON данными
 """
+import fcntl
 import json
 import os
 import logging
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
-from typing import Dict, List, Union, Optional
-from config import JSON_FILES, DEFAULT_BALANCE
+from typing import Any, Callable, Dict, List, Union, Optional, Tuple
+from models.versions import get_versions
+from models.metrics import get_metrics
+from config import (JSON_FILES, DEFAULT_BALANCE, FSYNC_WRITES, GROUP_COMMIT_WINDOW, LOCK_DIR,
+                    TICKETS_JOURNAL_FILE, SEQUENCES_FILE, BALANCE_JOURNAL_FILE, BALANCE_JOURNAL_MAX_BYTES)
 
 logger = logging.getLogger(__name__)
 
+
+def _read_only(*args, **kwargs):
+    raise TypeError("Данные кэша load_json только для чтения: для изменения загрузите копию (copy=True)")
+
+
+class ReadOnlyDict(dict):
+    """Словарь кэша load_json: методы изменения запрещены
+
+    Наследует dict, поэтому сериализуется json и читается шаблонами как
+    обычный словарь; copy.copy, deepcopy и pickle дают изменяемую копию.
+    """
+
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return dict, (_copy_json(self),)
+
+
+class ReadOnlyList(list):
+    """Список кэша load_json: методы изменения запрещены (см. ReadOnlyDict)"""
+
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+    def __reduce__(self):
+        return list, (_copy_json(self),)
+
+
+def _freeze_json(data: Any) -> Any:
+    """Представление JSON-данных только для чтения (для кэша load_json)"""
+    if isinstance(data, dict):
+        return ReadOnlyDict((key, _freeze_json(value)) for key, value in data.items())
+    if isinstance(data, list):
+        return ReadOnlyList(_freeze_json(item) for item in data)
+    return data
+
+
+def _copy_json(data: Any) -> Any:
+    """Структурная копия JSON-данных (строки и числа неизменяемы и не копируются)"""
+    if isinstance(data, dict):
+        return {key: _copy_json(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [_copy_json(item) for item in data]
+    return data
+
+
+def _fsync_dir(directory: str):
+    """fsync каталога, чтобы переименование файла пережило сбой питания"""
+    _fsync_path(directory)
+
+
+def _fsync_path(path: str):
+    """fsync файла или каталога по пути (ошибки пропускаются)"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# ========= УЧЕТ ВВОДА-ВЫВОДА =========
+
+# Файлы, которые учитываются по имени; остальные - по каталогу и расширению
+# (data/jobs/*.json), чтобы число меток метрик не росло с числом файлов
+_IO_FILES = {os.path.normpath(path) for path in (*JSON_FILES.values(), TICKETS_JOURNAL_FILE, SEQUENCES_FILE,
+                                                 BALANCE_JOURNAL_FILE)}
+
+
+def io_label(filename: str) -> str:
+    """Метка файла в метриках ввода-вывода"""
+    path = os.path.normpath(filename)
+    if path in _IO_FILES:
+        return path
+    directory = os.path.dirname(path) or '.'
+    return f"{directory}/*{os.path.splitext(path)[1]}"
+
+
+class IOScope:
+    """Загрузки и чтения файлов за время одного запроса (по меткам файлов)"""
+
+    def __init__(self):
+        self.loads: Dict[str, int] = defaultdict(int)
+        self.reads: Dict[str, int] = defaultdict(int)
+
+
+# Учет ввода-вывода запроса, обрабатываемого текущим потоком
+_io_state = threading.local()
+
+
+# Блокировки, удерживаемые текущим потоком: ресурс -> [fd, исключительная, глубина]
+_lock_state = threading.local()
+
+
+def _held_locks() -> Dict[str, list]:
+    held = getattr(_lock_state, 'held', None)
+    if held is None:
+        held = _lock_state.held = {}
+    return held
+
+
+# Ключ пакета отложенных fsync транзакций (не совпадает с именами файлов)
+SYNC_BATCH_KEY = '\0fsync'
+
+
+class _CommitBatch:
+    """Пакет записей одного файла, ожидающих общей фиксации"""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.done = threading.Event()
+        self.result = False
+
+
+class GroupCommit:
+    """Групповая фиксация записей
+    
+    Первый писатель файла становится лидером: ждет GROUP_COMMIT_WINDOW,
+    забирает все накопившиеся за это время записи и выполняет их одним
+    flush (одна запись и один fsync). Остальные писатели ждут результат.
+    
+    Внутри транзакции (исключительная блокировка) соседей по пакету у
+    записи быть не может, поэтому она выполняется сразу, но без fsync:
+    файлы запоминаются и синхронизируются после снятия последней
+    исключительной блокировки потока (sync). fsync файлов объединяется
+    тем же способом: покупки, которые друг за другом проходят через
+    транзакцию, платят за один общий fsync на пакет.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending: Dict[str, _CommitBatch] = {}
+        self._flush_locks: Dict[str, threading.Lock] = {}
+
+    def submit(self, key: str, item: Any, flush: Callable[[List[Any]], bool]) -> bool:
+        """Добавить запись в пакет и дождаться его фиксации"""
+        if self.window <= 0:
+            return flush([item])
+
+        if DataManager.in_transaction():
+            # Внутри транзакции соседей по пакету быть не может, ожидание
+            # окна только удлинило бы удержание блокировки; fsync отложен
+            # до снятия блокировок (sync)
+            with self._lock:
+                flush_lock = self._flush_locks.setdefault(key, threading.Lock())
+            with flush_lock:
+                return flush([item])
+
+        with self._lock:
+            batch = self._pending.get(key)
+            is_leader = batch is None
+            if is_leader:
+                batch = _CommitBatch()
+                self._pending[key] = batch
+            batch.items.append(item)
+            flush_lock = self._flush_locks.setdefault(key, threading.Lock())
+
+        if not is_leader:
+            batch.done.wait()
+            return batch.result
+
+        time.sleep(self.window)
+        # Блокировка берется до закрытия пакета, поэтому следующие пакеты
+        # этого файла фиксируются строго после текущего
+        with flush_lock:
+            with self._lock:
+                self._pending.pop(key, None)
+            try:
+                batch.result = flush(batch.items)
+            except Exception as e:
+                logger.error(f"Ошибка групповой фиксации {key}: {e}")
+                batch.result = False
+            finally:
+                batch.done.set()
+        return batch.result
+
+
+    def sync(self, paths: Dict[str, str]) -> bool:
+        """fsync файлов и каталогов, измененных транзакцией, общим пакетом
+        
+        paths - {путь: имя файла для метрик}. Пути, накопленные за окно
+        группировки всеми потоками, синхронизируются по одному разу: записи
+        всех участников пакета сделаны до входа в пакет, поэтому общий fsync
+        их покрывает.
+        """
+        def flush(batches: List[Dict[str, str]]) -> bool:
+            metrics = get_metrics()
+            for path, filename in sorted({path: filename for batch in batches for path, filename in batch.items()}.items()):
+                started = time.perf_counter()
+                _fsync_path(path)
+                metrics.inc('loto_storage_fsync_seconds_total', time.perf_counter() - started, file=io_label(filename))
+            return True
+        return self.submit(SYNC_BATCH_KEY, paths, flush)
+
+
+_group_commit = GroupCommit(GROUP_COMMIT_WINDOW)
+
+
 class DataManager:
     """Класс для управления JSON файлами"""
     
+    # Кэш разобранных файлов: имя файла -> ((inode, mtime_ns, size), данные)
+    _cache: Dict[str, Tuple[Tuple[int, int, int], Any]] = {}
+    _cache_lock = threading.Lock()
+    _cache_hits = 0
+    _cache_misses = 0
+    
     @staticmethod
-    def load_json(filename: str) -> Union[Dict, List]:
-        """Загрузка данных из JSON файла"""
+    def _file_signature(filename: str) -> Tuple[int, int, int]:
+        """Сигнатура файла для проверки актуальности кэша"""
+        st = os.stat(filename)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    
+    @staticmethod
+    def load_json(filename: str, copy: bool = False) -> Union[Dict, List]:
+        """Загрузка данных из JSON файла
+        
+        Разобранные данные кэшируются в памяти процесса и перечитываются
+        только при изменении (inode, mtime_ns, size) файла. По умолчанию
+        возвращается общий объект кэша в виде ReadOnlyDict/ReadOnlyList:
+        попытка изменить его вызывает TypeError, поэтому вызывающий код не
+        может испортить кэш для других. Код, который меняет загруженные
+        данные, передает copy=True и получает собственную копию: при
+        попадании в кэш - копию кэша, при чтении с диска - разобранные данные
+        без помещения в кэш (копия не нужна).
+        Каждый вызов учитывается в метриках ввода-вывода файла и текущего
+        запроса (IOScope).
+        """
+        label = io_label(filename)
+        metrics = get_metrics()
+        metrics.inc('loto_storage_loads_total', file=label)
+        scope = getattr(_io_state, 'scope', None)
+        if scope is not None:
+            scope.loads[label] += 1
         try:
-            if not os.path.exists(filename):
+            try:
+                signature = DataManager._file_signature(filename)
+            except FileNotFoundError:
                 logger.warning(f"Файл {filename} не существует, возвращаем пустую структуру")
                 return {}
             
-            with open(filename, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                logger.info(f"Успешно загружены данные из {filename}")
-                return data
+            with DataManager._cache_lock:
+                cached = DataManager._cache.get(filename)
+                if cached is not None and cached[0] == signature:
+                    DataManager._cache_hits += 1
+                    logger.debug(f"Данные {filename} взяты из кэша")
+                    return _copy_json(cached[1]) if copy else cached[1]
+            
+            with open(filename, 'rb') as f:
+                raw = f.read()
+            started = time.perf_counter()
+            data = json.loads(raw)
+            metrics.inc('loto_storage_parse_seconds_total', time.perf_counter() - started, file=label)
+            metrics.inc('loto_storage_reads_total', file=label)
+            metrics.inc('loto_storage_read_bytes_total', len(raw), file=label)
+            if scope is not None:
+                scope.reads[label] += 1
+            
+            if not copy:
+                data = _freeze_json(data)
+            with DataManager._cache_lock:
+                DataManager._cache_misses += 1
+                if not copy:
+                    DataManager._cache[filename] = (signature, data)
+            
+            logger.debug(f"Успешно загружены данные из {filename}")
+            return data
         except json.JSONDecodeError as e:
             logger.error(f"Ошибка декодирования JSON в {filename}: {e}")
             return {}
@@ -34,25 +303,382 @@ class DataManager:
 
     @staticmethod
     def save_json(filename: str, data: Union[Dict, List]) -> bool:
-        """Сохранение данных в JSON файл"""
+        """Сохранение данных в JSON файл
+        
+        Данные пишутся во временный файл, который затем атомарно
+        переименовывается в целевой, поэтому сбой посреди записи не оставляет
+        обрезанный файл. Одновременные сохранения одного файла объединяются
+        групповой фиксацией: на диск попадает последняя версия, один раз.
+        """
+        return _group_commit.submit(
+            filename, data, lambda versions: DataManager._write_json_atomic(filename, versions[-1])
+        )
+
+    @staticmethod
+    def _write_json_atomic(filename: str, data: Union[Dict, List]) -> bool:
+        """Атомарная запись JSON: временный файл, fsync, переименование"""
+        tmp_path = None
         try:
             # Создаем директорию если не существует
-            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            directory = os.path.dirname(filename) or '.'
+            os.makedirs(directory, exist_ok=True)
             
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-                logger.info(f"Данные успешно сохранены в {filename}")
-                return True
+            started = time.perf_counter()
+            payload = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+            serialize_seconds = time.perf_counter() - started
+            
+            fd, tmp_path = tempfile.mkstemp(
+                dir=directory, prefix=f".{os.path.basename(filename)}.", suffix='.tmp'
+            )
+            fsync_seconds = 0.0
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+                f.flush()
+                if FSYNC_WRITES:
+                    started = time.perf_counter()
+                    os.fsync(f.fileno())
+                    fsync_seconds += time.perf_counter() - started
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, filename)
+            tmp_path = None
+            # Данные уже на диске до переименования; fsync каталога внутри
+            # транзакции откладывается до снятия блокировок
+            if FSYNC_WRITES and not DataManager._defer_fsync(directory, filename):
+                started = time.perf_counter()
+                _fsync_dir(directory)
+                fsync_seconds += time.perf_counter() - started
+            DataManager._record_write(filename, 'replace', len(payload), serialize_seconds, fsync_seconds)
+            
+            # Файл читают через кэш - сразу кладем туда сохраненные данные,
+            # чтобы не перечитывать файл
+            DataManager._cache_store(filename, data)
+            get_versions().bump_file(filename)
+            logger.info(f"Данные успешно сохранены в {filename}")
+            return True
         except Exception as e:
             logger.error(f"Ошибка сохранения файла {filename}: {e}")
             return False
+        finally:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    @staticmethod
+    def load_journal_tail(filename: str, tail_bytes: int = 4096) -> Optional[Dict]:
+        """Последняя полная запись журнала JSONL (None - журнала нет или он пуст)
+        
+        Читается только хвост файла; недописанная или поврежденная последняя
+        строка пропускается, и берется предыдущая.
+        """
+        try:
+            with open(filename, 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                f.seek(max(0, size - tail_bytes))
+                chunk = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.error(f"Ошибка чтения журнала {filename}: {e}")
+            return None
+        label = io_label(filename)
+        get_metrics().inc('loto_storage_reads_total', file=label)
+        get_metrics().inc('loto_storage_read_bytes_total', len(chunk), file=label)
+        
+        lines = chunk[:chunk.rfind(b'\n') + 1].splitlines()
+        if size > tail_bytes:
+            # Первая строка хвоста может быть неполной
+            lines = lines[1:]
+        for line in reversed(lines):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                return record
+        return None
+
+    @staticmethod
+    def load_balance() -> Optional[float]:
+        """Баланс: последняя запись журнала баланса, иначе снимок balance.json
+        
+        None - баланс не сохранен или файл не прочитан.
+        """
+        record = DataManager.load_journal_tail(BALANCE_JOURNAL_FILE)
+        if record is None:
+            record = DataManager.load_json(JSON_FILES['balance'])
+        return record.get('balance') if isinstance(record, dict) else None
+
+    @staticmethod
+    def save_balance(balance: float) -> bool:
+        """Сохранить баланс дозаписью строки в журнал баланса
+        
+        Списание при покупке - это дозапись, а не перезапись balance.json:
+        внутри транзакции покупки она не ждет fsync, и fsync журнала
+        выполняется общим пакетом для покупок, прошедших транзакцию друг за
+        другом (GroupCommit.sync). Журнал больше BALANCE_JOURNAL_MAX_BYTES
+        сворачивается в balance.json.
+        """
+        with DataManager.transaction('balance'):
+            if not DataManager.append_text(BALANCE_JOURNAL_FILE, json.dumps({'balance': balance}) + '\n'):
+                return False
+            try:
+                size = os.path.getsize(BALANCE_JOURNAL_FILE)
+            except OSError:
+                return True
+            if size >= BALANCE_JOURNAL_MAX_BYTES:
+                DataManager._compact_balance(balance)
+            return True
+
+    @staticmethod
+    def _compact_balance(balance: float):
+        """Свернуть журнал баланса: снимок balance.json с текущим балансом, затем обрезка журнала
+        
+        Последняя строка журнала уже содержит balance, поэтому сбой между
+        шагами не меняет прочитанный баланс. Переименование снимка
+        синхронизируется до обрезки журнала.
+        """
+        if not DataManager.save_json(JSON_FILES['balance'], {'balance': balance}):
+            return
+        if FSYNC_WRITES:
+            _fsync_dir(os.path.dirname(JSON_FILES['balance']) or '.')
+        try:
+            os.truncate(BALANCE_JOURNAL_FILE, 0)
+            logger.info("Журнал баланса свернут в снимок")
+        except OSError as e:
+            logger.error(f"Ошибка сворачивания журнала баланса: {e}")
+
+    @staticmethod
+    def append_text(filename: str, text: str) -> bool:
+        """Дозапись текста в конец файла с групповой фиксацией
+        
+        Дозаписи, пришедшие за окно группировки, склеиваются в один вызов
+        write и один fsync.
+        """
+        return _group_commit.submit(
+            filename, text, lambda chunks: DataManager._append_durable(filename, ''.join(chunks))
+        )
+
+    @staticmethod
+    def _append_durable(filename: str, text: str) -> bool:
+        """Один вызов write в режиме O_APPEND и fsync (в транзакции - отложенный)
+        
+        Если файл кончается не переводом строки (запись упавшего процесса
+        оборвалась), новые строки начинаются с новой строки: оборванная
+        пропускается при чтении и не портит следующую за ней запись.
+        """
+        try:
+            os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+            payload = text.encode('utf-8')
+            fsync_seconds = 0.0
+            fd = os.open(filename, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                size = os.fstat(fd).st_size
+                if size and os.pread(fd, 1, size - 1) != b'\n':
+                    payload = b'\n' + payload
+                os.write(fd, payload)
+                if FSYNC_WRITES and not DataManager._defer_fsync(filename, filename):
+                    started = time.perf_counter()
+                    os.fsync(fd)
+                    fsync_seconds = time.perf_counter() - started
+            finally:
+                os.close(fd)
+            DataManager._record_write(filename, 'append', len(payload), 0.0, fsync_seconds)
+            get_versions().bump_file(filename)
+            return True
+        except OSError as e:
+            logger.error(f"Ошибка дозаписи в файл {filename}: {e}")
+            return False
+
+    @staticmethod
+    def _record_write(filename: str, mode: str, size: int, serialize_seconds: float, fsync_seconds: float):
+        """Учесть запись файла (mode: replace - замена целиком, append - дозапись)"""
+        label = io_label(filename)
+        metrics = get_metrics()
+        metrics.inc('loto_storage_writes_total', file=label, mode=mode)
+        metrics.inc('loto_storage_written_bytes_total', size, file=label)
+        if serialize_seconds:
+            metrics.inc('loto_storage_serialize_seconds_total', serialize_seconds, file=label)
+        if fsync_seconds:
+            metrics.inc('loto_storage_fsync_seconds_total', fsync_seconds, file=label)
+
+    @staticmethod
+    def _cache_store(filename: str, data: Union[Dict, List]):
+        """Обновить данные файла в кэше, если он там есть (с текущей сигнатурой)
+        
+        Сохраненные данные остаются у вызывающего кода, поэтому в кэш
+        кладется копия только для чтения (как при загрузке). Файлы, которые читают только с copy=True (билеты,
+        репозитории), в кэш не попадают и при записи не копируются.
+        """
+        with DataManager._cache_lock:
+            if filename not in DataManager._cache:
+                return
+        try:
+            signature = DataManager._file_signature(filename)
+        except OSError:
+            DataManager.invalidate_cache(filename)
+            return
+        snapshot = _freeze_json(data)
+        with DataManager._cache_lock:
+            DataManager._cache[filename] = (signature, snapshot)
+
+    @staticmethod
+    def invalidate_cache(filename: Optional[str] = None):
+        """Сбросить кэш для файла или целиком"""
+        with DataManager._cache_lock:
+            if filename is None:
+                DataManager._cache.clear()
+            else:
+                DataManager._cache.pop(filename, None)
+
+    @staticmethod
+    def cache_stats() -> Dict:
+        """Статистика кэша: попадания, промахи и количество файлов"""
+        with DataManager._cache_lock:
+            return {
+                'hits': DataManager._cache_hits,
+                'misses': DataManager._cache_misses,
+                'entries': len(DataManager._cache)
+            }
+
+    @staticmethod
+    def start_io_scope() -> IOScope:
+        """Начать учет загрузок файлов запроса в текущем потоке"""
+        scope = _io_state.scope = IOScope()
+        return scope
+
+    @staticmethod
+    def end_io_scope(scope: IOScope):
+        """Закончить учет запроса (если поток еще не начал учет следующего)"""
+        if getattr(_io_state, 'scope', None) is scope:
+            _io_state.scope = None
+
+    @staticmethod
+    def io_stats() -> Dict:
+        """Ввод-вывод файлов всех процессов по меткам файлов и загрузки по обработчикам запросов"""
+        fields = {
+            'loto_storage_loads_total': 'loads',
+            'loto_storage_reads_total': 'reads',
+            'loto_storage_read_bytes_total': 'read_bytes',
+            'loto_storage_parse_seconds_total': 'parse_seconds',
+            'loto_storage_writes_total': 'writes',
+            'loto_storage_written_bytes_total': 'written_bytes',
+            'loto_storage_serialize_seconds_total': 'serialize_seconds',
+            'loto_storage_fsync_seconds_total': 'fsync_seconds'
+        }
+        files: Dict[str, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(fields.values(), 0))
+        endpoints: Dict[str, Dict] = defaultdict(lambda: {'requests': 0, 'loads': 0, 'files': defaultdict(int)})
+        for (metric, labels), value in get_metrics().collect().items():
+            labels = dict(labels)
+            if metric in fields:
+                files[labels['file']][fields[metric]] += value
+            elif metric == 'loto_storage_request_loads_total':
+                endpoint = endpoints[labels['endpoint']]
+                endpoint['loads'] += value
+                endpoint['files'][labels['file']] += value
+            elif metric == 'loto_http_requests_total':
+                endpoints[labels['endpoint']]['requests'] += value
+        
+        # Значения метрик - double; количества и байты выдаются целыми
+        for stats in files.values():
+            for field, value in stats.items():
+                stats[field] = round(value, 6) if field.endswith('_seconds') else int(value)
+        for endpoint in endpoints.values():
+            requests = endpoint['requests'] = int(endpoint['requests'])
+            endpoint['loads'] = int(endpoint['loads'])
+            endpoint['files'] = {label: int(loads) for label, loads in sorted(endpoint['files'].items())}
+            endpoint['loads_per_request'] = round(endpoint['loads'] / requests, 2) if requests else None
+        return {
+            'files': dict(sorted(files.items())),
+            'endpoints': dict(sorted(endpoints.items(), key=lambda item: -item[1]['loads'])),
+            'cache': DataManager.cache_stats()
+        }
+
+    @staticmethod
+    @contextmanager
+    def lock(resource: str, shared: bool = False, blocking: bool = True):
+        """Межпроцессная блокировка ресурса (fcntl.flock на файле в LOCK_DIR)
+        
+        Работает и между потоками одного процесса: каждый захват открывает
+        свой дескриптор. Повторный захват тем же потоком не блокирует;
+        повысить разделяемую блокировку до исключительной нельзя. С
+        blocking=False занятая блокировка вызывает BlockingIOError. После
+        снятия последней исключительной блокировки потока выполняются
+        отложенные внутри нее fsync (GroupCommit.sync).
+        """
+        held = _held_locks()
+        entry = held.get(resource)
+        if entry is not None:
+            if not shared and not entry[1]:
+                raise RuntimeError(f"Нельзя повысить разделяемую блокировку {resource} до исключительной")
+            entry[2] += 1
+            try:
+                yield
+            finally:
+                entry[2] -= 1
+            return
+
+        os.makedirs(LOCK_DIR, exist_ok=True)
+        fd = os.open(os.path.join(LOCK_DIR, f"{resource}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            fcntl.flock(fd, flags if blocking else flags | fcntl.LOCK_NB)
+            held[resource] = [fd, not shared, 1]
+            try:
+                yield
+            finally:
+                del held[resource]
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+            if not shared and not DataManager.in_transaction():
+                DataManager._sync_deferred()
+
+    @staticmethod
+    @contextmanager
+    def transaction(*resources: str):
+        """Исключительные блокировки ресурсов на время чтения-изменения-записи
+        
+        Ресурсы захватываются в отсортированном порядке, поэтому все
+        нужные ресурсы следует перечислять во внешней транзакции.
+        """
+        with ExitStack() as stack:
+            for resource in sorted(set(resources)):
+                stack.enter_context(DataManager.lock(resource))
+            yield
+
+    @staticmethod
+    def _defer_fsync(path: str, filename: str) -> bool:
+        """Отложить fsync пути до снятия исключительных блокировок потока
+        
+        filename - файл, к которому относится fsync в метриках (для
+        каталога - переименованный файл). Возвращает False вне транзакции:
+        тогда fsync выполняет вызывающий.
+        """
+        if not DataManager.in_transaction():
+            return False
+        deferred = getattr(_lock_state, 'deferred', None)
+        if deferred is None:
+            deferred = _lock_state.deferred = {}
+        deferred[path] = filename
+        return True
+
+    @staticmethod
+    def _sync_deferred():
+        """Выполнить отложенные транзакцией fsync общим пакетом (после снятия блокировок)
+        
+        Изменения транзакции уже видны другим процессам, а вызывающий код
+        получает результат только после fsync.
+        """
+        deferred = getattr(_lock_state, 'deferred', None)
+        if not deferred:
+            return
+        _lock_state.deferred = None
+        if not _group_commit.sync(deferred):
+            logger.error(f"Ошибка отложенного fsync: {', '.join(sorted(deferred))}")
 
     @staticmethod
-    def get_next_id(data_list: List[Dict]) -> int:
-        """Получить следующий доступный ID"""
-        if not data_list:
-            return 1
-        return max(item.get('id', 0) for item in data_list) + 1
+    def in_transaction() -> bool:
+        """Удерживает ли текущий поток исключительную блокировку"""
+        return any(entry[1] for entry in _held_locks().values())
 
     @staticmethod
     def init_data_files():
@@ -125,17 +751,19 @@ class DataManager:
     @staticmethod
     def _init_balance_file():
         """Инициализация файла баланса"""
-        if not os.path.exists(JSON_FILES['balance']):
+        if not os.path.exists(JSON_FILES['balance']) and not os.path.exists(BALANCE_JOURNAL_FILE):
             initial_balance = {"balance": DEFAULT_BALANCE}
             DataManager.save_json(JSON_FILES['balance'], initial_balance)
             logger.info(f"Инициализирован баланс пользователя: {DEFAULT_BALANCE}")
         else:
             # Проверяем текущий баланс и устанавливаем минимальный если он 0
-            current_balance_data = DataManager.load_json(JSON_FILES['balance'])
-            current_balance = current_balance_data.get('balance', 0) if isinstance(current_balance_data, dict) else 0
+            current_balance = DataManager.load_balance()
+            if current_balance is None:
+                # Файл не прочитан: не затираем баланс значением по умолчанию
+                logger.error(f"Не удалось прочитать баланс из {JSON_FILES['balance']}, файл оставлен без изменений")
+                return
             if current_balance <= 0:
-                initial_balance = {"balance": DEFAULT_BALANCE}
-                DataManager.save_json(JSON_FILES['balance'], initial_balance)
+                DataManager.save_balance(DEFAULT_BALANCE)
                 logger.info(f"Баланс был 0, установлен начальный баланс: {DEFAULT_BALANCE}")
 
     @staticmethod
@@ -0,0 +1,271 @@
+"""
+События для /api/events (Server-Sent Events)
+
+Клиенты держат одно соединение вместо опроса. Каждый процесс (воркер
+gunicorn) держит одного брокера EventBroker с потоком, который раздает
+события в очереди своих подписчиков. Источники событий:
+
+- публикуемые события (проведенный розыгрыш) - общий журнал EVENTS_FILE
+  (models/sequenced_log.py), номера которого растут через все процессы.
+  Брокер каждого процесса дочитывает хвост файла, так что событие из
+  любого воркера доходит до всех клиентов. По номеру (Last-Event-ID)
+  переподключившийся клиент получает пропущенные события из текущего и
+  предыдущего файла журнала;
+- отслеживаемые значения (баланс, статистика) - брокер следит за версиями
+  частей данных (models/versions.py), и после изменения версий заново
+  читает значение и рассылает его вместе с изменениями числовых полей
+  (changes). Эти события без номера: при подключении клиент сразу
+  получает текущие значения.
+
+Поток ответа занимает поток воркера на все время соединения, поэтому
+gunicorn запускается с потоковыми воркерами (gunicorn.conf.py в корне
+проекта: worker_class = 'gthread'), а подписчиков в воркере не больше
+EVENTS_MAX_SUBSCRIBERS - остальные потоки остаются обычным запросам.
+"""
+import json
+import os
+import queue
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from models.sequenced_log import SequencedLog, parse_record
+from models.versions import get_versions
+from config import (EVENTS_FILE, EVENTS_FILE_MAX_BYTES, EVENTS_POLL_INTERVAL, EVENTS_QUEUE_SIZE,
+                    EVENTS_MAX_SUBSCRIBERS)
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """Очередь событий одного клиента"""
+
+    def __init__(self):
+        self.events: queue.Queue = queue.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        # Очередь переполнилась (клиент не успевает читать) - соединение закрывается
+        self.lost = False
+
+
+class _Watch:
+    """Отслеживаемое значение: событие event_type при изменении версий partitions"""
+
+    def __init__(self, event_type: str, partitions: Tuple[str, ...], snapshot: Callable[[], Dict]):
+        self.event_type = event_type
+        self.partitions = partitions
+        self.snapshot = snapshot
+        self.versions: Optional[Tuple[int, ...]] = None
+        self.value: Optional[Dict] = None
+
+
+class EventBroker:
+    """Раздача событий подписчикам процесса"""
+
+    def __init__(self, events_file: str = EVENTS_FILE, max_subscribers: int = EVENTS_MAX_SUBSCRIBERS):
+        self.events_file = events_file
+        self.max_subscribers = max_subscribers
+        self.log = SequencedLog(events_file, 'events', EVENTS_FILE_MAX_BYTES)
+        self._lock = threading.Lock()
+        self._subscribers: Set[Subscriber] = set()
+        self._watches: List[_Watch] = []
+        self._thread: Optional[threading.Thread] = None
+        # Дочитываемый файл событий: дескриптор, inode и смещение
+        self._fd: Optional[int] = None
+        self._inode: Optional[int] = None
+        self._offset = 0
+
+    # ========= ПУБЛИКАЦИЯ =========
+
+    def publish(self, event_type: str, data: Dict) -> Optional[Dict]:
+        """Записать событие в общий файл (дойдет до подписчиков всех процессов)"""
+        try:
+            event = self.log.append([{
+                'type': event_type,
+                'time': datetime.now().isoformat(),
+                'data': data
+            }])[0]
+            logger.info(f"Опубликовано событие {event_type} #{event['id']}")
+            return event
+        except Exception as e:
+            logger.error(f"Ошибка публикации события {event_type}: {e}")
+            return None
+
+    def watch(self, event_type: str, partitions: Tuple[str, ...], snapshot: Callable[[], Dict]):
+        """Рассылать snapshot() событием event_type после изменения версий partitions"""
+        with self._lock:
+            self._watches.append(_Watch(event_type, tuple(partitions), snapshot))
+
+    # ========= ПОДПИСКА =========
+
+    def subscribe(self) -> Optional[Subscriber]:
+        """Новый подписчик (None - в процессе уже max_subscribers подписчиков);
+        поток брокера запускается с первым подписчиком"""
+        subscriber = Subscriber()
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._open_tail()
+                for item in self._watches:
+                    item.versions = None
+                self._thread = threading.Thread(target=self._run, name='event-broker', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def current(self) -> List[Dict]:
+        """Текущие значения отслеживаемых событий (отправляются при подключении)"""
+        events = []
+        for item in list(self._watches):
+            try:
+                events.append({'type': item.event_type, 'data': {**item.snapshot(), 'changes': {}}})
+            except Exception as e:
+                logger.error(f"Ошибка чтения значения события {item.event_type}: {e}")
+        return events
+
+    def replay(self, last_id: int) -> List[Dict]:
+        """Опубликованные события с номером больше last_id (из текущего и предыдущего файла)"""
+        return self.log.read_since(last_id)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def has_capacity(self) -> bool:
+        """Есть ли место для нового подписчика"""
+        return self.subscriber_count() < self.max_subscribers
+
+    # ========= ПОТОК БРОКЕРА =========
+
+    def _run(self):
+        """Раздавать события, пока есть подписчики"""
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    self._close_tail()
+                    return
+            try:
+                for event in self._read_tail():
+                    self._dispatch(event)
+                for event in self._changed_values():
+                    self._dispatch(event)
+            except Exception as e:
+                logger.error(f"Ошибка раздачи событий: {e}")
+            time.sleep(EVENTS_POLL_INTERVAL)
+
+    def _dispatch(self, event: Dict):
+        """Положить событие в очереди подписчиков; переполненные отключаются"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.events.put_nowait(event)
+            except queue.Full:
+                subscriber.lost = True
+                self.unsubscribe(subscriber)
+                logger.warning("Подписчик событий не успевает читать и отключен")
+
+    def _changed_values(self) -> List[Dict]:
+        """События отслеживаемых значений, версии которых изменились"""
+        events = []
+        versions = get_versions()
+        for item in list(self._watches):
+            current = versions.get(*item.partitions)
+            if current == item.versions:
+                continue
+            # Версии читаются до значения: изменение во время чтения даст еще одно событие
+            first = item.versions is None
+            item.versions = current
+            value = item.snapshot()
+            previous, item.value = item.value, value
+            if first or previous == value:
+                continue
+            events.append({'type': item.event_type, 'data': {**value, 'changes': _changes(previous, value)}})
+        return events
+
+    # ========= ФАЙЛ СОБЫТИЙ =========
+
+    def _open_tail(self):
+        """Начать дочитывание файла событий с его текущего конца"""
+        self._close_tail()
+        try:
+            self._fd = os.open(self.events_file, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        stat = os.fstat(self._fd)
+        self._inode, self._offset = stat.st_ino, stat.st_size
+
+    def _close_tail(self):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd, self._inode, self._offset = None, None, 0
+
+    def _read_tail(self) -> List[Dict]:
+        """Новые события файла; после ротации дочитывается старый файл и открывается новый"""
+        events = []
+        if self._fd is not None:
+            events.extend(self._read_new_lines())
+        try:
+            inode = os.stat(self.events_file).st_ino
+        except FileNotFoundError:
+            return events
+        if inode != self._inode:
+            self._close_tail()
+            self._fd = os.open(self.events_file, os.O_RDONLY)
+            self._inode = os.fstat(self._fd).st_ino
+            events.extend(self._read_new_lines())
+        return events
+
+    def _read_new_lines(self) -> List[Dict]:
+        """Полные строки после текущего смещения (недописанная строка ждет следующего раза)"""
+        size = os.fstat(self._fd).st_size
+        if size <= self._offset:
+            return []
+        chunk = os.pread(self._fd, size - self._offset, self._offset)
+        end = chunk.rfind(b'\n') + 1
+        self._offset += end
+        events = []
+        for line in chunk[:end].decode('utf-8').splitlines():
+            event = parse_record(line)
+            if event is not None:
+                events.append(event)
+        return events
+
+
+def _changes(previous: Dict, value: Dict) -> Dict[str, Any]:
+    """Изменения числовых полей значения"""
+    changes = {}
+    for key, number in value.items():
+        old = previous.get(key)
+        if (isinstance(number, (int, float)) and isinstance(old, (int, float))
+                and not isinstance(number, bool) and number != old):
+            changes[key] = round(number - old, 2)
+    return changes
+
+
+def format_sse(event: Dict) -> str:
+    """Событие в формате text/event-stream (номер - только у опубликованных)"""
+    lines = []
+    if 'id' in event:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event['data'], ensure_ascii=False)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+_event_broker: Optional[EventBroker] = None
+_event_broker_lock = threading.Lock()
+
+
+def get_event_broker() -> EventBroker:
+    """Общий для процесса брокер событий"""
+    global _event_broker
+    with _event_broker_lock:
+        if _event_broker is None:
+            _event_broker = EventBroker()
+        return _event_broker
@@ -0,0 +1,97 @@
+"""
+Выделение ID записей
+
+Для каждого типа записей ('draws', 'packages') в SEQUENCES_FILE
+хранится последний выданный ID. Процесс резервирует в последовательности
+блок из ID_BLOCK_SIZES номеров под блокировкой 'sequences' и дальше
+раздает ID из блока в памяти. Блоки разных процессов (воркеров gunicorn)
+не пересекаются, поэтому ID не повторяются без сканирования данных.
+
+При резервировании блока последовательность не опускается ниже
+максимального ID в хранилище (floor), так что старые данные и
+восстановленный из копии файл не приводят к повторам.
+
+ID билетов отсюда не выдаются: блоки разных процессов нарушают порядок
+ID относительно порядка записи, а курсоры страниц билетов (after_id)
+требуют, чтобы билет с большим ID не был записан раньше меньшего.
+Хранилища билетов выдают ID под своей блокировкой записи.
+"""
+import os
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+from models.data_manager import DataManager
+from config import SEQUENCES_FILE, ID_BLOCK_SIZES
+
+logger = logging.getLogger(__name__)
+
+
+class IdAllocator:
+    """Последовательности ID с резервированием блоков на процесс"""
+
+    def __init__(self, sequences_file: str = SEQUENCES_FILE, block_sizes: Dict[str, int] = ID_BLOCK_SIZES):
+        self.sequences_file = sequences_file
+        self.block_sizes = block_sizes
+        self._lock = threading.Lock()
+        self._blocks: Dict[str, List[int]] = {}  # тип записей -> [следующий ID, последний ID блока]
+        self._pid = os.getpid()
+
+    def allocate(self, entity: str, count: int = 1, floor: Optional[Callable[[], int]] = None) -> int:
+        """Выделить count последовательных ID, вернуть первый из них"""
+        with self._lock:
+            block = self._block(entity)
+            if block is None or block[1] - block[0] + 1 < count:
+                # Остаток блока меньше запроса: диапазон должен быть непрерывным
+                block = self._reserve(entity, max(count, self.block_sizes.get(entity, 1)), floor)
+                self._blocks[entity] = block
+            first = block[0]
+            block[0] += count
+            return first
+
+    def peek(self, entity: str, floor: Optional[Callable[[], int]] = None) -> int:
+        """Следующий ID, который выдаст allocate (без выделения)"""
+        with self._lock:
+            block = self._block(entity)
+            if block is not None and block[0] <= block[1]:
+                return block[0]
+            last = self._load().get(entity, 0)
+            return max(last, floor() if floor else 0) + 1
+
+    def _block(self, entity: str) -> Optional[List[int]]:
+        # Блоки родителя после fork принадлежат родителю
+        if self._pid != os.getpid():
+            self._blocks = {}
+            self._pid = os.getpid()
+        return self._blocks.get(entity)
+
+    def _load(self) -> Dict[str, int]:
+        if not os.path.exists(self.sequences_file):
+            return {}
+        sequences = DataManager.load_json(self.sequences_file, copy=True)
+        return sequences if isinstance(sequences, dict) else {}
+
+    def _reserve(self, entity: str, size: int, floor: Optional[Callable[[], int]]) -> List[int]:
+        """Зарезервировать блок ID в файле последовательностей"""
+        with DataManager.lock('sequences'):
+            sequences = self._load()
+            last = sequences.get(entity, 0)
+            if floor is not None:
+                last = max(last, floor())
+            sequences[entity] = last + size
+            if not DataManager.save_json(self.sequences_file, sequences):
+                raise IOError(f"Не удалось сохранить последовательность {entity}")
+        logger.debug(f"Зарезервированы ID {entity}: {last + 1}-{last + size}")
+        return [last + 1, last + size]
+
+
+_id_allocator: Optional[IdAllocator] = None
+_id_allocator_lock = threading.Lock()
+
+
+def get_id_allocator() -> IdAllocator:
+    """Общий для процесса распределитель ID"""
+    global _id_allocator
+    with _id_allocator_lock:
+        if _id_allocator is None:
+            _id_allocator = IdAllocator()
+        return _id_allocator
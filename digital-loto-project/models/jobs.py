@@ -0,0 +1,278 @@
+"""
+Фоновые задачи проведения розыгрышей
+
+Проведение большого розыгрыша не укладывается в таймаут HTTP запроса,
+поэтому /api/admin/conduct_draw по умолчанию только ставит задачу в очередь,
+а расчет идет в потоке фонового исполнителя.
+
+Состояние задачи хранится в JOBS_DIR/<id>.json. Билеты розыгрыша
+(по возрастанию ID) делятся на части по SETTLEMENT_JOB_CHUNK_SIZE, после
+каждой записанной части номер сохраняется в контрольной точке
+settled_chunks вместе с накопленными количествами билетов по совпадениям
+match_counts: итог розыгрыша складывается из частей, а не считается
+заново. В отличие от синхронного проведения (LotteryService.conduct_draw),
+которое записывает все билеты одной записью, задача пишет результаты
+каждой части отдельно: контрольная точка ссылается только на записанные
+части. Части считаются в models/settlement.py (большие розыгрыши - в
+пуле процессов). Выполняющий процесс держит блокировку job-<id>; если
+процесс упал, блокировка снимается, и незавершенную задачу при старте
+продолжает один из запущенных процессов приложения, пропуская уже
+рассчитанные части.
+
+В итоге задачи (result) только уровни и суммы; список победителей -
+/api/winners/<draw_id>.
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+from models.data_manager import DataManager
+from models.lottery import LotteryService
+from models.settlement import iter_settled_chunks
+from config import JOBS_DIR, SETTLEMENT_JOB_WORKERS, SETTLEMENT_JOB_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Статусы, при которых задача больше не выполняется
+FINISHED_STATUSES = ('completed', 'failed')
+
+
+class SettlementJobs:
+    """Очередь фоновых задач проведения розыгрышей"""
+
+    def __init__(self, jobs_dir: str = JOBS_DIR):
+        self.jobs_dir = jobs_dir
+        self.lottery_service = LotteryService()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        # Задачи, уже переданные исполнителю этого процесса
+        self._submitted: Set[str] = set()
+
+    # ========= ПУБЛИЧНЫЕ МЕТОДЫ =========
+
+    def submit(self, draw_id: int) -> Optional[Dict]:
+        """Поставить в очередь проведение розыгрыша (None - розыгрыш не найден или проведен)"""
+        try:
+            draw = self.lottery_service.get_draw_by_id(draw_id)
+            if not draw or draw.get('completed', False):
+                return None
+
+            now = datetime.now().isoformat()
+            job = {
+                'id': uuid.uuid4().hex,
+                'type': 'conduct_draw',
+                'draw_id': draw_id,
+                'status': 'queued',
+                'created_at': now,
+                'updated_at': now,
+                'started_at': None,
+                'finished_at': None,
+                'attempts': 0,
+                'winning_numbers': None,
+                'chunk_size': SETTLEMENT_JOB_CHUNK_SIZE,
+                'chunks_total': None,
+                'settled_chunks': [],
+                'match_counts': {},
+                'combinations_total': None,
+                'tickets_total': None,
+                'tickets_settled': 0,
+                'tickets_per_second': 0,
+                'result': None,
+                'error': None
+            }
+            if not self._save(job):
+                return None
+
+            self._start(job['id'])
+            logger.info(f"Задача {job['id']} проведения розыгрыша {draw_id} поставлена в очередь")
+            return self._public(job)
+        except Exception as e:
+            logger.error(f"Ошибка постановки задачи проведения розыгрыша {draw_id}: {e}")
+            return None
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Состояние задачи"""
+        job = self._load(job_id)
+        return self._public(job) if job is not None else None
+
+    def resume_unfinished(self) -> List[str]:
+        """Продолжить незавершенные задачи, которые никто не выполняет
+
+        Каталог задач просматривает один процесс: остальные, запущенные
+        одновременно с ним (воркеры gunicorn), пропускают просмотр.
+        """
+        resumed = []
+        try:
+            with DataManager.lock('jobs-resume', blocking=False):
+                names = os.listdir(self.jobs_dir)
+                for name in sorted(names):
+                    if not name.endswith('.json'):
+                        continue
+                    job_id = name[:-len('.json')]
+                    job = self._load(job_id)
+                    if job and job['status'] not in FINISHED_STATUSES and not self._is_running(job_id):
+                        self._start(job_id)
+                        resumed.append(job_id)
+        except (BlockingIOError, FileNotFoundError):
+            # Каталог просматривает другой процесс или задач еще не было
+            return resumed
+
+        if resumed:
+            logger.info(f"Продолжены незавершенные задачи: {', '.join(resumed)}")
+        return resumed
+
+    # ========= ВЫПОЛНЕНИЕ =========
+
+    def _run(self, job_id: str):
+        """Выполнить задачу, если ее не выполняет другой поток или процесс"""
+        try:
+            with DataManager.lock(f"job-{job_id}", blocking=False):
+                job = self._load(job_id)
+                if job is None or job['status'] in FINISHED_STATUSES:
+                    return
+                try:
+                    self._execute(job)
+                except Exception as e:
+                    logger.error(f"Ошибка выполнения задачи {job_id}: {e}")
+                    self._finish(job, 'failed', error=str(e))
+        except BlockingIOError:
+            logger.info(f"Задача {job_id} уже выполняется другим процессом")
+        finally:
+            self._submitted.discard(job_id)
+
+    def _execute(self, job: Dict):
+        """Провести розыгрыш и рассчитать билеты по частям с контрольными точками"""
+        started = time.monotonic()
+        job['status'] = 'running'
+        job['attempts'] += 1
+        job['started_at'] = job['started_at'] or datetime.now().isoformat()
+        self._save(job)
+
+        draw = self.lottery_service.complete_draw(job['draw_id'], job['id'])
+        if not draw:
+            self._finish(job, 'failed', error="Розыгрыш не найден или уже проведен")
+            return
+        job['winning_numbers'] = draw['numbers']
+
+        # Покупки, начатые до отметки completed, должны завершиться до
+        # чтения билетов; новые покупки проведенный розыгрыш отклоняет
+        with self.lottery_service.storage.transaction('tickets'):
+            pass
+        if job.get('combinations_total') is None:
+            # Различные комбинации ожидающих билетов до расчета (индекс комбинаций)
+            stats = self.lottery_service.storage.get_combination_stats(job['draw_id'])
+            job['combinations_total'] = stats['combinations']
+        ticket_ids, masks = self.lottery_service.storage.get_ticket_masks(job['draw_id'])
+
+        chunk_size = job['chunk_size']
+        job['tickets_total'] = len(ticket_ids)
+        job['chunks_total'] = -(-len(ticket_ids) // chunk_size)
+        self._save(job)
+
+        match_counts = job['match_counts']
+        run_started = time.monotonic()
+        run_tickets = 0
+
+        for index, match_groups in iter_settled_chunks(ticket_ids, masks, draw['numbers'],
+                                                       chunk_size, set(job['settled_chunks'])):
+            if not self.lottery_service.settle_ticket_groups(draw, match_groups):
+                raise RuntimeError(f"Не удалось записать часть {index}")
+
+            chunk_tickets = 0
+            for matches, group in match_groups.items():
+                # Ключи JSON - строки
+                match_counts[str(matches)] = match_counts.get(str(matches), 0) + len(group)
+                chunk_tickets += len(group)
+            run_tickets += chunk_tickets
+            job['settled_chunks'].append(index)
+            job['tickets_settled'] += chunk_tickets
+            job['tickets_per_second'] = round(run_tickets / max(time.monotonic() - run_started, 1e-6))
+            job['updated_at'] = datetime.now().isoformat()
+            self._save(job)
+
+        result = self.lottery_service.draw_settlement_result(
+            draw, {int(matches): count for matches, count in match_counts.items()},
+            job['combinations_total']
+        )
+        self._finish(job, 'completed', result=result)
+        self.lottery_service.record_draw_settled('job', time.monotonic() - started)
+        self.lottery_service.publish_draw_completed(draw, result)
+        logger.info(f"Задача {job['id']}: розыгрыш {job['draw_id']} проведен, "
+                    f"билетов {result['tickets_count']}, победителей {result['winners_count']}")
+
+    # ========= ВНУТРЕННЕЕ =========
+
+    def _start(self, job_id: str):
+        """Передать задачу исполнителю процесса (повторно не передается)"""
+        with self._executor_lock:
+            if job_id in self._submitted:
+                return
+            self._submitted.add(job_id)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=SETTLEMENT_JOB_WORKERS, thread_name_prefix='settlement-job'
+                )
+            self._executor.submit(self._run, job_id)
+
+    def _is_running(self, job_id: str) -> bool:
+        """Выполняется ли задача (или ждет исполнителя) в каком-либо процессе"""
+        if job_id in self._submitted:
+            return True
+        try:
+            with DataManager.lock(f"job-{job_id}", blocking=False):
+                return False
+        except BlockingIOError:
+            return True
+
+    def _finish(self, job: Dict, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        job['status'] = status
+        job['result'] = result
+        job['error'] = error
+        job['finished_at'] = job['updated_at'] = datetime.now().isoformat()
+        self._save(job)
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _load(self, job_id: str) -> Optional[Dict]:
+        # ID задачи - имя файла, поэтому допускаются только шестнадцатеричные ID
+        if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        if not os.path.exists(self._path(job_id)):
+            return None
+        job = DataManager.load_json(self._path(job_id), copy=True)
+        return job if isinstance(job, dict) and job.get('id') == job_id else None
+
+    def _save(self, job: Dict) -> bool:
+        return DataManager.save_json(self._path(job['id']), job)
+
+    @staticmethod
+    def _public(job: Dict) -> Dict:
+        """Состояние задачи для API: без контрольной точки, с процентом выполнения"""
+        public = {key: value for key, value in job.items() if key not in ('settled_chunks', 'match_counts')}
+        total = job['tickets_total']
+        if job['status'] == 'completed':
+            public['progress'] = 100.0
+        elif total:
+            public['progress'] = round(job['tickets_settled'] * 100 / total, 1)
+        else:
+            public['progress'] = 0.0
+        public['chunks_settled'] = len(job['settled_chunks'])
+        return public
+
+
+_settlement_jobs: Optional[SettlementJobs] = None
+_settlement_jobs_lock = threading.Lock()
+
+
+def get_settlement_jobs() -> SettlementJobs:
+    """Общая для процесса очередь задач проведения розыгрышей"""
+    global _settlement_jobs
+    with _settlement_jobs_lock:
+        if _settlement_jobs is None:
+            _settlement_jobs = SettlementJobs()
+        return _settlement_jobs
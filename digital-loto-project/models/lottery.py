@@ -2,12 +2,19 @@
 Основная бизнес-логика лотереи
 """
 import logging
+import time
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from models.data_manager import DataManager
+from models.storage import get_storage
+from models.events import get_event_broker
+from models.changes import get_change_log
+from models.metrics import get_metrics
+from models.settlement import settle_combinations, settlement_tiers
 from utils.helpers import LotteryHelpers
 from utils.validators import Validators
-from config import JSON_FILES, TICKET_PRICES, PACKAGE_PRICES
+from config import (TICKET_PRICES, PACKAGE_PRICES, MAX_TICKETS_PER_PURCHASE, TICKETS_STREAM_BATCH,
+                    MY_TICKETS_GROUP_PREVIEW, CHANGES_PAGE_SIZE, SETTLEMENT_JOB_CHUNK_SIZE)
 
 logger = logging.getLogger(__name__)
 
@@ -16,32 +23,18 @@ class LotteryService:
     
     def __init__(self):
         self.data_manager = DataManager()
+        self.storage = get_storage()
+        self.change_log = get_change_log()
     
     # ========= РАБОТА С РОЗЫГРЫШАМИ =========
     
-    def get_all_draws(self) -> List[Dict]:
-        """Получить все розыгрыши"""
-        draws_data = self.data_manager.load_json(JSON_FILES['draws'])
-        return draws_data.get('draws', []) if isinstance(draws_data, dict) else []
-
     def get_draw_by_id(self, draw_id):
-
+        """Получить розыгрыш по ID"""
         try:
-            draws_data = self.data_manager.load_json(JSON_FILES['draws'])
-            
-            # Обрабатываем разные форматы данных
-            if isinstance(draws_data, dict) and 'draws' in draws_data:
-                draws = draws_data['draws']
-            elif isinstance(draws_data, list):
-                draws = draws_data  # Ваш случай
-            else:
-                logger.warning(f"Неожиданный формат данных: {type(draws_data)}")
-                return None
-                
-            for draw in draws:
-                if draw['id'] == draw_id:
-                    logger.info(f"Найден розыгрыш с ID {draw_id}")
-                    return draw
+            draw = self.storage.get_draw(draw_id)
+            if draw:
+                logger.info(f"Найден розыгрыш с ID {draw_id}")
+                return draw
             
             logger.warning(f"Розыгрыш с ID {draw_id} не найден")
             return None
@@ -49,19 +42,10 @@ class LotteryService:
             logger.error(f"Ошибка получения розыгрыша {draw_id}: {e}")
             return None    
 
-    def get_all_draws(self):
-        """Получить все розыгрыши"""
+    def get_all_draws(self, draw_type: Optional[str] = None, completed: Optional[bool] = None):
+        """Получить все розыгрыши или выборку по типу и статусу"""
         try:
-            draws_data = self.data_manager.load_json(JSON_FILES['draws'])
-            
-            # Обрабатываем разные форматы данных
-            if isinstance(draws_data, dict) and 'draws' in draws_data:
-                return draws_data['draws']
-            elif isinstance(draws_data, list):
-                return draws_data  # Ваш случай
-            else:
-                logger.warning(f"Неожиданный формат данных: {type(draws_data)}")
-                return []
+            return self.storage.get_draws(draw_type, completed)
         except Exception as e:
             logger.error(f"Ошибка получения розыгрышей: {e}")
             return []
@@ -72,14 +56,7 @@ class LotteryService:
             if not Validators.validate_draw_data(draw_data):
                 return None
             
-            draws_data = self.data_manager.load_json(JSON_FILES['draws'])
-            if 'draws' not in draws_data:
-                draws_data['draws'] = []
-            
-            next_id = self.data_manager.get_next_id(draws_data['draws'])
-            
             new_draw = {
-                'id': next_id,
                 'title': draw_data['title'],
                 'type': draw_data['category'],  # category -> type для совместимости
                 'cost': int(draw_data['cost']),
@@ -100,10 +77,10 @@ class LotteryService:
                 new_draw['date'] = datetime.now().strftime('%Y-%m-%d')
                 new_draw['time'] = '20:00'
             
-            draws_data['draws'].append(new_draw)
-            
-            if self.data_manager.save_json(JSON_FILES['draws'], draws_data):
-                logger.info(f"Новый розыгрыш {next_id} добавлен")
+            new_draw = self.storage.add_draw(new_draw)
+            if new_draw:
+                self.change_log.record('draws', 'upsert', [new_draw['id']])
+                logger.info(f"Новый розыгрыш {new_draw['id']} добавлен")
                 return new_draw
             
             return None
@@ -114,18 +91,6 @@ class LotteryService:
     def update_draw(self, draw_id: int, draw_data: Dict) -> Optional[Dict]:
         """Обновить розыгрыш"""
         try:
-            draws_data = self.data_manager.load_json(JSON_FILES['draws'])
-            draws = draws_data.get('draws', [])
-            
-            draw_index = -1
-            for i, draw in enumerate(draws):
-                if draw['id'] == draw_id:
-                    draw_index = i
-                    break
-            
-            if draw_index == -1:
-                return None
-            
             # Обновляем поля
             updatable_fields = {
                 'title': 'title',
@@ -138,18 +103,21 @@ class LotteryService:
                 'button_text': 'button_text'
             }
             
+            fields = {}
             for api_field, db_field in updatable_fields.items():
                 if api_field in draw_data:
                     if api_field in ['cost', 'numbers_count']:
-                        draws[draw_index][db_field] = int(draw_data[api_field])
+                        fields[db_field] = int(draw_data[api_field])
                     else:
-                        draws[draw_index][db_field] = draw_data[api_field]
+                        fields[db_field] = draw_data[api_field]
             
-            draws[draw_index]['updated_at'] = datetime.now().isoformat()
+            fields['updated_at'] = datetime.now().isoformat()
             
-            if self.data_manager.save_json(JSON_FILES['draws'], draws_data):
+            updated_draw = self.storage.update_draw(draw_id, fields)
+            if updated_draw:
+                self.change_log.record('draws', 'upsert', [draw_id])
                 logger.info(f"Розыгрыш {draw_id} обновлен")
-                return draws[draw_index]
+                return updated_draw
             
             return None
         except Exception as e:
@@ -159,87 +127,117 @@ class LotteryService:
     def delete_draw(self, draw_id: int) -> bool:
         """Удалить розыгрыш"""
         try:
-            # Проверяем, есть ли билеты на этот розыгрыш
-            user_tickets = self.get_user_tickets(draw_id)
-            if user_tickets:
-                return False
+            with self.storage.transaction('draws', 'tickets'):
+                # Проверяем, есть ли билеты на этот розыгрыш
+                if self.storage.count_tickets(draw_id):
+                    return False
             
-            draws_data = self.data_manager.load_json(JSON_FILES['draws'])
-            draws = draws_data.get('draws', [])
+                if self.storage.delete_draw(draw_id):
+                    self.change_log.record('draws', 'delete', [draw_id])
+                    logger.info(f"Розыгрыш {draw_id} удален")
+                    return True
             
-            # Находим розыгрыш для удаления
-            new_draws = [draw for draw in draws if draw['id'] != draw_id]
-            
-            if len(new_draws) == len(draws):  # Розыгрыш не найден
                 return False
-            
-            draws_data['draws'] = new_draws
-            
-            if self.data_manager.save_json(JSON_FILES['draws'], draws_data):
-                logger.info(f"Розыгрыш {draw_id} удален")
-                return True
-            
-            return False
         except Exception as e:
             logger.error(f"Ошибка удаления розыгрыша {draw_id}: {e}")
             return False
     
+    def complete_draw(self, draw_id: int, job_id: Optional[str] = None) -> Optional[Dict]:
+        """Отметить розыгрыш проведенным и сохранить выигрышные числа
+        
+        Билеты не обрабатываются. Если розыгрыш уже проведен задачей
+        job_id, возвращается сохраненный результат (продолжение задачи).
+        """
+        try:
+            with self.storage.transaction('draws'):
+                target_draw = self.storage.get_draw(draw_id)
+            
+                if not target_draw:
+                    return None
+                if target_draw.get('completed', False):
+                    if job_id and target_draw.get('settlement_job') == job_id:
+                        return target_draw
+                    return None
+            
+                # Генерируем выигрышные числа
+                number_count = 8 if target_draw['type'] == 'big' else 6
+                winning_numbers = LotteryHelpers.generate_random_numbers(number_count)
+            
+                fields = {
+                    'completed': True,
+                    'numbers': winning_numbers,
+                    'completed_at': datetime.now().isoformat()
+                }
+                if job_id:
+                    fields['settlement_job'] = job_id
+            
+                updated_draw = self.storage.update_draw(draw_id, fields)
+                if updated_draw:
+                    self.change_log.record('draws', 'upsert', [draw_id])
+                return updated_draw
+        except Exception as e:
+            logger.error(f"Ошибка завершения розыгрыша {draw_id}: {e}")
+            return None
+    
     def conduct_draw(self, draw_id: int) -> Optional[Dict]:
-        """Провести розыгрыш"""
+        """Провести розыгрыш в текущем потоке
+        
+        Билеты рассчитываются одной записью (settle_draw_tickets). Это
+        эталонный путь: фоновая задача (models/jobs.py) должна давать те же
+        результаты билетов, уровни и суммы. В итог, в отличие от задачи,
+        входит список победителей.
+        """
         try:
-            draws_data = self.data_manager.load_json(JSON_FILES['draws'])
-            draws = draws_data.get('draws', [])
-            
-            draw_index = -1
-            target_draw = None
-            
-            for i, draw in enumerate(draws):
-                if draw['id'] == draw_id:
-                    draw_index = i
-                    target_draw = draw
-                    break
-            
-            if not target_draw or target_draw.get('completed', False):
+            started = time.monotonic()
+            updated_draw = self.complete_draw(draw_id)
+            if not updated_draw:
                 return None
             
-            # Генерируем выигрышные числа
-            number_count = 8 if target_draw['type'] == 'big' else 6
-            winning_numbers = LotteryHelpers.generate_random_numbers(number_count)
-            
-            # Обновляем розыгрыш
-            draws[draw_index]['completed'] = True
-            draws[draw_index]['numbers'] = winning_numbers
-            draws[draw_index]['completed_at'] = datetime.now().isoformat()
-            
-            if not self.data_manager.save_json(JSON_FILES['draws'], draws_data):
+            settlement = self.settle_draw_tickets(draw_id, updated_draw['numbers'])
+            if settlement is None:
                 return None
             
-            # Обрабатываем билеты
-            winners = self.update_tickets_after_draw(draw_id, winning_numbers)
-            total_prize = sum(w['prize'] for w in winners)
-            
-            logger.info(f"Розыгрыш {draw_id} проведен. Выигрышные числа: {winning_numbers}. Победителей: {len(winners)}")
-            
-            return {
-                "winning_numbers": winning_numbers,
-                "draw_id": draw_id,
-                "winners": winners,
-                "total_prize": total_prize
-            }
+            result = self.draw_settlement_result(
+                updated_draw, settlement['match_counts'], settlement['combinations_count']
+            )
+            result['winners'] = settlement['winners']
+            logger.info(f"Розыгрыш {draw_id} проведен. Выигрышные числа: {updated_draw['numbers']}. "
+                        f"Победителей: {result['winners_count']}")
+            self.record_draw_settled('sync', time.monotonic() - started)
+            self.publish_draw_completed(updated_draw, result)
+            return result
         except Exception as e:
             logger.error(f"Ошибка проведения розыгрыша: {e}")
             return None
     
+    @staticmethod
+    def record_draw_settled(mode: str, duration: float):
+        """Метрики проведенного розыгрыша (mode: sync - в текущем потоке, job - фоновой задачей)"""
+        metrics = get_metrics()
+        metrics.inc('loto_draws_settled_total', mode=mode)
+        metrics.observe('loto_settlement_duration_seconds', duration, mode=mode)
+    
+    def publish_draw_completed(self, draw: Dict, result: Dict):
+        """Событие draw_completed для /api/events (без списка победителей)"""
+        get_event_broker().publish('draw_completed', {
+            'draw_id': draw['id'],
+            'title': draw.get('title', ''),
+            'type': draw.get('type', ''),
+            'winning_numbers': result['winning_numbers'],
+            'tickets_count': result['tickets_count'],
+            'winners_count': result['winners_count'],
+            'total_prize': result['total_prize'],
+            'tiers': result['tiers']
+        })
+    
     # ========= РАБОТА С БИЛЕТАМИ =========
     
-    def get_user_tickets(self, draw_id: Optional[int] = None) -> List[Dict]:
-        """Получить билеты пользователя (все или по конкретному розыгрышу)"""
+    def get_user_tickets(self, draw_id: Optional[int] = None, status: Optional[str] = None) -> List[Dict]:
+        """Получить билеты пользователя (все или по розыгрышу и статусу)"""
         try:
-            tickets_data = self.data_manager.load_json(JSON_FILES['tickets'])
-            tickets = tickets_data.get('tickets', [])
+            tickets = self.storage.get_tickets(draw_id, status)
             
             if draw_id is not None:
-                tickets = [t for t in tickets if t['draw_id'] == draw_id]
                 logger.info(f"Найдено {len(tickets)} билетов для розыгрыша {draw_id}")
             else:
                 logger.info(f"Загружено {len(tickets)} билетов пользователя")
@@ -249,26 +247,112 @@ class LotteryService:
             logger.error(f"Ошибка получения билетов: {e}")
             return []
     
+    def get_my_tickets_view(self) -> Tuple[List[Dict], List[Dict]]:
+        """Группы страницы "Мои билеты" и розыгрыши для фильтра
+        
+        Группы по розыгрышам ведет хранилище вместе с записями билетов:
+        количество билетов, счетчики состояний и MY_TICKETS_GROUP_PREVIEW
+        последних билетов группы (по убыванию ID). Остальные билеты группы
+        загружаются через /api/tickets?draw_id=...
+        """
+        try:
+            grouped = []
+            draw_filters = []
+            for group in self.storage.get_ticket_groups(MY_TICKETS_GROUP_PREVIEW):
+                draw_id = group['draw_id']
+                draw = self.storage.get_draw(draw_id)
+                draw_info = draw or {
+                    'id': draw_id,
+                    'title': f'Розыгрыш #{draw_id}',
+                    'type': 'big',
+                    'completed': False
+                }
+                image = f'https://via.placeholder.com/50/667eea/white?text={draw_id}'
+                grouped.append({
+                    'draw_id': draw_id,
+                    'draw_title': draw_info.get('title', f'Розыгрыш #{draw_id}'),
+                    'draw_image': image,
+                    'draw_status': LotteryHelpers.get_draw_status_text(draw_info),
+                    'tickets_count': group['tickets_count'],
+                    'status_counts': group['states'],
+                    'tickets': [LotteryHelpers.enrich_ticket_data(ticket, draw or {}) for ticket in group['tickets']]
+                })
+                if draw:
+                    draw_filters.append({
+                        'id': draw_id,
+                        'title': draw.get('title', f'Розыгрыш #{draw_id}'),
+                        'image': image
+                    })
+            return grouped, draw_filters
+        except Exception as e:
+            logger.error(f"Ошибка получения групп билетов: {e}")
+            return [], []
+    
+    def iter_user_tickets_page(self, page: Dict, draw_id: Optional[int] = None, state: Optional[str] = None,
+                               after_id: int = 0, limit: Optional[int] = 50) -> Iterator[Dict]:
+        """Генератор страницы билетов пользователя, обогащенных данными розыгрышей
+        
+        Выборка по розыгрышу и состоянию идет по индексам хранилища частями
+        по TICKETS_STREAM_BATCH, обогащаются только выданные билеты (limit
+        None - все билеты после after_id). По мере выдачи заполняет page:
+        count - выдано билетов, next_after - ID, после которого начинается
+        следующая страница (None - страница последняя).
+        """
+        page['count'] = 0
+        page['next_after'] = None
+        draws = {}
+        while limit is None or page['count'] < limit:
+            batch_size = TICKETS_STREAM_BATCH if limit is None else min(TICKETS_STREAM_BATCH, limit - page['count'])
+            tickets = self.storage.get_tickets_page(draw_id, state, after_id, batch_size + 1)
+            for ticket in tickets[:batch_size]:
+                ticket_draw_id = ticket.get('draw_id')
+                if ticket_draw_id not in draws:
+                    draws[ticket_draw_id] = self.storage.get_draw(ticket_draw_id) or {}
+                after_id = ticket['id']
+                page['count'] += 1
+                yield LotteryHelpers.enrich_ticket_data(ticket, draws[ticket_draw_id])
+            if len(tickets) <= batch_size:
+                return
+        page['next_after'] = after_id
+    
+    def count_user_tickets(self, draw_id: Optional[int] = None, state: Optional[str] = None) -> int:
+        """Количество билетов пользователя по розыгрышу и состоянию (по индексам)"""
+        return self.storage.count_tickets(draw_id, state=state)
+    
+    def iter_draw_winners(self, draw_id: int, summary: Dict) -> Iterator[Dict]:
+        """Генератор победителей розыгрыша по убыванию приза (при равном призе - по ID)
+        
+        Билеты читаются по индексам розыгрыша и приза частями по
+        TICKETS_STREAM_BATCH. По мере выдачи заполняет summary:
+        total_winners и total_prize_amount.
+        """
+        summary['total_winners'] = 0
+        summary['total_prize_amount'] = 0
+        for prize in self.storage.get_prize_levels(draw_id):
+            after_id = 0
+            while True:
+                tickets = self.storage.get_tickets_page(draw_id, None, after_id, TICKETS_STREAM_BATCH, prize)
+                for ticket in tickets:
+                    summary['total_winners'] += 1
+                    summary['total_prize_amount'] += ticket.get('prize', 0)
+                    yield {
+                        "ticket_id": ticket['id'],
+                        "numbers": ticket['numbers'],
+                        "matches": ticket.get('matches', 0),
+                        "prize": ticket.get('prize', 0),
+                        "created_at": ticket.get('created_at')
+                    }
+                if len(tickets) < TICKETS_STREAM_BATCH:
+                    break
+                after_id = tickets[-1]['id']
+    
     def add_ticket(self, draw_id: int, numbers: List[int]) -> Optional[Dict]:
         """Добавить новый билет"""
         try:
-            tickets_data = self.data_manager.load_json(JSON_FILES['tickets'])
-            if 'tickets' not in tickets_data:
-                tickets_data['tickets'] = []
-            
-            ticket = {
-                'id': self.get_next_ticket_id(),
-                'draw_id': draw_id,
-                'numbers': numbers,
-                'status': 'pending',
-                'created_at': datetime.now().isoformat(),
-                'matches': 0,
-                'prize': 0
-            }
-            
-            tickets_data['tickets'].append(ticket)
-            
-            if self.data_manager.save_json(JSON_FILES['tickets'], tickets_data):
+            # ID назначается хранилищем под его блокировкой
+            ticket = self.storage.add_ticket(self._new_ticket(draw_id, numbers))
+            if ticket:
+                self.change_log.record('tickets', 'upsert', [ticket['id']])
                 logger.info(f"Билет {ticket['id']} успешно добавлен")
                 return ticket
             else:
@@ -278,17 +362,25 @@ class LotteryService:
             logger.error(f"Ошибка добавления билета: {e}")
             return None
     
+    def _new_ticket(self, draw_id: int, numbers: List[int]) -> Dict:
+        """Новый билет без ID (с полями для отображения: formatted_time, state, status_text)"""
+        now = datetime.now()
+        return {
+            'draw_id': draw_id,
+            'numbers': numbers,
+            'status': 'pending',
+            'created_at': now.isoformat(),
+            'formatted_time': now.strftime('%d.%m.%Y %H:%M'),
+            **LotteryHelpers.ticket_state_fields(bool(numbers)),
+            'matches': 0,
+            'prize': 0,
+            'price': 0
+        }
+    
     def get_next_ticket_id(self) -> int:
         """Получить следующий ID для билета"""
         try:
-            tickets_data = self.data_manager.load_json(JSON_FILES['tickets'])
-            tickets = tickets_data.get('tickets', [])
-            
-            if not tickets:
-                return 1
-            
-            max_id = max(ticket['id'] for ticket in tickets)
-            return max_id + 1
+            return self.storage.next_ticket_id()
         except Exception as e:
             logger.error(f"Ошибка получения следующего ID: {e}")
             return 1
@@ -296,88 +388,152 @@ class LotteryService:
     def update_ticket(self, ticket_id: int, new_numbers: List[int]) -> Optional[Dict]:
         """Обновить числа билета"""
         try:
-            tickets_data = self.data_manager.load_json(JSON_FILES['tickets'])
-            tickets = tickets_data.get('tickets', [])
+            with self.storage.transaction('draws'):
+                target_ticket = self.storage.get_ticket(ticket_id)
             
-            ticket_index = -1
-            target_ticket = None
+                if not target_ticket:
+                    return None
             
-            for i, ticket in enumerate(tickets):
-                if ticket['id'] == ticket_id:
-                    ticket_index = i
-                    target_ticket = ticket
-                    break
+                # Проверяем, что розыгрыш еще не проведен
+                draw = self.get_draw_by_id(target_ticket['draw_id'])
+                if not draw or draw.get('completed', False):
+                    return None
             
-            if not target_ticket:
-                return None
+                # Валидация новых чисел
+                if not Validators.validate_ticket_numbers(new_numbers, draw['type']):
+                    return None
             
-            # Проверяем, что розыгрыш еще не проведен
-            draw = self.get_draw_by_id(target_ticket['draw_id'])
-            if not draw or draw.get('completed', False):
-                return None
-            
-            # Валидация новых чисел
-            if not Validators.validate_ticket_numbers(new_numbers, draw['type']):
-                return None
-            
-            # Обновляем билет
-            tickets[ticket_index]['numbers'] = new_numbers
-            tickets[ticket_index]['updated_at'] = datetime.now().isoformat()
+                # Обновляем билет
+                updated_ticket = self.storage.update_ticket(ticket_id, {
+                    'numbers': new_numbers,
+                    **LotteryHelpers.ticket_state_fields(bool(new_numbers)),
+                    'updated_at': datetime.now().isoformat()
+                })
             
-            if self.data_manager.save_json(JSON_FILES['tickets'], tickets_data):
-                logger.info(f"Билет {ticket_id} обновлен")
-                return tickets[ticket_index]
+                if updated_ticket:
+                    self.change_log.record('tickets', 'upsert', [ticket_id])
+                    logger.info(f"Билет {ticket_id} обновлен")
+                    return updated_ticket
             
-            return None
+                return None
         except Exception as e:
             logger.error(f"Ошибка обновления билета {ticket_id}: {e}")
             return None
     
     def update_tickets_after_draw(self, draw_id: int, winning_numbers: List[int]) -> List[Dict]:
-        """Обновление статусов билетов после розыгрыша"""
+        """Обновление статусов билетов после розыгрыша: победители по возрастанию ID"""
+        settlement = self.settle_draw_tickets(draw_id, winning_numbers)
+        return settlement['winners'] if settlement else []
+    
+    def settle_draw_tickets(self, draw_id: int, winning_numbers: List[int]) -> Optional[Dict]:
+        """Расчет всех ожидающих билетов розыгрыша одной записью
+        
+        Совпадения и призы считаются один раз на каждую различную
+        комбинацию чисел по индексу комбинаций хранилища и раздаются ее
+        билетам (models/settlement.py, большие розыгрыши - в пуле
+        процессов). Билеты с одинаковым числом совпадений записываются одной
+        группой с общими изменениями. Возвращает winners ({ticket_id,
+        matches, prize} по возрастанию ID), match_counts - {совпадения:
+        билетов}, tiers, tickets_count и combinations_count; None - ошибка.
+        """
         try:
-            tickets_data = self.data_manager.load_json(JSON_FILES['tickets'])
-            tickets = tickets_data.get('tickets', [])
-            
             draw = self.get_draw_by_id(draw_id)
             if not draw:
-                return []
-            
-            winners = []
-            
-            for ticket in tickets:
-                if ticket.get('draw_id') == draw_id and ticket.get('status') == 'pending':
-                    matches = LotteryHelpers.check_winning_ticket(ticket.get('numbers', []), winning_numbers)
-                    prize = LotteryHelpers.calculate_prize(matches, draw['type'])
-                    
-                    ticket['status'] = 'completed'
-                    ticket['matches'] = matches
-                    ticket['prize'] = prize
-                    ticket['draw_completed'] = True
-                    ticket['draw_date'] = datetime.now().isoformat()
-                    
-                    if prize > 0:
-                        winners.append({
-                            'ticket_id': ticket['id'],
-                            'matches': matches,
-                            'prize': prize
-                        })
-            
-            self.data_manager.save_json(JSON_FILES['tickets'], tickets_data)
-            logger.info(f"Обновлено {len([t for t in tickets if t.get('draw_id') == draw_id])} билетов для розыгрыша {draw_id}")
-            
-            return winners
+                return None
+            
+            # Индекс комбинаций читается и билеты записываются под одной
+            # блокировкой: купленный в это время билет не останется непосчитанным
+            with self.storage.transaction('tickets'):
+                combinations = self.storage.get_pending_combinations(draw_id)
+                match_groups = settle_combinations(combinations, winning_numbers, SETTLEMENT_JOB_CHUNK_SIZE)
+                groups = self._settlement_updates(
+                    draw['type'], match_groups, draw.get('completed_at') or datetime.now().isoformat()
+                )
+                
+                if not self.storage.update_ticket_groups(groups):
+                    logger.error(f"Ошибка сохранения результатов розыгрыша {draw_id}")
+                    return None
+                self._record_ticket_groups(groups, draw_id)
+            
+            match_counts = {matches: len(group) for matches, group in match_groups.items()}
+            winners = sorted(
+                ({'ticket_id': ticket_id, 'matches': fields['matches'], 'prize': fields['prize']}
+                 for ticket_ids, fields in groups if fields['prize'] > 0 for ticket_id in ticket_ids),
+                key=lambda winner: winner['ticket_id']
+            )
+            logger.info(f"Обновлено {sum(match_counts.values())} билетов для розыгрыша {draw_id}, "
+                        f"различных комбинаций: {len(combinations)}")
+            
+            return {
+                'winners': winners,
+                'match_counts': match_counts,
+                'tiers': settlement_tiers(match_counts, draw['type']),
+                'tickets_count': sum(match_counts.values()),
+                'combinations_count': len(combinations)
+            }
         except Exception as e:
             logger.error(f"Ошибка обновления билетов после розыгрыша: {e}")
-            return []
+            return None
+    
+    def _settlement_updates(self, draw_type: str, match_groups: Dict[int, List[int]],
+                            draw_date: str) -> List[Tuple[List[int], Dict]]:
+        """Изменения билетов по группам совпадений"""
+        return [(group, {
+            'status': 'completed',
+            **LotteryHelpers.ticket_state_fields(True, matches),
+            'matches': matches,
+            'prize': LotteryHelpers.calculate_prize(matches, draw_type),
+            'draw_completed': True,
+            'draw_date': draw_date
+        }) for matches, group in match_groups.items()]
+    
+    def settle_ticket_groups(self, draw: Dict, match_groups: Dict[int, List[int]]) -> bool:
+        """Записать результаты части билетов проведенного розыгрыша
+        
+        match_groups - {совпадения: [ID билетов]} (models/settlement.py).
+        Результат зависит только от чисел билетов и розыгрыша, поэтому
+        повторная запись той же части (после сбоя) ничего не меняет.
+        """
+        try:
+            groups = self._settlement_updates(draw['type'], match_groups, draw['completed_at'])
+            if not self.storage.update_ticket_groups(groups):
+                return False
+            self._record_ticket_groups(groups, draw['id'])
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка расчета части билетов розыгрыша {draw['id']}: {e}")
+            return False
+    
+    def _record_ticket_groups(self, groups: List[Tuple[List[int], Dict]], draw_id: int):
+        """Записать в журнал изменений билеты розыгрыша, измененные группами"""
+        self.change_log.record('tickets', 'upsert', (ticket_id for ids, _ in groups for ticket_id in ids), [draw_id])
+    
+    @staticmethod
+    def draw_settlement_result(draw: Dict, match_counts: Dict[int, int], combinations_count: int) -> Dict:
+        """Итог проведенного розыгрыша по количествам билетов {совпадения: билетов}
+        
+        combinations_count - различные комбинации рассчитанных билетов.
+        Список победителей не входит в итог: его отдает /api/winners/<draw_id>.
+        """
+        tiers = settlement_tiers(match_counts, draw['type'])
+        return {
+            "winning_numbers": draw['numbers'],
+            "draw_id": draw['id'],
+            "tiers": tiers,
+            "winners_count": sum(tier['winners'] for tier in tiers),
+            "total_prize": sum(tier['payout'] for tier in tiers),
+            "tickets_count": sum(match_counts.values()),
+            "combinations_count": combinations_count
+        }
     
     # ========= РАБОТА С БАЛАНСОМ =========
     
     def get_balance(self) -> float:
         """Получить баланс пользователя"""
         try:
-            balance_data = self.data_manager.load_json(JSON_FILES['balance'])
-            balance = balance_data.get('balance', 1500.0)  # Начальный баланс 1500
+            balance = self.storage.get_balance()
+            if balance is None:
+                balance = 1500.0  # Начальный баланс 1500
             logger.info(f"Текущий баланс: {balance}")
             return balance
         except Exception as e:
@@ -390,8 +546,8 @@ class LotteryService:
             if not Validators.validate_balance(new_balance):
                 return False
             
-            balance_data = {'balance': new_balance}
-            if self.data_manager.save_json(JSON_FILES['balance'], balance_data):
+            if self.storage.set_balance(new_balance):
+                self.change_log.record('balance', 'upsert')
                 logger.info(f"Баланс обновлен до {new_balance}")
                 return True
             else:
@@ -406,8 +562,7 @@ class LotteryService:
     def get_packages(self) -> List[Dict]:
         """Получить все пакеты"""
         try:
-            packages_data = self.data_manager.load_json(JSON_FILES['packages'])
-            packages = packages_data.get('packages', [])
+            packages = self.storage.get_packages()
             logger.info(f"Загружено {len(packages)} пакетов")
             return packages
         except Exception as e:
@@ -420,12 +575,7 @@ class LotteryService:
             if not Validators.validate_package_data(package_data):
                 return None
             
-            packages_data = self.data_manager.load_json(JSON_FILES['packages'])
-            if 'packages' not in packages_data:
-                packages_data['packages'] = []
-            
             package = {
-                'id': self.data_manager.get_next_id(packages_data['packages']),
                 'name': package_data.get('name'),
                 'category': package_data.get('category'),
                 'price': int(package_data.get('price')),
@@ -433,9 +583,10 @@ class LotteryService:
                 'created_date': datetime.now().isoformat()
             }
             
-            packages_data['packages'].append(package)
+            package = self.storage.add_package(package)
             
-            if self.data_manager.save_json(JSON_FILES['packages'], packages_data):
+            if package:
+                self.change_log.record('packages', 'upsert', [package['id']])
                 logger.info(f"Пакет {package['id']} успешно добавлен")
                 return package
             else:
@@ -448,24 +599,23 @@ class LotteryService:
     def update_package(self, package_id: int, package_data: Dict) -> Optional[Dict]:
         """Обновить пакет"""
         try:
-            packages_data = self.data_manager.load_json(JSON_FILES['packages'])
-            packages = packages_data.get('packages', [])
-            
-            for i, package in enumerate(packages):
-                if package['id'] == package_id:
-                    packages[i].update({
-                        'name': package_data.get('name', package['name']),
-                        'category': package_data.get('category', package['category']),
-                        'price': int(package_data.get('price', package['price'])),
-                        'updated_date': datetime.now().isoformat()
-                    })
-                    
-                    if self.data_manager.save_json(JSON_FILES['packages'], packages_data):
-                        logger.info(f"Пакет {package_id} обновлен")
-                        return packages[i]
-                    else:
-                        logger.error("Ошибка сохранения пакета")
-                        return None
+            package = self.storage.get_package(package_id)
+            
+            if package:
+                updated_package = self.storage.update_package(package_id, {
+                    'name': package_data.get('name', package['name']),
+                    'category': package_data.get('category', package['category']),
+                    'price': int(package_data.get('price', package['price'])),
+                    'updated_date': datetime.now().isoformat()
+                })
+                
+                if updated_package:
+                    self.change_log.record('packages', 'upsert', [package_id])
+                    logger.info(f"Пакет {package_id} обновлен")
+                    return updated_package
+                else:
+                    logger.error("Ошибка сохранения пакета")
+                    return None
             
             logger.warning(f"Пакет с ID {package_id} не найден")
             return None
@@ -476,12 +626,8 @@ class LotteryService:
     def delete_package(self, package_id: int) -> bool:
         """Удалить пакет"""
         try:
-            packages_data = self.data_manager.load_json(JSON_FILES['packages'])
-            packages = packages_data.get('packages', [])
-            
-            packages_data['packages'] = [p for p in packages if p['id'] != package_id]
-            
-            if self.data_manager.save_json(JSON_FILES['packages'], packages_data):
+            if self.storage.delete_package(package_id):
+                self.change_log.record('packages', 'delete', [package_id])
                 logger.info(f"Пакет {package_id} удален")
                 return True
             else:
@@ -493,50 +639,113 @@ class LotteryService:
     
     # ========= ПОКУПКА БИЛЕТОВ И ПАКЕТОВ =========
     
+    def _purchase(self, price: float, tickets: List[Dict]) -> Dict:
+        """Списать стоимость и сохранить билеты одной записью
+        
+        Вызывается внутри транзакции ('balance', 'tickets'). Билеты получают
+        непрерывный диапазон ID; при ошибке записи средства возвращаются.
+        Стоимость делится между билетами поровну (поле price, из него
+        считается выручка).
+        """
+        current_balance = self.get_balance()
+        
+        if current_balance < price:
+            return {"success": False, "error": "Недостаточно средств", "code": "INSUFFICIENT_FUNDS"}
+        
+        # Списание средств
+        new_balance = current_balance - price
+        if not self.update_balance(new_balance):
+            return {"success": False, "error": "Ошибка списания средств", "code": "BALANCE_UPDATE_ERROR"}
+        
+        # Создание билетов
+        for ticket in tickets:
+            ticket['price'] = price / len(tickets)
+        created_tickets = self.storage.add_tickets(tickets)
+        if created_tickets:
+            self.change_log.record('tickets', 'upsert', [ticket['id'] for ticket in created_tickets])
+            get_metrics().inc('loto_tickets_sold_total', len(created_tickets))
+        else:
+            # Возвращаем средства в случае ошибки
+            self.update_balance(current_balance)
+            return {"success": False, "error": "Ошибка создания билетов", "code": "TICKETS_CREATE_ERROR"}
+        
+        return {"success": True, "tickets": created_tickets, "new_balance": new_balance}
+    
     def buy_ticket(self, draw_id: int, numbers: List[int]) -> Dict:
         """Покупка билета"""
+        result = self.buy_tickets(draw_id, [numbers])
+        if not result["success"]:
+            if result["code"] == "TICKETS_CREATE_ERROR":
+                result.update(error="Ошибка создания билета", code="TICKET_CREATE_ERROR")
+            result.pop("index", None)
+            return result
+        
+        return {
+            "success": True,
+            "data": {
+                "ticket": result["data"]["tickets"][0],
+                "new_balance": result["data"]["new_balance"]
+            },
+            "message": "Билет успешно приобретен"
+        }
+    
+    def buy_tickets(self, draw_id: int, numbers_list: List[List[int]]) -> Dict:
+        """Покупка нескольких билетов одного розыгрыша
+        
+        Все комбинации проверяются до списания; баланс списывается один раз,
+        билеты сохраняются одной записью.
+        """
         try:
-            # Получаем розыгрыш для определения типа
-            draw = self.get_draw_by_id(draw_id)
-            if not draw:
-                return {"success": False, "error": "Розыгрыш не найден", "code": "DRAW_NOT_FOUND"}
-            
-            # Валидация чисел
-            if not Validators.validate_ticket_numbers(numbers, draw['type']):
-                return {"success": False, "error": "Неверные числа билета", "code": "INVALID_NUMBERS"}
-            
-            # Проверка баланса
-            current_balance = self.get_balance()
-            ticket_price = TICKET_PRICES.get(draw['type'], 10)
-            
-            if current_balance < ticket_price:
-                return {"success": False, "error": "Недостаточно средств", "code": "INSUFFICIENT_FUNDS"}
-            
-            # Списание средств
-            new_balance = current_balance - ticket_price
-            if not self.update_balance(new_balance):
-                return {"success": False, "error": "Ошибка списания средств", "code": "BALANCE_UPDATE_ERROR"}
-            
-            # Создание билета
-            ticket = self.add_ticket(draw_id, numbers)
-            if not ticket:
-                # Возвращаем средства в случае ошибки
-                self.update_balance(current_balance)
-                return {"success": False, "error": "Ошибка создания билета", "code": "TICKET_CREATE_ERROR"}
-            
-            logger.info(f"Билет {ticket['id']} успешно куплен за {ticket_price}")
+            if not isinstance(numbers_list, list) or not numbers_list:
+                return {"success": False, "error": "Не указаны числа билетов", "code": "MISSING_FIELDS"}
+            
+            if len(numbers_list) > MAX_TICKETS_PER_PURCHASE:
+                return {
+                    "success": False,
+                    "error": f"Не более {MAX_TICKETS_PER_PURCHASE} билетов за покупку",
+                    "code": "TOO_MANY_TICKETS"
+                }
+            
+            with self.storage.transaction('balance', 'tickets'):
+                # Получаем розыгрыш для определения типа
+                draw = self.get_draw_by_id(draw_id)
+                if not draw:
+                    return {"success": False, "error": "Розыгрыш не найден", "code": "DRAW_NOT_FOUND"}
+            
+                # Проведенный розыгрыш (в том числе рассчитываемый фоновой задачей)
+                if draw.get('completed', False):
+                    return {"success": False, "error": "Розыгрыш уже проведен", "code": "DRAW_COMPLETED"}
+            
+                # Валидация всех комбинаций
+                for index, numbers in enumerate(numbers_list):
+                    if not Validators.validate_ticket_numbers(numbers, draw['type']):
+                        return {
+                            "success": False,
+                            "error": "Неверные числа билета",
+                            "code": "INVALID_NUMBERS",
+                            "index": index
+                        }
+            
+                ticket_price = TICKET_PRICES.get(draw['type'], 10)
+                tickets = [self._new_ticket(draw_id, numbers) for numbers in numbers_list]
+                result = self._purchase(ticket_price * len(tickets), tickets)
+                if not result["success"]:
+                    return result
+            
+            logger.info(f"Куплено билетов: {len(tickets)} (ID {result['tickets'][0]['id']}-"
+                        f"{result['tickets'][-1]['id']}) за {ticket_price * len(tickets)}")
             
             return {
                 "success": True,
                 "data": {
-                    "ticket": ticket,
-                    "new_balance": new_balance
+                    "tickets": result["tickets"],
+                    "new_balance": result["new_balance"]
                 },
-                "message": "Билет успешно приобретен"
+                "message": f"Билеты успешно приобретены: {len(tickets)}"
             }
             
         except Exception as e:
-            logger.error(f"Ошибка покупки билета: {e}")
+            logger.error(f"Ошибка покупки билетов: {e}")
             return {"success": False, "error": "Внутренняя ошибка сервера", "code": "INTERNAL_ERROR"}
     
     def buy_package(self, package_type: str) -> Dict:
@@ -545,46 +754,29 @@ class LotteryService:
             if not Validators.validate_package_type(package_type):
                 return {"success": False, "error": "Неверный тип пакета", "code": "INVALID_PACKAGE"}
             
-            # Проверка баланса
-            current_balance = self.get_balance()
-            package_price = PACKAGE_PRICES[package_type]
-            
-            if current_balance < package_price:
-                return {"success": False, "error": "Недостаточно средств", "code": "INSUFFICIENT_FUNDS"}
-            
-            # Определение розыгрышей по категории пакета
-            draws = self.get_all_draws()
-            
-            if package_type == 'all':
-                target_draws = [d for d in draws if not d.get('completed', False)]
-            elif package_type == 'big_only':
-                target_draws = [d for d in draws if d['type'] == 'big' and not d.get('completed', False)]
-            elif package_type == 'express_only':
-                target_draws = [d for d in draws if d['type'] == 'express' and not d.get('completed', False)]
-            
-            if not target_draws:
-                return {"success": False, "error": "Нет доступных розыгрышей для пакета", "code": "NO_DRAWS_AVAILABLE"}
-            
-            # Списание средств
-            new_balance = current_balance - package_price
-            if not self.update_balance(new_balance):
-                return {"success": False, "error": "Ошибка списания средств", "code": "BALANCE_UPDATE_ERROR"}
-            
-            # Создание билетов для всех розыгрышей
-            created_tickets = []
-            for draw in target_draws:
-                # Генерируем случайные числа для каждого билета
-                number_count = 8 if draw['type'] == 'big' else 6
-                random_numbers = LotteryHelpers.generate_random_numbers(number_count)
-                
-                ticket = self.add_ticket(draw['id'], random_numbers)
-                if ticket:
-                    created_tickets.append(ticket)
+            with self.storage.transaction('balance', 'tickets'):
+                # Проверка баланса
+                package_price = PACKAGE_PRICES[package_type]
             
-            if not created_tickets:
-                # Возвращаем средства в случае ошибки
-                self.update_balance(current_balance)
-                return {"success": False, "error": "Ошибка создания билетов", "code": "TICKETS_CREATE_ERROR"}
+                if self.get_balance() < package_price:
+                    return {"success": False, "error": "Недостаточно средств", "code": "INSUFFICIENT_FUNDS"}
+            
+                # Определение розыгрышей по категории пакета (по индексам типа и статуса)
+                package_draw_types = {'all': None, 'big_only': 'big', 'express_only': 'express'}
+                target_draws = self.get_all_draws(package_draw_types[package_type], completed=False)
+            
+                if not target_draws:
+                    return {"success": False, "error": "Нет доступных розыгрышей для пакета", "code": "NO_DRAWS_AVAILABLE"}
+            
+                # По билету со случайными числами в каждый розыгрыш
+                tickets = [
+                    self._new_ticket(draw['id'], LotteryHelpers.generate_random_numbers(8 if draw['type'] == 'big' else 6))
+                    for draw in target_draws
+                ]
+                result = self._purchase(package_price, tickets)
+                if not result["success"]:
+                    return result
+                created_tickets = result["tickets"]
             
             logger.info(f"Пакет {package_type} успешно куплен, создано билетов: {len(created_tickets)}")
             
@@ -592,7 +784,7 @@ class LotteryService:
                 "success": True,
                 "data": {
                     "tickets": created_tickets,
-                    "new_balance": new_balance,
+                    "new_balance": result["new_balance"],
                     "package_type": package_type
                 },
                 "message": f"Пакет успешно приобретен, создано билетов: {len(created_tickets)}"
@@ -607,34 +799,114 @@ class LotteryService:
     def calculate_tickets_stats(self) -> Dict:
         """Расчет статистики по билетам для админки"""
         try:
-            tickets = self.get_user_tickets()
-            
-            total_tickets = len(tickets)
-            winning_tickets = sum(1 for ticket in tickets if ticket.get('prize', 0) > 0)
-            pending_tickets = sum(1 for ticket in tickets if ticket.get('status') == 'pending')
-            
-            return {
-                'total_tickets': total_tickets,
-                'winning_tickets': winning_tickets,
-                'pending_tickets': pending_tickets
-            }
+            counters = self.storage.get_counters()
+            return {key: counters[key] for key in ('total_tickets', 'winning_tickets', 'pending_tickets')}
         except Exception as e:
             logger.error(f"Ошибка расчета статистики билетов: {e}")
             return {'total_tickets': 0, 'winning_tickets': 0, 'pending_tickets': 0}
     
+    def get_draws_with_sales(self) -> List[Dict]:
+        """Розыгрыши с количеством проданных билетов и выручкой
+        
+        Продажи берутся из счетчиков по розыгрышам, которые обновляются при
+        покупке, поэтому список не зависит от количества билетов.
+        """
+        try:
+            sales = self.storage.get_draw_sales()
+            return [self._with_sales(draw, sales) for draw in self.get_all_draws()]
+        except Exception as e:
+            logger.error(f"Ошибка получения продаж по розыгрышам: {e}")
+            return []
+    
+    @staticmethod
+    def _with_sales(draw: Dict, sales: Dict[int, Dict]) -> Dict:
+        """Розыгрыш с полями продаж tickets_count и revenue из счетчиков"""
+        draw_sales = sales.get(draw['id'], {'tickets_count': 0, 'revenue': 0})
+        return {
+            **draw,
+            'tickets_count': draw_sales['tickets_count'],
+            'revenue': round(draw_sales['revenue'], 2)
+        }
+    
+    def get_draw_combination_stats(self, draw_id: int) -> Optional[Dict]:
+        """Ожидающие билеты розыгрыша и количество различных комбинаций среди них"""
+        try:
+            if not self.get_draw_by_id(draw_id):
+                return None
+            stats = self.storage.get_combination_stats(draw_id)
+            return {'draw_id': draw_id, **stats}
+        except Exception as e:
+            logger.error(f"Ошибка подсчета комбинаций розыгрыша {draw_id}: {e}")
+            return None
+    
+    def get_changes(self, since: Optional[int]) -> Dict:
+        """Записи, измененные после версии since журнала изменений
+        
+        Возвращает version (передается в следующий запрос как since),
+        reset, has_more, текущие записи draws, packages и tickets, balance
+        (None, если не менялся), deleted - ID удаленных розыгрышей и
+        пакетов, и ticket_draws - розыгрыши, билеты которых нужно
+        перечитать целиком. Розыгрыши идут с полями продаж (как в списке
+        розыгрышей), и в draws входят также розыгрыши измененных билетов:
+        покупка меняет их tickets_count и revenue. При reset клиент
+        перечитывает все данные; since=None - только текущая версия для
+        начальной загрузки.
+        """
+        if since is None:
+            return {'version': self.change_log.version(), 'reset': True, 'has_more': False}
+        
+        collected = self.change_log.collect(since, CHANGES_PAGE_SIZE)
+        if collected['reset']:
+            return {'version': collected['version'], 'reset': True, 'has_more': False}
+        
+        ids = collected['ids']
+        changes = {
+            'version': collected['version'],
+            'reset': False,
+            'has_more': collected['has_more'],
+            'draws': [],
+            'packages': [],
+            'tickets': [],
+            'balance': self.get_balance() if collected['balance'] else None,
+            'deleted': {'draws': [], 'packages': []},
+            'ticket_draws': sorted(collected['ticket_draws'])
+        }
+        ticket_draws = set(collected['ticket_draws'])
+        for ticket_id in sorted(ids['tickets']):
+            ticket = self.storage.get_ticket(ticket_id)
+            if ticket is None:
+                continue
+            if ticket.get('draw_id') not in collected['ticket_draws']:
+                changes['tickets'].append(ticket)
+            if ticket.get('draw_id') is not None:
+                ticket_draws.add(ticket['draw_id'])
+        
+        sales = self.storage.get_draw_sales() if ids['draws'] or ticket_draws else {}
+        for draw_id in sorted(ids['draws'] | ticket_draws):
+            draw = self.storage.get_draw(draw_id)
+            if draw is not None:
+                changes['draws'].append(self._with_sales(draw, sales))
+            elif draw_id in ids['draws']:
+                changes['deleted']['draws'].append(draw_id)
+        for package_id in sorted(ids['packages']):
+            package = self.storage.get_package(package_id)
+            if package is None:
+                changes['deleted']['packages'].append(package_id)
+            else:
+                changes['packages'].append(package)
+        return changes
+    
     def get_stats(self) -> Dict:
-        """Получить общую статистику"""
+        """Получить общую статистику (по счетчикам, без просмотра записей)"""
         try:
-            draws = self.get_all_draws()
-            packages = self.get_packages()
+            counters = self.storage.get_counters()
             
             stats = {
-                'total_draws': len(draws),
-                'active_draws': len([d for d in draws if not d.get('completed')]),
-                'completed_draws': len([d for d in draws if d.get('completed')]),
-                'total_packages': len(packages),
-                'current_balance': self.get_balance(),
-                **self.calculate_tickets_stats()
+                **counters,
+                'revenue': round(counters['revenue'], 2),
+                'prizes_paid': round(counters['prizes_paid'], 2),
+                'total_packages': len(self.get_packages()),
+                'current_balance': self.get_balance()
             }
             
             return stats
@@ -648,7 +920,9 @@ class LotteryService:
                 'current_balance': 0,
                 'total_tickets': 0,
                 'winning_tickets': 0,
-                'pending_tickets': 0
+                'pending_tickets': 0,
+                'revenue': 0,
+                'prizes_paid': 0
             }   
         
 # В models/lottery.py
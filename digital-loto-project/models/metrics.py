@@ -0,0 +1,353 @@
+"""
+Метрики приложения для /api/admin/metrics (текстовый формат Prometheus)
+
+Каждый процесс (воркер gunicorn) пишет значения своих метрик в свой файл
+METRICS_DIR/<pid>.db, отображенный в память (mmap): обновление - запись
+8 байт в память процесса без блокировок между процессами и без
+обращения к диску. Ответ /api/admin/metrics суммирует файлы всех
+процессов, поэтому любой воркер отдает значения всего приложения.
+
+Файл - заголовок (сигнатура и занятый объем) и записи: длина ключа,
+ключ (JSON [тип, метрика, метки]) с выравниванием до 8 байт и значение
+double. Новая запись сначала пишется целиком и только потом учитывается
+в занятом объеме, поэтому читающий процесс не видит недописанных записей.
+
+Счетчики и гистограммы завершившихся процессов продолжают суммироваться:
+при сборке файлы мертвых процессов сливаются в archive.db и удаляются.
+Показатели (gauge, например запросы в обработке) мертвых процессов
+отбрасываются.
+"""
+import fcntl
+import json
+import mmap
+import os
+import struct
+import logging
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Tuple
+from config import METRICS_DIR, METRICS_LATENCY_BUCKETS, METRICS_SETTLEMENT_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+# Метрики: имя -> (тип, описание, границы корзин для гистограмм)
+METRICS = {
+    'loto_http_requests_total': (
+        'counter', 'Обработанные HTTP запросы по обработчику, методу и коду ответа', None),
+    'loto_http_request_duration_seconds': (
+        'histogram', 'Длительность HTTP запросов (потоковых - до закрытия ответа) по обработчику и методу',
+        METRICS_LATENCY_BUCKETS),
+    'loto_http_requests_in_flight': (
+        'gauge', 'HTTP запросы в обработке по обработчику и методу', None),
+    'loto_tickets_sold_total': (
+        'counter', 'Проданные билеты (включая билеты пакетов)', None),
+    'loto_draws_settled_total': (
+        'counter', 'Проведенные розыгрыши по способу проведения (sync - в запросе, job - задачей)', None),
+    'loto_settlement_duration_seconds': (
+        'histogram', 'Длительность проведения розыгрыша с расчетом билетов', METRICS_SETTLEMENT_BUCKETS),
+    'loto_storage_loads_total': (
+        'counter', 'Вызовы DataManager.load_json по файлам (включая взятые из кэша)', None),
+    'loto_storage_reads_total': (
+        'counter', 'Чтения и разбор JSON файлов с диска (промахи кэша)', None),
+    'loto_storage_read_bytes_total': (
+        'counter', 'Прочитанные из JSON файлов байты', None),
+    'loto_storage_parse_seconds_total': (
+        'counter', 'Время разбора JSON файлов', None),
+    'loto_storage_writes_total': (
+        'counter', 'Записи файлов данных (replace - замена целиком, append - дозапись)', None),
+    'loto_storage_written_bytes_total': (
+        'counter', 'Записанные в файлы данных байты', None),
+    'loto_storage_serialize_seconds_total': (
+        'counter', 'Время кодирования JSON при записи файлов', None),
+    'loto_storage_fsync_seconds_total': (
+        'counter', 'Время fsync файлов данных и их каталогов', None),
+    'loto_storage_request_loads_total': (
+        'counter', 'Вызовы DataManager.load_json во время запросов по обработчику и файлу', None),
+}
+
+# Файл значений: сигнатура и занятый объем, затем записи
+_MAGIC = b'LMET'
+_HEADER = struct.Struct('<4sI')
+_KEY_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+_INITIAL_SIZE = 65536
+_ARCHIVE = 'archive.db'
+
+
+class _ValuesFile:
+    """Файл значений метрик одного процесса, отображенный в память"""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+        size = os.fstat(self._fd).st_size
+        if size < _INITIAL_SIZE:
+            os.ftruncate(self._fd, _INITIAL_SIZE)
+            size = _INITIAL_SIZE
+        self._map = mmap.mmap(self._fd, size)
+        self._positions: Dict[str, int] = {}
+
+        magic, used = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC:
+            _HEADER.pack_into(self._map, 0, _MAGIC, _HEADER.size)
+            return
+        # Файл остался от процесса с тем же PID: счетчики продолжаются, показатели обнуляются
+        for key, position, _ in _entries(self._map, used):
+            self._positions[key] = position
+            if key.startswith('["gauge"'):
+                _VALUE.pack_into(self._map, position, 0.0)
+
+    def add(self, key: str, amount: float):
+        position = self._position(key)
+        _VALUE.pack_into(self._map, position, _VALUE.unpack_from(self._map, position)[0] + amount)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+    def _position(self, key: str) -> int:
+        """Смещение значения ключа (новый ключ дописывается в конец)"""
+        position = self._positions.get(key)
+        if position is not None:
+            return position
+
+        encoded = key.encode('utf-8')
+        padded = len(encoded) + (-(_KEY_LENGTH.size + len(encoded)) % 8)
+        used = _HEADER.unpack_from(self._map, 0)[1]
+        needed = used + _KEY_LENGTH.size + padded + _VALUE.size
+        if needed > len(self._map):
+            size = len(self._map)
+            while size < needed:
+                size *= 2
+            os.ftruncate(self._fd, size)
+            self._map.resize(size)
+
+        _KEY_LENGTH.pack_into(self._map, used, len(encoded))
+        start = used + _KEY_LENGTH.size
+        self._map[start:start + padded] = encoded.ljust(padded, b' ')
+        position = start + padded
+        _VALUE.pack_into(self._map, position, 0.0)
+        # Запись учитывается только после того, как написана целиком
+        _HEADER.pack_into(self._map, 0, _MAGIC, position + _VALUE.size)
+        self._positions[key] = position
+        return position
+
+
+def _entries(data, used: int) -> Iterator[Tuple[str, int, float]]:
+    """Записи файла значений: ключ, смещение значения и значение"""
+    position = _HEADER.size
+    while position + _KEY_LENGTH.size <= used:
+        length = _KEY_LENGTH.unpack_from(data, position)[0]
+        start = position + _KEY_LENGTH.size
+        padded = length + (-(_KEY_LENGTH.size + length) % 8)
+        value_position = start + padded
+        if value_position + _VALUE.size > used:
+            return
+        key = bytes(data[start:start + length]).decode('utf-8')
+        yield key, value_position, _VALUE.unpack_from(data, value_position)[0]
+        position = value_position + _VALUE.size
+
+
+def _read_values(filename: str) -> List[Tuple[str, float]]:
+    """Ключи и значения файла другого процесса (без отображения в память)"""
+    with open(filename, 'rb') as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return []
+        magic, used = _HEADER.unpack(header)
+        if magic != _MAGIC:
+            return []
+        data = header + f.read(used - _HEADER.size)
+    return [(key, value) for key, _, value in _entries(data, min(used, len(data)))]
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Metrics:
+    """Метрики процесса, общие с другими процессами через каталог файлов"""
+
+    def __init__(self, directory: str = METRICS_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._file: Optional[_ValuesFile] = None
+        self._pid = None
+        # Ключи файла по (тип, метрика, метки): JSON ключа не строится при каждом обновлении
+        self._keys: Dict[Tuple, str] = {}
+
+    # ========= ЗАПИСЬ =========
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Увеличить счетчик"""
+        self._add(self._key('counter', name, labels), amount)
+
+    def gauge_add(self, name: str, amount: float, **labels):
+        """Изменить показатель на amount (например, +1 в начале запроса и -1 в конце)"""
+        self._add(self._key('gauge', name, labels), amount)
+
+    def observe(self, name: str, value: float, **labels):
+        """Добавить наблюдение в гистограмму (корзины - из METRICS)"""
+        buckets = METRICS[name][2]
+        index = bisect_left(buckets, value)
+        le = _format_value(buckets[index]) if index < len(buckets) else '+Inf'
+        # В файле - число наблюдений каждой корзины; накопленные суммы считаются при выдаче
+        self._add(self._key('counter', f"{name}_bucket", {**labels, 'le': le}), 1)
+        self._add(self._key('counter', f"{name}_sum", labels), value)
+        self._add(self._key('counter', f"{name}_count", labels), 1)
+
+    # ========= ВЫДАЧА =========
+
+    def collect(self) -> Dict[Tuple, float]:
+        """Значения всех процессов: (метрика, метки) -> сумма
+
+        Сборка идет под блокировкой каталога: файлы завершившихся процессов
+        сливаются в archive.db (без показателей) и удаляются.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        totals: Dict[Tuple, float] = defaultdict(float)
+        fd = os.open(os.path.join(self.directory, '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            archive: Dict[str, float] = defaultdict(float)
+            dead = []
+            for name in sorted(os.listdir(self.directory)):
+                if not name.endswith('.db'):
+                    continue
+                filename = os.path.join(self.directory, name)
+                stem = name[:-len('.db')]
+                alive = name == _ARCHIVE or not stem.isdigit() or _process_alive(int(stem))
+                try:
+                    values = _read_values(filename)
+                except FileNotFoundError:
+                    continue
+                for key, value in values:
+                    kind, metric, labels = json.loads(key)
+                    if kind == 'gauge' and not alive:
+                        continue
+                    totals[(metric, tuple(map(tuple, labels)))] += value
+                    if name == _ARCHIVE or not alive:
+                        archive[key] += value
+                if not alive:
+                    dead.append(filename)
+            if dead:
+                self._write_archive(archive)
+                for filename in dead:
+                    os.remove(filename)
+                logger.info(f"Метрики завершившихся процессов перенесены в архив: {len(dead)}")
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        return totals
+
+    def exposition(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        totals = self.collect()
+        series: Dict[str, List[Tuple[Tuple, float]]] = defaultdict(list)
+        for (metric, labels), value in totals.items():
+            series[metric].append((labels, value))
+
+        lines = []
+        for name, (kind, description, buckets) in METRICS.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind != 'histogram':
+                for labels, value in sorted(series.get(name, [])):
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+
+            counts: Dict[Tuple, Dict[str, float]] = defaultdict(dict)
+            for labels, value in series.get(f"{name}_bucket", []):
+                le = dict(labels)['le']
+                counts[tuple(label for label in labels if label[0] != 'le')][le] = value
+            sums = dict(series.get(f"{name}_sum", []))
+            for labels, value in sorted(series.get(f"{name}_count", [])):
+                cumulative = 0.0
+                for le in [_format_value(bound) for bound in buckets] + ['+Inf']:
+                    cumulative += counts[labels].get(le, 0.0)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {_format_value(cumulative)}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(sums.get(labels, 0.0))}")
+                lines.append(f"{name}_count{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    # ========= ВНУТРЕННЕЕ =========
+
+    def _key(self, kind: str, name: str, labels: Dict) -> str:
+        cache_key = (kind, name, tuple(sorted(labels.items())))
+        key = self._keys.get(cache_key)
+        if key is None:
+            key = self._keys[cache_key] = _key(kind, name, labels)
+        return key
+
+    def _add(self, key: str, amount: float):
+        try:
+            with self._lock:
+                if self._file is None or self._pid != os.getpid():
+                    self._open()
+                self._file.add(key, amount)
+        except Exception as e:
+            # Метрики не должны мешать обработке запросов
+            logger.error(f"Ошибка записи метрики {key}: {e}")
+
+    def _open(self):
+        """Открыть файл значений процесса (после fork - свой файл)"""
+        os.makedirs(self.directory, exist_ok=True)
+        values_file = _ValuesFile(os.path.join(self.directory, f"{os.getpid()}.db"))
+        if self._file is not None:
+            # Унаследованное отображение закрывается только в этом процессе
+            self._file.close()
+        self._file, self._pid = values_file, os.getpid()
+
+    def _write_archive(self, values: Dict[str, float]):
+        """Записать архив значений завершившихся процессов (заменой файла)"""
+        filename = os.path.join(self.directory, _ARCHIVE)
+        temp_name = f"{filename}.tmp"
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        archive = _ValuesFile(temp_name)
+        try:
+            for key, value in values.items():
+                archive.add(key, value)
+        finally:
+            archive.close()
+        os.replace(temp_name, filename)
+
+
+def _key(kind: str, name: str, labels: Dict) -> str:
+    return json.dumps([kind, name, sorted((key, str(value)) for key, value in labels.items())],
+                      ensure_ascii=False, separators=(',', ':'))
+
+
+def _format_labels(labels: Tuple) -> str:
+    if not labels:
+        return ''
+    escaped = (
+        f'{key}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+_metrics: Optional[Metrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    """Общие для процесса метрики"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics()
+        return _metrics
@@ -0,0 +1,402 @@
+"""
+Репозитории записей со вторичными индексами
+
+IndexedCollection хранит записи по ID и вторичные индексы
+{ключ: {ID записи: None}} (словарь как упорядоченное множество: порядок
+добавления сохраняется, удаление за O(1)). Индексы обновляются на каждом
+изменении записи, поэтому выборки по ключу не просматривают все записи.
+Коллекция также держит ID по возрастанию для постраничных выборок с
+курсором (find_page): страница не зависит от числа записей перед ней.
+
+JsonRepository - коллекция, синхронизированная с JSON файлом (розыгрыши,
+пакеты): файл перечитывается только при изменении его сигнатуры, а
+изменения записываются под исключительной блокировкой ресурса.
+"""
+import logging
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from operator import methodcaller
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from models.data_manager import DataManager, _copy_json
+from utils.helpers import LotteryHelpers
+
+logger = logging.getLogger(__name__)
+
+
+def draw_type(draw: Dict) -> Optional[str]:
+    """Тип розыгрыша (в старых файлах он хранится в поле category)"""
+    return draw.get('type') or draw.get('category')
+
+
+def ticket_state(ticket: Dict) -> str:
+    """Состояние билета для пользователя (у билетов без поля state - по сохраненным полям)"""
+    state = ticket.get('state')
+    if state is None:
+        matches = (ticket.get('matches') or 0) if ticket.get('status') == 'completed' else None
+        state = LotteryHelpers.ticket_state(bool(ticket.get('numbers')), matches)
+    return state
+
+
+class Index:
+    """Вторичный индекс по полям записи
+
+    fields - поля, от которых зависит ключ (изменение других полей индекс
+    не затрагивает); key - функция ключа, по умолчанию значение первого поля.
+    """
+
+    __slots__ = ('fields', 'key_of', 'buckets')
+
+    # Больше корзин - общие изменения переносят записи по одной
+    BULK_MAX_BUCKETS = 16
+
+    def __init__(self, *fields: str, key: Optional[Callable[[Dict], Any]] = None):
+        self.fields = fields
+        self.key_of = key or methodcaller('get', fields[0])
+        self.buckets: Dict[Any, Dict[int, None]] = {}
+
+    def add(self, record_id: int, key: Any):
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = {}
+        bucket[record_id] = None
+
+    def discard(self, record_id: int, key: Any):
+        bucket = self.buckets.get(key)
+        if bucket is not None:
+            bucket.pop(record_id, None)
+            if not bucket:
+                del self.buckets[key]
+
+    def move(self, record_id: int, old_key: Any, new_key: Any):
+        if old_key != new_key:
+            self.discard(record_id, old_key)
+            self.add(record_id, new_key)
+
+    def move_many(self, record_ids: Dict[int, None], new_key: Any) -> bool:
+        """Перенести записи под общий ключ new_key (False - корзин слишком много)
+
+        Ключи записей до изменения не пересчитываются: записи ищутся
+        пересечением с каждой корзиной индекса, что дешево при малом числе
+        корзин (статусы, призы). Расчет розыгрыша так переводит билеты из
+        pending в completed пачками по сотни тысяч.
+        """
+        if len(self.buckets) > self.BULK_MAX_BUCKETS:
+            return False
+        for key, bucket in list(self.buckets.items()):
+            if key == new_key:
+                continue
+            common = bucket.keys() & record_ids.keys()
+            if len(common) == len(bucket):
+                del self.buckets[key]
+            else:
+                for record_id in common:
+                    del bucket[record_id]
+
+        target = self.buckets.get(new_key)
+        if target is None:
+            self.buckets[new_key] = dict(record_ids)
+        else:
+            target.update(record_ids)
+        return True
+
+
+class IndexedCollection:
+    """Записи по ID со вторичными индексами (без копирования и без блокировок)"""
+
+    # Кандидатов из корзин меньше этой доли записей - они сортируются,
+    # иначе страница набирается проходом по всем ID от курсора
+    PAGE_SORT_SHARE = 8
+
+    def __init__(self, **indexes: Index):
+        self.indexes = indexes
+        self._records: Dict[int, Dict] = {}
+        # ID записей по возрастанию
+        self._order = array('q')
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, record_id: int) -> bool:
+        return record_id in self._records
+
+    def load(self, records: Iterable[Dict]):
+        """Заменить все записи и построить индексы заново"""
+        self._records = {record['id']: record for record in records}
+        self._order = array('q', sorted(self._records))
+        for index in self.indexes.values():
+            index.buckets = {}
+            buckets = index.buckets
+            for record_id, key in zip(self._records, map(index.key_of, self._records.values())):
+                bucket = buckets.get(key)
+                if bucket is None:
+                    bucket = buckets[key] = {}
+                bucket[record_id] = None
+
+    # ========= ЧТЕНИЕ =========
+
+    def get(self, record_id: int) -> Optional[Dict]:
+        return self._records.get(record_id)
+
+    def values(self) -> Iterable[Dict]:
+        return self._records.values()
+
+    def max_id(self) -> int:
+        return max(self._records, default=0)
+
+    def ids(self, index: str, key: Any) -> List[int]:
+        """ID записей с ключом key в индексе (в порядке добавления)"""
+        return list(self.indexes[index].buckets.get(key, ()))
+
+    def _matching_ids(self, criteria: Dict[str, Any]) -> Iterable[int]:
+        """ID записей, у которых ключи индексов равны criteria
+
+        Перебирается самая маленькая из подходящих корзин индексов,
+        остальные условия проверяются по ней.
+        """
+        if not criteria:
+            return self._records.keys()
+        buckets = sorted(
+            (self.indexes[name].buckets.get(key, {}) for name, key in criteria.items()), key=len
+        )
+        smallest, others = buckets[0], buckets[1:]
+        if not others:
+            return smallest.keys()
+        return [record_id for record_id in smallest if all(record_id in bucket for bucket in others)]
+
+    def find(self, **criteria: Any) -> List[Dict]:
+        """Записи по ключам индексов (без условий - все записи)"""
+        records = self._records
+        return [records[record_id] for record_id in self._matching_ids(criteria)]
+
+    def count(self, **criteria: Any) -> int:
+        """Количество записей по ключам индексов"""
+        return len(self._matching_ids(criteria))
+
+    def counts(self, index: str) -> Dict[Any, int]:
+        """Количество записей по каждому ключу индекса"""
+        return {key: len(bucket) for key, bucket in self.indexes[index].buckets.items()}
+
+    def find_page(self, alternatives: List[Dict[str, Any]], after: int = 0, limit: int = 50) -> List[Dict]:
+        """Записи с ID больше after по возрастанию ID, не больше limit
+
+        alternatives - варианты условий по ключам индексов: запись подходит,
+        если подходит под любой вариант ({} - любая запись). Кандидаты берутся
+        из самых маленьких корзин вариантов, если их немного, иначе из общего
+        порядка ID; в обоих случаях начало страницы ищется двоичным поиском.
+        """
+        groups = []
+        for criteria in alternatives:
+            buckets = sorted(
+                (self.indexes[name].buckets.get(key, {}) for name, key in criteria.items()), key=len
+            )
+            if not buckets or buckets[0]:
+                groups.append(buckets)
+        if not groups:
+            return []
+
+        ids = self._order
+        if all(groups):
+            candidates = sum(len(buckets[0]) for buckets in groups)
+            if candidates * self.PAGE_SORT_SHARE < len(self._order):
+                ids = sorted(set().union(*(buckets[0] for buckets in groups)))
+
+        records = self._records
+        page = []
+        for position in range(bisect_right(ids, after), len(ids)):
+            record_id = ids[position]
+            if any(all(record_id in bucket for bucket in buckets) for buckets in groups):
+                page.append(records[record_id])
+                if len(page) >= limit:
+                    break
+        return page
+
+    # ========= ИЗМЕНЕНИЕ =========
+
+    def put(self, record: Dict):
+        """Добавить или заменить запись"""
+        record_id = record['id']
+        old = self._records.get(record_id)
+        self._records[record_id] = record
+        if old is None:
+            order = self._order
+            if not order or record_id > order[-1]:
+                order.append(record_id)
+            else:
+                insort(order, record_id)
+        for index in self.indexes.values():
+            if old is None:
+                index.add(record_id, index.key_of(record))
+            else:
+                index.move(record_id, index.key_of(old), index.key_of(record))
+
+    def update(self, record_id: int, fields: Dict) -> Optional[Dict]:
+        """Изменить поля записи (None, если записи нет)"""
+        updated = self.update_many([record_id], fields)
+        return updated[0] if updated else None
+
+    def update_many(self, record_ids: Iterable[int], fields: Dict) -> List[Dict]:
+        """Применить общие изменения к записям; возвращает измененные записи"""
+        records = self._records
+        ids = {record_id: None for record_id in record_ids if record_id in records}
+        updated = list(map(records.__getitem__, ids))
+        touched = [index for index in self.indexes.values()
+                   if any(field in fields for field in index.fields)]
+
+        # Если fields задает все поля индекса, новый ключ один для всех записей;
+        # для остальных индексов старые ключи запоминаются до изменения
+        per_record = []
+        for index in touched:
+            if not (all(field in fields for field in index.fields)
+                    and index.move_many(ids, index.key_of(fields))):
+                per_record.append((index, list(map(index.key_of, updated))))
+
+        for record in updated:
+            record.update(fields)
+
+        for index, old_keys in per_record:
+            for record_id, old_key, record in zip(ids, old_keys, updated):
+                index.move(record_id, old_key, index.key_of(record))
+        return updated
+
+    def remove(self, record_id: int) -> Optional[Dict]:
+        """Удалить запись (None, если записи нет)"""
+        record = self._records.pop(record_id, None)
+        if record is not None:
+            del self._order[bisect_left(self._order, record_id)]
+            for index in self.indexes.values():
+                index.discard(record_id, index.key_of(record))
+        return record
+
+
+class JsonRepository:
+    """Записи JSON файла с индексами в памяти процесса
+
+    Файл хранит либо список записей, либо словарь {list_key: [...]} с
+    дополнительными полями - форма файла при записи сохраняется. Читатели
+    получают копии записей. Изменения делаются под исключительной
+    блокировкой resource: состояние сверяется с файлом, меняется запись
+    и ее индексы, файл сохраняется целиком.
+    """
+
+    def __init__(self, filename: str, resource: str, list_key: str, **indexes: Index):
+        self.filename = filename
+        self.resource = resource
+        self.list_key = list_key
+        self.records = IndexedCollection(**indexes)
+
+        self._lock = threading.RLock()
+        self._container: Any = None
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._loaded = False
+
+    # ========= ЧТЕНИЕ =========
+
+    def get(self, record_id: int) -> Optional[Dict]:
+        """Запись по ID (копия)"""
+        with self._lock:
+            self._refresh()
+            record = self.records.get(record_id)
+            return _copy_json(record) if record is not None else None
+
+    def get_all(self) -> List[Dict]:
+        """Все записи в порядке файла (копии)"""
+        with self._lock:
+            self._refresh()
+            return [_copy_json(record) for record in self.records.values()]
+
+    def find(self, **criteria: Any) -> List[Dict]:
+        """Записи по ключам индексов (копии)"""
+        with self._lock:
+            self._refresh()
+            return [_copy_json(record) for record in self.records.find(**criteria)]
+
+    def count(self, **criteria: Any) -> int:
+        with self._lock:
+            self._refresh()
+            return self.records.count(**criteria)
+
+    def counts(self, index: str) -> Dict[Any, int]:
+        with self._lock:
+            self._refresh()
+            return self.records.counts(index)
+
+    def reload(self):
+        """Перечитать файл и построить индексы заново"""
+        with self._lock:
+            self._loaded = False
+            self._refresh()
+
+    def max_id(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self.records.max_id()
+
+    # ========= ИЗМЕНЕНИЕ =========
+
+    def add(self, record: Dict, allocate_id: Optional[Callable[[Callable[[], int]], int]] = None) -> Optional[Dict]:
+        """Добавить запись; allocate_id(floor) назначает ID новой записи"""
+        with DataManager.transaction(self.resource), self._lock:
+            self._refresh()
+            if allocate_id is not None:
+                record['id'] = allocate_id(self.records.max_id)
+            self.records.put(_copy_json(record))
+            return record if self._save() else None
+
+    def update(self, record_id: int, fields: Dict) -> Optional[Dict]:
+        """Изменить поля записи (None, если записи нет)"""
+        with DataManager.transaction(self.resource), self._lock:
+            self._refresh()
+            record = self.records.update(record_id, _copy_json(fields))
+            if record is None:
+                return None
+            return _copy_json(record) if self._save() else None
+
+    def remove(self, record_id: int) -> bool:
+        """Удалить запись (False, если записи нет)"""
+        with DataManager.transaction(self.resource), self._lock:
+            self._refresh()
+            if self.records.remove(record_id) is None:
+                return False
+            return self._save()
+
+    # ========= ВНУТРЕННЕЕ =========
+
+    def _refresh(self):
+        """Перечитать файл, если его изменил другой процесс"""
+        try:
+            signature = DataManager._file_signature(self.filename)
+        except FileNotFoundError:
+            signature = None
+        if self._loaded and signature == self._signature:
+            return
+
+        data = DataManager.load_json(self.filename, copy=True) if signature is not None else {}
+        if isinstance(data, list):
+            self._container, records = data, data
+        elif isinstance(data, dict):
+            self._container, records = data, data.get(self.list_key, [])
+        else:
+            logger.warning(f"Неожиданный формат данных {self.filename}: {type(data)}")
+            self._container, records = {}, []
+
+        self.records.load(record for record in records if isinstance(record, dict) and 'id' in record)
+        self._signature = signature
+        self._loaded = True
+
+    def _save(self) -> bool:
+        """Сохранить все записи в файл (вызывается под блокировкой ресурса)"""
+        records = list(self.records.values())
+        if isinstance(self._container, list):
+            data = records
+        else:
+            data = dict(self._container)
+            data[self.list_key] = records
+
+        if not DataManager.save_json(self.filename, data):
+            # Состояние в памяти разошлось с файлом - перечитываем его
+            self._loaded = False
+            return False
+        self._container = data
+        self._signature = DataManager._file_signature(self.filename)
+        return True
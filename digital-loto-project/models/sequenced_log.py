@@ -0,0 +1,191 @@
+"""
+Общий для процессов журнал записей с возрастающими номерами
+
+Записи - строки JSON в файле; номер (поле id) назначается под
+межпроцессной блокировкой и растет через все процессы. Заполненный файл
+(max_bytes) переименовывается в <файл>.1, прежний .1 удаляется, поэтому
+хранятся последние от max_bytes до 2 * max_bytes записей.
+
+Записи идут по возрастанию номера, и чтение после номера ищет начало
+двоичным поиском по смещениям файла, а не просмотром всего журнала.
+Номер последней записи хранится в памяти вместе с inode и размером
+файла: пока файл тот же, читаются только дописанные после этого байты.
+Используется событиями /api/events (models/events.py) и журналом
+изменений /api/admin/changes (models/changes.py).
+"""
+import json
+import os
+import logging
+from typing import Dict, List, Optional
+from models.data_manager import DataManager
+
+logger = logging.getLogger(__name__)
+
+# Сколько байт с конца файла читается в поисках номера последней записи
+_TAIL_BYTES = 65536
+
+
+class SequencedLog:
+    """Журнал записей с номерами, общий для процессов"""
+
+    def __init__(self, filename: str, lock_name: str, max_bytes: int):
+        self.filename = filename
+        self.lock_name = lock_name
+        self.max_bytes = max_bytes
+        # Известный номер последней записи: (inode, размер файла, номер)
+        self._last: Optional[tuple] = None
+
+    @property
+    def files(self) -> tuple:
+        """Файлы журнала от старых записей к новым"""
+        return f"{self.filename}.1", self.filename
+
+    def append(self, records: List[Dict]) -> List[Dict]:
+        """Дописать записи, назначив им номера; возвращает записи с полем id
+
+        Без fsync: журнал нужен для синхронизации клиентов, а не для
+        восстановления данных.
+        """
+        with DataManager.lock(self.lock_name):
+            next_id = self.last_id() + 1
+            numbered = [{'id': next_id + position, **record} for position, record in enumerate(records)]
+            self._rotate_if_full()
+            payload = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in numbered)
+            fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, payload.encode('utf-8'))
+                stat = os.fstat(fd)
+                self._last = (stat.st_ino, stat.st_size, numbered[-1]['id'])
+            finally:
+                os.close(fd)
+        return numbered
+
+    def last_id(self) -> int:
+        """Номер последней записи (0 - журнал пуст)
+
+        Пока файл журнала тот же (inode) и не уменьшился, читается только
+        дописанный после известного номера хвост; иначе номер ищется с
+        конца файлов заново.
+        """
+        cached = self._last
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            stat = None
+        if cached is not None and stat is not None and stat.st_ino == cached[0] and stat.st_size >= cached[1]:
+            if stat.st_size == cached[1]:
+                return cached[2]
+            last_id, end = self._last_in_file(self.filename, cached[1])
+            if last_id is not None:
+                self._last = (stat.st_ino, end, last_id)
+                return last_id
+            return cached[2]
+
+        for filename in reversed(self.files):
+            try:
+                last_id, end = self._last_in_file(filename)
+            except FileNotFoundError:
+                continue
+            if last_id is not None:
+                if filename == self.filename and stat is not None:
+                    self._last = (stat.st_ino, end, last_id)
+                return last_id
+        return 0
+
+    @staticmethod
+    def _last_in_file(filename: str, start: Optional[int] = None) -> tuple:
+        """Номер последней целой записи после смещения start (без start - в
+        последних _TAIL_BYTES байтах) и конец прочитанных целых строк;
+        (None, None) - записи нет"""
+        with open(filename, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            position = max(0, size - _TAIL_BYTES) if start is None else start
+            f.seek(position)
+            data = f.read()
+        # Неполная последняя строка (запись в процессе) не входит в прочитанное
+        complete = data.rfind(b'\n') + 1
+        for line in reversed(data[:complete].splitlines()):
+            record = parse_record(line)
+            if record is not None:
+                return record['id'], position + complete
+        return None, None
+
+    def first_id(self) -> Optional[int]:
+        """Номер самой старой хранящейся записи (None - журнал пуст)"""
+        for filename in self.files:
+            try:
+                with open(filename, 'rb') as f:
+                    for line in f:
+                        record = parse_record(line)
+                        if record is not None:
+                            return record['id']
+            except FileNotFoundError:
+                continue
+        return None
+
+    def read_since(self, after_id: int, limit: Optional[int] = None) -> List[Dict]:
+        """Записи с номером больше after_id по возрастанию (не больше limit)"""
+        records: List[Dict] = []
+        for filename in self.files:
+            try:
+                with open(filename, 'rb') as f:
+                    f.seek(self._offset_after(f, after_id))
+                    for line in f:
+                        record = parse_record(line)
+                        if record is None or record['id'] <= after_id:
+                            continue
+                        records.append(record)
+                        if limit is not None and len(records) >= limit:
+                            return records
+            except FileNotFoundError:
+                continue
+        return records
+
+    # ========= ВНУТРЕННЕЕ =========
+
+    @staticmethod
+    def _offset_after(f, after_id: int) -> int:
+        """Начало первой строки с номером больше after_id (двоичный поиск по смещениям)"""
+        def record_from(position: int):
+            """Начало и запись первой целой строки, начинающейся не раньше position"""
+            if position:
+                f.seek(position - 1)
+                f.readline()
+            else:
+                f.seek(0)
+            while True:
+                start = f.tell()
+                line = f.readline()
+                if not line:
+                    return start, None
+                record = parse_record(line)
+                if record is not None:
+                    return start, record
+
+        low, high = 0, f.seek(0, os.SEEK_END)
+        while low < high:
+            middle = (low + high) // 2
+            _, record = record_from(middle)
+            if record is not None and record['id'] <= after_id:
+                low = middle + 1
+            else:
+                high = middle
+        return record_from(low)[0]
+
+    def _rotate_if_full(self):
+        """Переименовать заполненный файл в .1 (вызывается под блокировкой журнала)"""
+        try:
+            if os.path.getsize(self.filename) >= self.max_bytes:
+                os.replace(self.filename, f"{self.filename}.1")
+                logger.info(f"Журнал {self.filename} заполнен и перенесен в {self.filename}.1")
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+
+
+def parse_record(line) -> Optional[Dict]:
+    """Запись журнала из строки (None - неполная или поврежденная строка)"""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) and isinstance(record.get('id'), int) else None
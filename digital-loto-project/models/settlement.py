@@ -0,0 +1,168 @@
+"""
+Расчет результатов розыгрыша
+
+Билеты розыгрыша приходят упакованными массивами ID и битовых масок
+(см. utils/ticket_masks.py) и считаются частями: задача проведения
+розыгрыша (models/jobs.py) записывает результаты каждой части и
+сохраняет контрольную точку. Внутри части совпадения и приз считаются
+один раз на каждую различную комбинацию чисел и раздаются ее билетам.
+Если частей много, они считаются параллельно в ProcessPoolExecutor, но
+отдаются в порядке частей, поэтому итог совпадает с последовательным
+расчетом.
+
+Синхронное проведение (LotteryService.conduct_draw) считает розыгрыш
+целиком по индексу комбинаций ожидающих билетов (settle_combinations)
+и записывает результат одной записью; это эталон, с которым сверяется
+задача.
+
+Призовые уровни складываются из количеств билетов по совпадениям
+каждой части, без повторного расчета всего розыгрыша.
+"""
+import os
+import logging
+import threading
+import multiprocessing
+from array import array
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Collection, Dict, Iterator, List, Optional, Sequence, Tuple
+from utils.ticket_masks import group_by_matches, group_combinations_by_matches, numbers_to_mask
+from utils.helpers import LotteryHelpers
+from config import SETTLEMENT_WORKERS, SETTLEMENT_PARALLEL_MIN_TICKETS
+
+logger = logging.getLogger(__name__)
+
+# Частей в работе на один процесс пула: результаты не копятся в памяти,
+# пока записываются предыдущие части
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _worker_count() -> int:
+    """Количество процессов расчета (0 в настройках - по числу ядер)"""
+    return SETTLEMENT_WORKERS or os.cpu_count() or 1
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Общий пул процессов расчета (создается при первом большом розыгрыше)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: процессы gunicorn многопоточны, fork для них небезопасен
+            _executor = ProcessPoolExecutor(
+                max_workers=_worker_count(),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def settle_chunk(ticket_ids: array, masks: array, winning_mask: int) -> Dict[int, List[int]]:
+    """Расчет одной части билетов (выполняется в процессе пула)
+
+    Совпадения считаются один раз на каждую различную комбинацию части и
+    раздаются ID ее билетов.
+    """
+    return group_by_matches(ticket_ids, masks, winning_mask)
+
+
+def iter_settled_chunks(ticket_ids: Sequence[int], masks: Sequence[int], winning_numbers: List[int],
+                        chunk_size: int, skip: Collection[int] = ()) -> Iterator[Tuple[int, Dict[int, List[int]]]]:
+    """Номер и группы {совпадения: [ID билетов]} каждой части по chunk_size билетов
+
+    Части отдаются по возрастанию номера; части из skip (уже рассчитанные)
+    пропускаются.
+    """
+    winning_mask = numbers_to_mask(winning_numbers)
+    indexes = [index for index in range(-(-len(ticket_ids) // chunk_size)) if index not in skip]
+    remaining = sum(min(chunk_size, len(ticket_ids) - index * chunk_size) for index in indexes)
+
+    def part(index: int):
+        start = index * chunk_size
+        return ticket_ids[start:start + chunk_size], masks[start:start + chunk_size], winning_mask
+
+    return zip(indexes, _iter_ordered(settle_chunk, map(part, indexes), len(indexes), remaining))
+
+
+def settle_combinations(combinations: Dict[int, Sequence[int]], winning_numbers: List[int],
+                        chunk_size: int) -> Dict[int, List[int]]:
+    """Группы {совпадения: [ID билетов по возрастанию]} всего розыгрыша
+
+    combinations - индекс комбинаций ожидающих билетов {маска: ID
+    билетов}: совпадения считаются один раз на комбинацию. Комбинации
+    делятся на части примерно по chunk_size билетов, большие розыгрыши
+    считаются в пуле процессов; части не пересекаются, поэтому итог
+    совпадает с последовательным расчетом.
+    """
+    winning_mask = numbers_to_mask(winning_numbers)
+    parts: List[Tuple[Dict[int, Sequence[int]], int]] = []
+    part: Dict[int, Sequence[int]] = {}
+    part_tickets = tickets = 0
+    for mask, ids in combinations.items():
+        part[mask] = ids
+        part_tickets += len(ids)
+        if part_tickets >= chunk_size:
+            parts.append((part, winning_mask))
+            tickets += part_tickets
+            part, part_tickets = {}, 0
+    if part:
+        parts.append((part, winning_mask))
+        tickets += part_tickets
+
+    groups: Dict[int, List[int]] = {}
+    for part_groups in _iter_ordered(group_combinations_by_matches, iter(parts), len(parts), tickets):
+        for matches, ids in part_groups.items():
+            group = groups.get(matches)
+            if group is None:
+                group = groups[matches] = []
+            group.extend(ids)
+    for group in groups.values():
+        group.sort()
+    return dict(sorted(groups.items()))
+
+
+def _iter_ordered(task: Callable, parts: Iterator[Tuple], parts_count: int, tickets: int) -> Iterator:
+    """Результаты task(*part) по порядку частей
+
+    Если процессов больше одного, частей несколько и билетов не меньше
+    SETTLEMENT_PARALLEL_MIN_TICKETS, части считаются в пуле процессов,
+    иначе - в текущем процессе.
+    """
+    workers = _worker_count()
+    if workers < 2 or parts_count < 2 or tickets < SETTLEMENT_PARALLEL_MIN_TICKETS:
+        for part in parts:
+            yield task(*part)
+        return
+
+    logger.info(f"Параллельный расчет {tickets} билетов: {parts_count} частей, {workers} процессов")
+    executor = _get_executor()
+    in_flight = deque(executor.submit(task, *part) for part in islice(parts, workers * CHUNKS_IN_FLIGHT_PER_WORKER))
+    try:
+        while in_flight:
+            result = in_flight.popleft().result()
+            part = next(parts, None)
+            if part is not None:
+                in_flight.append(executor.submit(task, *part))
+            yield result
+    finally:
+        # Расчет прерван (ошибка записи части): оставшиеся части не нужны
+        for future in in_flight:
+            future.cancel()
+
+
+def settlement_tiers(match_counts: Dict[int, int], draw_type: str) -> List[Dict]:
+    """Призовые уровни [{'matches', 'winners', 'prize', 'payout'}] по количествам
+    билетов {совпадения: билетов} (уровни без приза не включаются)"""
+    tiers = []
+    for matches, winners in sorted(match_counts.items()):
+        prize = LotteryHelpers.calculate_prize(matches, draw_type)
+        if prize > 0 and winners > 0:
+            tiers.append({
+                'matches': matches,
+                'winners': winners,
+                'prize': prize,
+                'payout': prize * winners
+            })
+    return tiers
@@ -0,0 +1,730 @@
+"""
+Хранилище лотереи в SQLite
+
+Запись хранится целиком в колонке data (JSON), а поля, по которым идут
+выборки (розыгрыш билета, статус, приз, тип розыгрыша), продублированы в
+отдельных колонках с индексами. База работает в режиме WAL, поэтому
+читатели не блокируют писателя. Счетчики статистики (таблица counters),
+продажи по розыгрышам (draw_sales) и счетчики групп страницы "Мои билеты"
+(ticket_groups) меняются в транзакции каждой записи.
+
+Перенос существующих данных из data/*.json:
+    python -m models.sqlite_storage migrate
+"""
+import json
+import os
+import sqlite3
+import logging
+import threading
+from array import array
+from collections import Counter
+from contextlib import contextmanager
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
+from models.id_allocator import get_id_allocator
+from models.repository import draw_type, ticket_state
+from models.stats import count_draw_sales, count_records
+from models.versions import PARTITIONS, get_versions
+from utils.ticket_masks import new_mask_array, numbers_to_mask
+from config import SQLITE_DB_FILE
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS draws (
+    id INTEGER PRIMARY KEY,
+    type TEXT,
+    completed INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_draws_type ON draws (type);
+CREATE INDEX IF NOT EXISTS idx_draws_completed ON draws (completed);
+
+CREATE TABLE IF NOT EXISTS tickets (
+    id INTEGER PRIMARY KEY,
+    draw_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    prize REAL NOT NULL DEFAULT 0,
+    numbers_mask INTEGER NOT NULL DEFAULT 0,
+    price REAL NOT NULL DEFAULT 0,
+    state TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_draw_id ON tickets (draw_id);
+CREATE INDEX IF NOT EXISTS idx_tickets_status ON tickets (status);
+CREATE INDEX IF NOT EXISTS idx_tickets_prize ON tickets (prize);
+CREATE INDEX IF NOT EXISTS idx_tickets_combination ON tickets (draw_id, status, numbers_mask);
+
+CREATE TABLE IF NOT EXISTS packages (
+    id INTEGER PRIMARY KEY,
+    category TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_packages_category ON packages (category);
+
+CREATE TABLE IF NOT EXISTS balance (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    balance REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS counters (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    total_draws INTEGER NOT NULL DEFAULT 0,
+    active_draws INTEGER NOT NULL DEFAULT 0,
+    completed_draws INTEGER NOT NULL DEFAULT 0,
+    total_tickets INTEGER NOT NULL DEFAULT 0,
+    winning_tickets INTEGER NOT NULL DEFAULT 0,
+    pending_tickets INTEGER NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0,
+    prizes_paid REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS draw_sales (
+    draw_id INTEGER PRIMARY KEY,
+    tickets_count INTEGER NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS ticket_groups (
+    draw_id INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    tickets_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (draw_id, state)
+);
+"""
+
+# Поля билета, от которых зависят счетчики статистики
+COUNTED_TICKET_FIELDS = {'status', 'prize', 'price'}
+
+# Состояние билета по сохраненным полям (как repository.ticket_state) - для
+# заполнения колонки state в базах, созданных до ее появления
+LEGACY_TICKET_STATE = """
+COALESCE(json_extract(data, '$.state'), CASE
+    WHEN numbers_mask = 0 THEN 'pending'
+    WHEN status != 'completed' THEN 'confirmed'
+    WHEN COALESCE(json_extract(data, '$.matches'), 0) > 0 THEN 'winning'
+    ELSE 'completed'
+END)
+"""
+
+# Пересчет счетчиков и продаж по розыгрышам по таблицам
+REBUILD_COUNTERS = """
+INSERT OR REPLACE INTO counters (id, total_draws, active_draws, completed_draws, total_tickets,
+                                 winning_tickets, pending_tickets, revenue, prizes_paid)
+SELECT 1,
+    (SELECT COUNT(*) FROM draws),
+    (SELECT COUNT(*) FROM draws WHERE completed = 0),
+    (SELECT COUNT(*) FROM draws WHERE completed != 0),
+    (SELECT COUNT(*) FROM tickets),
+    (SELECT COUNT(*) FROM tickets WHERE prize > 0),
+    (SELECT COUNT(*) FROM tickets WHERE status = 'pending'),
+    (SELECT COALESCE(SUM(price), 0) FROM tickets),
+    (SELECT COALESCE(SUM(prize), 0) FROM tickets);
+DELETE FROM draw_sales;
+INSERT INTO draw_sales (draw_id, tickets_count, revenue)
+SELECT draw_id, COUNT(*), TOTAL(price) FROM tickets GROUP BY draw_id;
+DELETE FROM ticket_groups;
+INSERT INTO ticket_groups (draw_id, state, tickets_count)
+SELECT draw_id, state, COUNT(*) FROM tickets GROUP BY draw_id, state;
+"""
+
+
+class SQLiteStorage:
+    """Хранилище в SQLite с тем же интерфейсом, что и JsonStorage"""
+
+    def __init__(self, db_file: str = SQLITE_DB_FILE):
+        self.db_file = db_file
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+        self._upgrade_schema()
+        conn = self._connection()
+        has_tickets = conn.execute('SELECT 1 FROM tickets LIMIT 1').fetchone() is not None
+        if (conn.execute('SELECT 1 FROM counters WHERE id = 1').fetchone() is None
+                or (has_tickets and any(conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone() is None
+                                        for table in ('draw_sales', 'ticket_groups')))):
+            self.rebuild_counters()
+
+    def _upgrade_schema(self):
+        """Добавить колонки, появившиеся после создания базы"""
+        conn = self._connection()
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(tickets)')}
+        if 'numbers_mask' not in columns:
+            with self._transaction() as conn:
+                conn.execute('ALTER TABLE tickets ADD COLUMN numbers_mask INTEGER NOT NULL DEFAULT 0')
+                rows = conn.execute('SELECT id, data FROM tickets').fetchall()
+                conn.executemany(
+                    'UPDATE tickets SET numbers_mask = ? WHERE id = ?',
+                    [(numbers_to_mask(json.loads(data).get('numbers', [])), ticket_id) for ticket_id, data in rows]
+                )
+            logger.info("В таблицу tickets добавлена колонка numbers_mask")
+        if 'price' not in columns:
+            with self._transaction() as conn:
+                conn.execute('ALTER TABLE tickets ADD COLUMN price REAL NOT NULL DEFAULT 0')
+                conn.execute("UPDATE tickets SET price = COALESCE(json_extract(data, '$.price'), 0)")
+            logger.info("В таблицу tickets добавлена колонка price")
+        if 'state' not in columns:
+            with self._transaction() as conn:
+                conn.execute('ALTER TABLE tickets ADD COLUMN state TEXT')
+                conn.execute(f'UPDATE tickets SET state = {LEGACY_TICKET_STATE}')
+            logger.info("В таблицу tickets добавлена колонка state")
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_tickets_state ON tickets (state)')
+
+    # ========= СОЕДИНЕНИЕ =========
+
+    def _connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_file) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def _transaction(self, *partitions: str):
+        """Транзакция записи; вложенные вызовы входят во внешнюю транзакцию
+        
+        partitions - части данных (models/versions.py), которые меняет
+        транзакция; их версии увеличиваются после COMMIT внешней транзакции.
+        """
+        conn = self._connection()
+        if self._local.depth:
+            self._local.depth += 1
+            self._local.partitions.update(partitions)
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn.execute('BEGIN IMMEDIATE')
+        self._local.depth = 1
+        self._local.partitions = set(partitions)
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            self._local.depth = 0
+        if self._local.partitions:
+            get_versions().bump(*self._local.partitions)
+
+    @contextmanager
+    def transaction(self, *resources: str):
+        """Транзакция (BEGIN IMMEDIATE блокирует запись во всю базу)
+        
+        Версии увеличиваются по частям данных, которые изменили методы
+        записи внутри транзакции, а не по всем перечисленным ресурсам.
+        """
+        with self._transaction():
+            yield
+
+    def _max_id(self, table: str) -> int:
+        """Наибольший ID в таблице (по первичному ключу, без сканирования)"""
+        return self._connection().execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+
+    def _query(self, sql: str, params=()) -> List[Dict]:
+        """Выборка записей из колонки data"""
+        rows = self._connection().execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    @staticmethod
+    def _where(**columns) -> Tuple[str, tuple]:
+        """Условие WHERE по равенству индексированных колонок (None - без условия)"""
+        conditions = {column: value for column, value in columns.items() if value is not None}
+        if not conditions:
+            return '', ()
+        return ' WHERE ' + ' AND '.join(f'{column} = ?' for column in conditions), tuple(conditions.values())
+
+    def _select(self, table: str, **columns) -> List[Dict]:
+        """Записи таблицы по индексированным колонкам, по возрастанию ID"""
+        where, params = self._where(**columns)
+        return self._query(f'SELECT data FROM {table}{where} ORDER BY id', params)
+
+    # ========= РОЗЫГРЫШИ =========
+
+    def get_draws(self, draw_type: Optional[str] = None, completed: Optional[bool] = None) -> List[Dict]:
+        """Все розыгрыши или выборка по типу и статусу (по индексам)"""
+        return self._select('draws', type=draw_type,
+                            completed=None if completed is None else int(bool(completed)))
+
+    def get_draw(self, draw_id: int) -> Optional[Dict]:
+        """Розыгрыш по ID"""
+        rows = self._query('SELECT data FROM draws WHERE id = ?', (draw_id,))
+        return rows[0] if rows else None
+
+    def _write_draw(self, conn: sqlite3.Connection, draw: Dict):
+        # UPSERT, а не INSERT OR REPLACE: замена удаляет строку без триггера удаления
+        conn.execute(
+            'INSERT INTO draws (id, type, completed, data) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (id) DO UPDATE SET type = excluded.type, completed = excluded.completed, '
+            'data = excluded.data',
+            (draw['id'], draw_type(draw), int(bool(draw.get('completed'))),
+             json.dumps(draw, ensure_ascii=False))
+        )
+
+    def add_draw(self, draw: Dict) -> Optional[Dict]:
+        """Добавить розыгрыш, ID назначается хранилищем"""
+        with self._transaction('draws') as conn:
+            draw['id'] = get_id_allocator().allocate('draws', floor=lambda: self._max_id('draws'))
+            self._write_draw(conn, draw)
+            self._add_counters(conn, count_records([draw], []))
+        return draw
+
+    def update_draw(self, draw_id: int, fields: Dict) -> Optional[Dict]:
+        """Изменить поля розыгрыша"""
+        with self._transaction('draws') as conn:
+            old_draw = self.get_draw(draw_id)
+            if old_draw is None:
+                return None
+            draw = {**old_draw, **fields}
+            self._write_draw(conn, draw)
+            self._add_counters(conn, self._counters_change([draw], [], [old_draw], []))
+        return draw
+
+    def delete_draw(self, draw_id: int) -> bool:
+        """Удалить розыгрыш"""
+        with self._transaction('draws') as conn:
+            draw = self.get_draw(draw_id)
+            if draw is None:
+                return False
+            conn.execute('DELETE FROM draws WHERE id = ?', (draw_id,))
+            self._add_counters(conn, self._counters_change([], [], [draw], []))
+            conn.execute('DELETE FROM draw_sales WHERE draw_id = ?', (draw_id,))
+            return True
+
+    # ========= БИЛЕТЫ =========
+
+    def get_tickets(self, draw_id: Optional[int] = None, status: Optional[str] = None) -> List[Dict]:
+        """Все билеты или выборка по розыгрышу и статусу (по индексам)"""
+        return self._select('tickets', draw_id=draw_id, status=status)
+
+    def get_ticket(self, ticket_id: int) -> Optional[Dict]:
+        """Билет по ID"""
+        rows = self._query('SELECT data FROM tickets WHERE id = ?', (ticket_id,))
+        return rows[0] if rows else None
+
+    def count_tickets(self, draw_id: Optional[int] = None, status: Optional[str] = None,
+                      state: Optional[str] = None) -> int:
+        """Количество билетов по розыгрышу, статусу и состоянию (по индексам)"""
+        where, params = self._where(draw_id=draw_id, status=status, state=state)
+        return self._connection().execute(f'SELECT COUNT(*) FROM tickets{where}', params).fetchone()[0]
+
+    def get_tickets_page(self, draw_id: Optional[int] = None, state: Optional[str] = None,
+                         after_id: int = 0, limit: int = 50, prize: Optional[float] = None) -> List[Dict]:
+        """Страница билетов по возрастанию ID после after_id (по первичному ключу и индексам)"""
+        conditions, params = ['id > ?'], [after_id]
+        for column, value in (('draw_id', draw_id), ('prize', prize)):
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                params.append(value)
+        if state is not None:
+            conditions.append('state = ?')
+            params.append(state)
+        return self._query(
+            f"SELECT data FROM tickets WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?",
+            (*params, limit)
+        )
+
+    def get_ticket_groups(self, preview: int) -> List[Dict]:
+        """Представление "Мои билеты": группы по розыгрышам в порядке появления
+
+        Счетчики берутся из таблицы ticket_groups, последние билеты группы -
+        по индексу (draw_id, id), поэтому стоимость не зависит от общего
+        числа билетов.
+        """
+        conn = self._connection()
+        states: Dict[int, Dict[str, int]] = {}
+        for draw_id, state, count in conn.execute(
+                'SELECT draw_id, state, tickets_count FROM ticket_groups WHERE tickets_count > 0'):
+            states.setdefault(draw_id, {})[state] = count
+
+        first_ids = {}
+        for draw_id in states:
+            first_id = conn.execute('SELECT MIN(id) FROM tickets WHERE draw_id = ?', (draw_id,)).fetchone()[0]
+            if first_id is not None:
+                first_ids[draw_id] = first_id
+        groups = []
+        for draw_id in sorted(first_ids, key=first_ids.get):
+            groups.append({
+                'draw_id': draw_id,
+                'tickets_count': sum(states[draw_id].values()),
+                'states': states[draw_id],
+                'tickets': self._query(
+                    'SELECT data FROM tickets WHERE draw_id = ? ORDER BY id DESC LIMIT ?', (draw_id, max(preview, 0))
+                )
+            })
+        return groups
+
+    def get_prize_levels(self, draw_id: int) -> List[float]:
+        """Различные ненулевые призы билетов розыгрыша по убыванию"""
+        rows = self._connection().execute(
+            'SELECT DISTINCT prize FROM tickets WHERE draw_id = ? AND prize > 0 ORDER BY prize DESC', (draw_id,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def next_ticket_id(self) -> int:
+        """Следующий ID билета"""
+        return self._max_id('tickets') + 1
+
+    def _write_tickets(self, conn: sqlite3.Connection, tickets: List[Dict]):
+        conn.executemany(
+            'INSERT INTO tickets (id, draw_id, status, prize, numbers_mask, price, state, data) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (id) DO UPDATE SET draw_id = excluded.draw_id, status = excluded.status, '
+            'prize = excluded.prize, numbers_mask = excluded.numbers_mask, price = excluded.price, '
+            'state = excluded.state, data = excluded.data',
+            [(t['id'], t['draw_id'], t.get('status', 'pending'), t.get('prize', 0) or 0,
+              numbers_to_mask(t.get('numbers', [])), t.get('price', 0) or 0, ticket_state(t),
+              json.dumps(t, ensure_ascii=False)) for t in tickets]
+        )
+
+    def add_ticket(self, ticket: Dict) -> Optional[Dict]:
+        """Добавить билет, ID назначается хранилищем"""
+        tickets = self.add_tickets([ticket])
+        return tickets[0] if tickets else None
+
+    def add_tickets(self, tickets: List[Dict]) -> Optional[List[Dict]]:
+        """Добавить билеты одной транзакцией, ID - непрерывный диапазон
+        
+        ID выдаются после наибольшего записанного внутри транзакции записи,
+        поэтому порядок ID совпадает с порядком фиксации (курсоры страниц).
+        """
+        # Билеты с заданным ID могут заменять существующие
+        given_ids = [ticket['id'] for ticket in tickets if ticket.get('id')]
+        new_tickets = [ticket for ticket in tickets if not ticket.get('id')]
+        with self._transaction('tickets') as conn:
+            if new_tickets:
+                first_id = self._max_id('tickets') + 1
+                for offset, ticket in enumerate(new_tickets):
+                    ticket['id'] = first_id + offset
+            old_tickets = self._tickets_by_ids(given_ids)
+            self._write_tickets(conn, tickets)
+            self._add_counters(conn, self._counters_change([], tickets, [], old_tickets))
+            self._add_draw_sales(conn, self._draw_sales_change(tickets, old_tickets))
+            self._add_ticket_groups(conn, self._ticket_groups_change(tickets, old_tickets))
+        return tickets
+
+    def update_ticket(self, ticket_id: int, fields: Dict) -> Optional[Dict]:
+        """Изменить поля билета"""
+        with self._transaction('tickets') as conn:
+            old_ticket = self.get_ticket(ticket_id)
+            if old_ticket is None:
+                return None
+            ticket = {**old_ticket, **fields}
+            self._write_tickets(conn, [ticket])
+            self._add_counters(conn, self._counters_change([], [ticket], [], [old_ticket]))
+            self._add_draw_sales(conn, self._draw_sales_change([ticket], [old_ticket]))
+            self._add_ticket_groups(conn, self._ticket_groups_change([ticket], [old_ticket]))
+        return ticket
+
+    def update_tickets(self, updates: Dict[int, Dict]) -> bool:
+        """Изменить поля нескольких билетов в одной транзакции"""
+        return self.update_ticket_groups([([ticket_id], fields) for ticket_id, fields in updates.items()])
+
+    def update_ticket_groups(self, groups: List[Tuple[List[int], Dict]]) -> bool:
+        """Применить общие изменения к группам билетов в одной транзакции
+        
+        Запись обновляется через json_patch одним UPDATE на группу, без
+        чтения в Python; изменение счетчиков считается одним агрегатом по
+        старым значениям группы.
+        """
+        with self._transaction('tickets') as conn:
+            for ticket_ids, fields in groups:
+                ids_json = json.dumps(list(ticket_ids))
+                if COUNTED_TICKET_FIELDS & fields.keys():
+                    self._add_counters(conn, self._group_counters_change(conn, ids_json, fields))
+                if 'price' in fields:
+                    self._add_draw_sales(conn, self._group_draw_sales_change(conn, ids_json, fields))
+                if 'state' in fields:
+                    self._add_ticket_groups(conn, self._group_ticket_groups_change(conn, ids_json, fields))
+
+                columns = ['data = json_patch(data, ?)']
+                params = [json.dumps(fields, ensure_ascii=False)]
+                if 'status' in fields:
+                    columns.append('status = ?')
+                    params.append(fields['status'])
+                if 'prize' in fields:
+                    columns.append('prize = ?')
+                    params.append(fields['prize'] or 0)
+                if 'numbers' in fields:
+                    columns.append('numbers_mask = ?')
+                    params.append(numbers_to_mask(fields['numbers']))
+                if 'price' in fields:
+                    columns.append('price = ?')
+                    params.append(fields['price'] or 0)
+                if 'state' in fields:
+                    columns.append('state = ?')
+                    params.append(fields['state'])
+                conn.execute(
+                    f"UPDATE tickets SET {', '.join(columns)} WHERE id IN (SELECT value FROM json_each(?))",
+                    (*params, ids_json)
+                )
+        return True
+
+    def get_ticket_masks(self, draw_id: int) -> Tuple[array, array]:
+        """Упакованные ID и битовые маски всех билетов розыгрыша по возрастанию ID"""
+        rows = self._connection().execute(
+            'SELECT id, numbers_mask FROM tickets WHERE draw_id = ? ORDER BY id', (draw_id,)
+        ).fetchall()
+        return array('q', (row[0] for row in rows)), new_mask_array(row[1] for row in rows)
+
+    def get_pending_combinations(self, draw_id: int) -> Dict[int, array]:
+        """Комбинации ожидающих билетов розыгрыша: {маска: ID билетов по возрастанию}
+
+        Строки идут по индексу idx_tickets_combination (draw_id, status,
+        numbers_mask), ID билетов в нем упорядочены внутри комбинации.
+        """
+        rows = self._connection().execute(
+            "SELECT numbers_mask, id FROM tickets WHERE draw_id = ? AND status = 'pending' "
+            "ORDER BY numbers_mask, id",
+            (draw_id,)
+        )
+        return {mask: array('q', map(itemgetter(1), group)) for mask, group in groupby(rows, itemgetter(0))}
+
+    def get_combination_stats(self, draw_id: int) -> Dict:
+        """Количество ожидающих билетов и различных комбинаций розыгрыша"""
+        row = self._connection().execute(
+            "SELECT COUNT(*), COUNT(DISTINCT numbers_mask) FROM tickets "
+            "WHERE draw_id = ? AND status = 'pending'",
+            (draw_id,)
+        ).fetchone()
+        return {'tickets': row[0], 'combinations': row[1]}
+
+    def get_draw_sales(self) -> Dict[int, Dict]:
+        """Продажи по розыгрышам из таблицы draw_sales (без просмотра билетов)"""
+        rows = self._connection().execute(
+            'SELECT draw_id, tickets_count, revenue FROM draw_sales WHERE tickets_count > 0'
+        ).fetchall()
+        return {draw_id: {'tickets_count': count, 'revenue': revenue} for draw_id, count, revenue in rows}
+
+    # ========= СЧЕТЧИКИ =========
+
+    def get_counters(self) -> Dict:
+        """Счетчики статистики (models/stats.py): одна строка таблицы counters
+
+        Каждый метод записи меняет счетчики в своей транзакции.
+        """
+        cursor = self._connection().execute('SELECT * FROM counters WHERE id = 1')
+        row = cursor.fetchone()
+        return {column[0]: value for column, value in zip(cursor.description, row) if column[0] != 'id'}
+
+    def rebuild_counters(self) -> Dict:
+        """Пересчитать счетчики по таблицам"""
+        with self._transaction('draws', 'tickets') as conn:
+            self._rebuild_counters(conn)
+        return self.get_counters()
+
+    def _add_counters(self, conn: sqlite3.Connection, deltas: Dict):
+        """Прибавить изменения к счетчикам (в транзакции той же записи)"""
+        deltas = {name: value for name, value in deltas.items() if value}
+        if deltas:
+            assignments = ', '.join(f'{name} = {name} + ?' for name in deltas)
+            conn.execute(f'UPDATE counters SET {assignments} WHERE id = 1', tuple(deltas.values()))
+
+    @staticmethod
+    def _counters_change(new_draws: List[Dict], new_tickets: List[Dict],
+                         old_draws: List[Dict], old_tickets: List[Dict]) -> Dict:
+        """Изменение счетчиков при замене старых записей новыми"""
+        new = count_records(new_draws, new_tickets)
+        old = count_records(old_draws, old_tickets)
+        return {name: new[name] - old[name] for name in new}
+
+    @staticmethod
+    def _group_counters_change(conn: sqlite3.Connection, ids_json: str, fields: Dict) -> Dict:
+        """Изменение счетчиков от общих изменений fields группы билетов"""
+        count, pending, winning, prizes, revenue = conn.execute(
+            "SELECT COUNT(*), TOTAL(status = 'pending'), TOTAL(prize > 0), TOTAL(prize), TOTAL(price) "
+            "FROM tickets WHERE id IN (SELECT value FROM json_each(?))",
+            (ids_json,)
+        ).fetchone()
+        deltas = {}
+        if 'status' in fields:
+            deltas['pending_tickets'] = count * (fields['status'] == 'pending') - int(pending)
+        if 'prize' in fields:
+            prize = fields['prize'] or 0
+            deltas['winning_tickets'] = count * (prize > 0) - int(winning)
+            deltas['prizes_paid'] = count * prize - prizes
+        if 'price' in fields:
+            deltas['revenue'] = count * (fields['price'] or 0) - revenue
+        return deltas
+
+    @staticmethod
+    def _rebuild_counters(conn: sqlite3.Connection):
+        """Выполнить REBUILD_COUNTERS по командам (executescript завершил бы транзакцию)"""
+        for statement in REBUILD_COUNTERS.split(';'):
+            if statement.strip():
+                conn.execute(statement)
+
+    @staticmethod
+    def _add_draw_sales(conn: sqlite3.Connection, deltas: Dict[int, Tuple[int, float]]):
+        """Прибавить изменения продаж по розыгрышам (в транзакции той же записи)"""
+        rows = [(draw_id, count, revenue) for draw_id, (count, revenue) in deltas.items() if count or revenue]
+        if rows:
+            conn.executemany(
+                'INSERT INTO draw_sales (draw_id, tickets_count, revenue) VALUES (?, ?, ?) '
+                'ON CONFLICT (draw_id) DO UPDATE SET tickets_count = tickets_count + excluded.tickets_count, '
+                'revenue = revenue + excluded.revenue',
+                rows
+            )
+
+    @staticmethod
+    def _draw_sales_change(new_tickets: List[Dict], old_tickets: List[Dict]) -> Dict[int, Tuple[int, float]]:
+        """Изменение продаж по розыгрышам при замене старых билетов новыми"""
+        deltas: Dict[int, Tuple[int, float]] = {}
+        for tickets, sign in ((new_tickets, 1), (old_tickets, -1)):
+            for draw_id, sales in count_draw_sales(tickets).items():
+                count, revenue = deltas.get(draw_id, (0, 0))
+                deltas[draw_id] = (count + sign * sales['tickets_count'], revenue + sign * sales['revenue'])
+        return deltas
+
+    @staticmethod
+    def _group_draw_sales_change(conn: sqlite3.Connection, ids_json: str, fields: Dict) -> Dict[int, Tuple[int, float]]:
+        """Изменение выручки розыгрышей от новой цены группы билетов"""
+        rows = conn.execute(
+            'SELECT draw_id, COUNT(*), TOTAL(price) FROM tickets '
+            'WHERE id IN (SELECT value FROM json_each(?)) GROUP BY draw_id',
+            (ids_json,)
+        ).fetchall()
+        price = fields['price'] or 0
+        return {draw_id: (0, count * price - revenue) for draw_id, count, revenue in rows}
+
+    @staticmethod
+    def _add_ticket_groups(conn: sqlite3.Connection, deltas: Dict[Tuple[int, str], int]):
+        """Прибавить изменения счетчиков групп "Мои билеты" (в транзакции той же записи)"""
+        rows = [(draw_id, state, count) for (draw_id, state), count in deltas.items() if count]
+        if rows:
+            conn.executemany(
+                'INSERT INTO ticket_groups (draw_id, state, tickets_count) VALUES (?, ?, ?) '
+                'ON CONFLICT (draw_id, state) DO UPDATE SET tickets_count = tickets_count + excluded.tickets_count',
+                rows
+            )
+
+    @staticmethod
+    def _ticket_groups_change(new_tickets: List[Dict], old_tickets: List[Dict]) -> Dict[Tuple[int, str], int]:
+        """Изменение счетчиков групп при замене старых билетов новыми"""
+        deltas = Counter((ticket['draw_id'], ticket_state(ticket)) for ticket in new_tickets)
+        deltas.subtract((ticket['draw_id'], ticket_state(ticket)) for ticket in old_tickets)
+        return deltas
+
+    @staticmethod
+    def _group_ticket_groups_change(conn: sqlite3.Connection, ids_json: str, fields: Dict) -> Dict[Tuple[int, str], int]:
+        """Изменение счетчиков групп от нового состояния группы билетов"""
+        rows = conn.execute(
+            'SELECT draw_id, state, COUNT(*) FROM tickets '
+            'WHERE id IN (SELECT value FROM json_each(?)) GROUP BY draw_id, state',
+            (ids_json,)
+        ).fetchall()
+        deltas = Counter()
+        for draw_id, state, count in rows:
+            deltas[(draw_id, state)] -= count
+            deltas[(draw_id, fields['state'])] += count
+        return deltas
+
+    def _tickets_by_ids(self, ticket_ids: List[int]) -> List[Dict]:
+        if not ticket_ids:
+            return []
+        return self._query('SELECT data FROM tickets WHERE id IN (SELECT value FROM json_each(?))',
+                           (json.dumps(ticket_ids),))
+
+    # ========= БАЛАНС =========
+
+    def get_balance(self) -> Optional[float]:
+        """Баланс пользователя (None, если не сохранен)"""
+        row = self._connection().execute('SELECT balance FROM balance WHERE id = 1').fetchone()
+        return row[0] if row else None
+
+    def set_balance(self, balance: float) -> bool:
+        """Сохранить баланс пользователя"""
+        with self._transaction('balance') as conn:
+            conn.execute('INSERT OR REPLACE INTO balance (id, balance) VALUES (1, ?)', (balance,))
+        return True
+
+    # ========= ПАКЕТЫ =========
+
+    def get_packages(self, category: Optional[str] = None) -> List[Dict]:
+        """Все пакеты или пакеты категории (по индексу)"""
+        return self._select('packages', category=category)
+
+    def get_package(self, package_id: int) -> Optional[Dict]:
+        """Пакет по ID"""
+        rows = self._query('SELECT data FROM packages WHERE id = ?', (package_id,))
+        return rows[0] if rows else None
+
+    def _write_package(self, conn: sqlite3.Connection, package: Dict):
+        conn.execute(
+            'INSERT OR REPLACE INTO packages (id, category, data) VALUES (?, ?, ?)',
+            (package['id'], package.get('category'), json.dumps(package, ensure_ascii=False))
+        )
+
+    def add_package(self, package: Dict) -> Optional[Dict]:
+        """Добавить пакет, ID назначается хранилищем"""
+        with self._transaction('packages') as conn:
+            package['id'] = get_id_allocator().allocate('packages', floor=lambda: self._max_id('packages'))
+            self._write_package(conn, package)
+        return package
+
+    def update_package(self, package_id: int, fields: Dict) -> Optional[Dict]:
+        """Изменить поля пакета"""
+        with self._transaction('packages') as conn:
+            package = self.get_package(package_id)
+            if package is None:
+                return None
+            package.update(fields)
+            self._write_package(conn, package)
+        return package
+
+    def delete_package(self, package_id: int) -> bool:
+        """Удалить пакет"""
+        with self._transaction('packages') as conn:
+            conn.execute('DELETE FROM packages WHERE id = ?', (package_id,))
+        return True
+
+    # ========= МИГРАЦИЯ =========
+
+    def migrate_from_json(self, source) -> Dict:
+        """Перенести все данные из JSON хранилища (однократно, в пустую базу)"""
+        conn = self._connection()
+        if any(conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone()
+               for table in ('draws', 'tickets', 'packages')):
+            raise RuntimeError(f"База {self.db_file} уже содержит данные, миграция отменена")
+
+        draws = source.get_draws()
+        tickets = source.get_tickets()
+        packages = source.get_packages()
+        balance = source.get_balance()
+
+        with self._transaction(*PARTITIONS) as conn:
+            for draw in draws:
+                self._write_draw(conn, draw)
+            self._write_tickets(conn, tickets)
+            for package in packages:
+                self._write_package(conn, package)
+            if balance is not None:
+                self.set_balance(balance)
+            self._rebuild_counters(conn)
+
+        result = {'draws': len(draws), 'tickets': len(tickets), 'packages': len(packages)}
+        logger.info(f"Данные перенесены в {self.db_file}: {result}")
+        return result
+
+
+def migrate_json_to_sqlite(db_file: str = SQLITE_DB_FILE) -> Dict:
+    """Однократный перенос data/*.json в базу SQLite"""
+    from models.storage import JsonStorage
+    return SQLiteStorage(db_file).migrate_from_json(JsonStorage())
+
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if sys.argv[1:] != ['migrate']:
+        print("Использование: python -m models.sqlite_storage migrate")
+        sys.exit(1)
+    print(migrate_json_to_sqlite())
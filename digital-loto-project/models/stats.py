@@ -0,0 +1,127 @@
+"""
+Счетчики статистики лотереи
+
+/api/admin/stats читает готовые счетчики, а не просматривает розыгрыши и
+билеты. Счетчики меняются вместе с записями:
+- JSON хранилище - это размеры корзин индексов розыгрышей и билетов
+  (models/repository.py), которые обновляются на каждом изменении;
+- SQLite - строка таблицы counters, которую каждый метод записи меняет
+  в той же транзакции, что и записи.
+
+Так же ведутся продажи по розыгрышам (количество билетов и выручка
+розыгрыша) для списка розыгрышей в админке: в JSON хранилище - корзины
+индекса draw_id и суммы цен билетов по розыгрышам, в SQLite - таблица
+draw_sales.
+
+Выручка - сумма полей price билетов (доля стоимости покупки на билет),
+выплаты - сумма полей prize. Билеты, купленные до появления поля price,
+в выручку не входят.
+
+Проверка и пересборка счетчиков:
+    python -m models.stats check
+    python -m models.stats rebuild
+"""
+import logging
+from typing import Dict, Iterable
+from models.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# Счетчики и их порядок в ответах
+COUNTERS = (
+    'total_draws', 'active_draws', 'completed_draws',
+    'total_tickets', 'winning_tickets', 'pending_tickets',
+    'revenue', 'prizes_paid'
+)
+
+# Допустимое расхождение денежных сумм (накопленная ошибка float)
+MONEY_TOLERANCE = 0.01
+
+
+def count_records(draws: Iterable[Dict], tickets: Iterable[Dict]) -> Dict:
+    """Счетчики, посчитанные заново просмотром всех записей"""
+    counters = dict.fromkeys(COUNTERS, 0)
+    for draw in draws:
+        counters['total_draws'] += 1
+        counters['completed_draws' if draw.get('completed') else 'active_draws'] += 1
+    for ticket in tickets:
+        prize = ticket.get('prize') or 0
+        counters['total_tickets'] += 1
+        counters['winning_tickets'] += prize > 0
+        counters['pending_tickets'] += ticket.get('status') == 'pending'
+        counters['revenue'] += ticket.get('price') or 0
+        counters['prizes_paid'] += prize
+    return counters
+
+
+def count_draw_sales(tickets: Iterable[Dict]) -> Dict[int, Dict]:
+    """Продажи по розыгрышам, посчитанные заново просмотром билетов"""
+    sales: Dict[int, Dict] = {}
+    for ticket in tickets:
+        draw_sales = sales.get(ticket['draw_id'])
+        if draw_sales is None:
+            draw_sales = sales[ticket['draw_id']] = {'tickets_count': 0, 'revenue': 0}
+        draw_sales['tickets_count'] += 1
+        draw_sales['revenue'] += ticket.get('price') or 0
+    return sales
+
+
+def check_counters(storage=None) -> Dict:
+    """Сравнить счетчики с пересчетом по записям
+
+    Возвращает consistent, counters (текущие), actual (пересчет) и
+    mismatches - {счетчик: {'counter', 'actual'}} для расхождений;
+    расхождения продаж розыгрыша - под ключом draw_sales:<ID>.
+    """
+    storage = storage or get_storage()
+    counters = storage.get_counters()
+    tickets = storage.get_tickets()
+    actual = count_records(storage.get_draws(), tickets)
+
+    mismatches = {}
+    for name in COUNTERS:
+        tolerance = MONEY_TOLERANCE if name in ('revenue', 'prizes_paid') else 0
+        if abs(counters.get(name, 0) - actual[name]) > tolerance:
+            mismatches[name] = {'counter': counters.get(name, 0), 'actual': actual[name]}
+
+    empty = {'tickets_count': 0, 'revenue': 0}
+    draw_sales = storage.get_draw_sales()
+    actual_sales = count_draw_sales(tickets)
+    for draw_id in draw_sales.keys() | actual_sales.keys():
+        counter = draw_sales.get(draw_id, empty)
+        fact = actual_sales.get(draw_id, empty)
+        if (counter['tickets_count'] != fact['tickets_count']
+                or abs(counter['revenue'] - fact['revenue']) > MONEY_TOLERANCE):
+            mismatches[f'draw_sales:{draw_id}'] = {'counter': counter, 'actual': fact}
+
+    if mismatches:
+        logger.warning(f"Счетчики статистики расходятся с данными: {mismatches}")
+    return {
+        'consistent': not mismatches,
+        'counters': counters,
+        'actual': actual,
+        'mismatches': mismatches
+    }
+
+
+def rebuild_counters(storage=None) -> Dict:
+    """Построить счетчики заново по данным хранилища"""
+    storage = storage or get_storage()
+    counters = storage.rebuild_counters()
+    logger.info(f"Счетчики статистики пересобраны: {counters}")
+    return counters
+
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    command = sys.argv[1:]
+    if command == ['check']:
+        result = check_counters()
+        print(result)
+        sys.exit(0 if result['consistent'] else 2)
+    if command == ['rebuild']:
+        print(rebuild_counters())
+        sys.exit(0)
+    print("Использование: python -m models.stats check|rebuild")
+    sys.exit(1)
@@ -0,0 +1,211 @@
+"""
+Хранилища данных лотереи
+
+LotteryService работает с данными через объект хранилища. Реализация
+выбирается параметром STORAGE_BACKEND в config.py:
+- 'json'   - JSON файлы из JSON_FILES (по умолчанию, для небольших установок)
+- 'sqlite' - база SQLite с индексами (models/sqlite_storage.py)
+"""
+import logging
+import threading
+from array import array
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from models.data_manager import DataManager
+from models.ticket_store import get_ticket_store
+from models.id_allocator import get_id_allocator
+from models.repository import Index, JsonRepository, draw_type
+from models.versions import get_versions
+from config import JSON_FILES, STORAGE_BACKEND
+
+logger = logging.getLogger(__name__)
+
+
+class JsonStorage:
+    """Хранилище в JSON файлах"""
+
+    def __init__(self):
+        self.ticket_store = get_ticket_store()
+        self.draws = JsonRepository(
+            JSON_FILES['draws'], 'draws', 'draws',
+            type=Index('type', 'category', key=draw_type),
+            completed=Index('completed', key=lambda draw: bool(draw.get('completed')))
+        )
+        self.packages = JsonRepository(
+            JSON_FILES['packages'], 'packages', 'packages',
+            category=Index('category')
+        )
+
+    @contextmanager
+    def transaction(self, *resources: str):
+        """Транзакция над ресурсами ('draws', 'tickets', 'balance', 'packages')"""
+        with DataManager.transaction(*resources):
+            yield
+
+    # ========= РОЗЫГРЫШИ =========
+
+    def get_draws(self, draw_type: Optional[str] = None, completed: Optional[bool] = None) -> List[Dict]:
+        """Все розыгрыши или выборка по типу и статусу (по индексам)"""
+        criteria = {}
+        if draw_type is not None:
+            criteria['type'] = draw_type
+        if completed is not None:
+            criteria['completed'] = bool(completed)
+        return self.draws.find(**criteria)
+
+    def get_draw(self, draw_id: int) -> Optional[Dict]:
+        """Розыгрыш по ID"""
+        return self.draws.get(draw_id)
+
+    def add_draw(self, draw: Dict) -> Optional[Dict]:
+        """Добавить розыгрыш, ID назначается хранилищем"""
+        return self.draws.add(draw, lambda floor: get_id_allocator().allocate('draws', floor=floor))
+
+    def update_draw(self, draw_id: int, fields: Dict) -> Optional[Dict]:
+        """Изменить поля розыгрыша"""
+        return self.draws.update(draw_id, fields)
+
+    def delete_draw(self, draw_id: int) -> bool:
+        """Удалить розыгрыш"""
+        return self.draws.remove(draw_id)
+
+    # ========= БИЛЕТЫ =========
+
+    def get_tickets(self, draw_id: Optional[int] = None, status: Optional[str] = None) -> List[Dict]:
+        """Все билеты или выборка по розыгрышу и статусу (по индексам)"""
+        return self.ticket_store.get_tickets(draw_id, status)
+
+    def get_ticket(self, ticket_id: int) -> Optional[Dict]:
+        """Билет по ID"""
+        return self.ticket_store.get_ticket(ticket_id)
+
+    def get_tickets_page(self, draw_id: Optional[int] = None, state: Optional[str] = None,
+                         after_id: int = 0, limit: int = 50, prize: Optional[float] = None) -> List[Dict]:
+        """Страница билетов по возрастанию ID после after_id"""
+        return self.ticket_store.get_tickets_page(draw_id, state, after_id, limit, prize)
+
+    def get_ticket_groups(self, preview: int) -> List[Dict]:
+        """Представление "Мои билеты": группы по розыгрышам с preview последними билетами"""
+        return self.ticket_store.get_ticket_groups(preview)
+
+    def get_prize_levels(self, draw_id: int) -> List[float]:
+        """Различные ненулевые призы билетов розыгрыша по убыванию"""
+        return self.ticket_store.get_prize_levels(draw_id)
+
+    def count_tickets(self, draw_id: Optional[int] = None, status: Optional[str] = None,
+                      state: Optional[str] = None) -> int:
+        """Количество билетов по розыгрышу, статусу и состоянию (по индексам)"""
+        return self.ticket_store.count_tickets(draw_id, status, state)
+
+    def next_ticket_id(self) -> int:
+        """Следующий ID билета"""
+        return self.ticket_store.next_id()
+
+    def add_ticket(self, ticket: Dict) -> Optional[Dict]:
+        """Добавить билет, ID назначается хранилищем"""
+        return self.ticket_store.add_ticket(ticket)
+
+    def add_tickets(self, tickets: List[Dict]) -> Optional[List[Dict]]:
+        """Добавить билеты одной записью, ID - непрерывный диапазон"""
+        return self.ticket_store.add_tickets(tickets)
+
+    def update_ticket(self, ticket_id: int, fields: Dict) -> Optional[Dict]:
+        """Изменить поля билета"""
+        return self.ticket_store.update_ticket(ticket_id, fields)
+
+    def update_tickets(self, updates: Dict[int, Dict]) -> bool:
+        """Изменить поля нескольких билетов одной записью"""
+        return self.ticket_store.update_tickets(updates)
+
+    def update_ticket_groups(self, groups: List[Tuple[List[int], Dict]]) -> bool:
+        """Применить общие изменения к группам билетов одной записью"""
+        return self.ticket_store.update_ticket_groups(groups)
+
+    def get_ticket_masks(self, draw_id: int) -> Tuple[array, array]:
+        """Упакованные ID и битовые маски всех билетов розыгрыша по возрастанию ID"""
+        return self.ticket_store.get_masks(draw_id)
+
+    def get_pending_combinations(self, draw_id: int) -> Dict[int, array]:
+        """Индекс комбинаций ожидающих билетов розыгрыша: {маска: ID билетов по возрастанию}"""
+        return self.ticket_store.get_pending_combinations(draw_id)
+
+    def get_combination_stats(self, draw_id: int) -> Dict:
+        """Количество ожидающих билетов и различных комбинаций розыгрыша"""
+        return self.ticket_store.get_combination_stats(draw_id)
+
+    def get_draw_sales(self) -> Dict[int, Dict]:
+        """Продажи по розыгрышам: {ID розыгрыша: {'tickets_count', 'revenue'}}"""
+        return self.ticket_store.get_draw_sales()
+
+    # ========= СЧЕТЧИКИ =========
+
+    def get_counters(self) -> Dict:
+        """Счетчики статистики (models/stats.py) по размерам корзин индексов"""
+        draws = self.draws.counts('completed')
+        return {
+            'total_draws': sum(draws.values()),
+            'active_draws': draws.get(False, 0),
+            'completed_draws': draws.get(True, 0),
+            **self.ticket_store.get_counters()
+        }
+
+    def rebuild_counters(self) -> Dict:
+        """Перечитать файлы и построить индексы, из которых берутся счетчики"""
+        self.draws.reload()
+        self.ticket_store.reload()
+        get_versions().bump('draws', 'tickets')
+        return self.get_counters()
+
+    # ========= БАЛАНС =========
+
+    def get_balance(self) -> Optional[float]:
+        """Баланс пользователя (None, если не сохранен)"""
+        return DataManager.load_balance()
+
+    def set_balance(self, balance: float) -> bool:
+        """Сохранить баланс пользователя (дозапись в журнал баланса)"""
+        return DataManager.save_balance(balance)
+
+    # ========= ПАКЕТЫ =========
+
+    def get_packages(self, category: Optional[str] = None) -> List[Dict]:
+        """Все пакеты или пакеты категории (по индексу)"""
+        if category is not None:
+            return self.packages.find(category=category)
+        return self.packages.get_all()
+
+    def get_package(self, package_id: int) -> Optional[Dict]:
+        """Пакет по ID"""
+        return self.packages.get(package_id)
+
+    def add_package(self, package: Dict) -> Optional[Dict]:
+        """Добавить пакет, ID назначается хранилищем"""
+        return self.packages.add(package, lambda floor: get_id_allocator().allocate('packages', floor=floor))
+
+    def update_package(self, package_id: int, fields: Dict) -> Optional[Dict]:
+        """Изменить поля пакета"""
+        return self.packages.update(package_id, fields)
+
+    def delete_package(self, package_id: int) -> bool:
+        """Удалить пакет (отсутствующий пакет считается удаленным)"""
+        return self.packages.remove(package_id) or self.packages.get(package_id) is None
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """Общее для процесса хранилище, выбранное в STORAGE_BACKEND"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if STORAGE_BACKEND == 'sqlite':
+                from models.sqlite_storage import SQLiteStorage
+                _storage = SQLiteStorage()
+            elif STORAGE_BACKEND == 'json':
+                _storage = JsonStorage()
+            else:
+                raise ValueError(f"Неизвестное хранилище: {STORAGE_BACKEND}")
+            logger.info(f"Используется хранилище {STORAGE_BACKEND}")
+        return _storage
@@ -0,0 +1,741 @@
+"""
+Хранилище билетов на основе журнала изменений
+
+Состояние билетов = снимок (tickets.json) + журнал (JSONL), в который
+дописывается по одной строке на каждый новый билет или изменение билета.
+Покупка билета стоит одну дозапись в журнал вместо перезаписи всего файла.
+Когда журнал вырастает до доли TICKETS_JOURNAL_COMPACT_RATIO от снимка,
+он сворачивается в новый снимок в фоновом потоке (см. compact).
+
+Для расчета розыгрышей хранилище держит по каждому розыгрышу упакованный
+массив битовых масок билетов (utils/ticket_masks.py) и индекс комбинаций
+ожидающих билетов (маска -> ID билетов), которые обновляются вместе с
+записями. Так же вместе с записями ведутся выручка по розыгрышам
+(сумма цен билетов) для списка розыгрышей в админке и группы страницы
+"Мои билеты" (ID билетов розыгрыша по возрастанию и счетчики состояний).
+
+Дозаписи изменений идут под разделяемой блокировкой 'tickets' и могут
+объединяться групповой фиксацией; добавление билета (выдача ID) и
+замена файлов при сворачивании журнала берут исключительную блокировку. Порядок захвата:
+сначала файловая блокировка, затем self._lock.
+"""
+import json
+import os
+import logging
+import tempfile
+import threading
+import time
+from collections import Counter
+from bisect import insort
+from itertools import compress, islice
+from operator import itemgetter
+from array import array
+from typing import Dict, List, Optional, Tuple
+from models.data_manager import DataManager, _copy_json, _fsync_dir
+from models.repository import Index, IndexedCollection, ticket_state
+from utils.ticket_masks import new_mask_array, numbers_to_mask
+from config import (JSON_FILES, TICKETS_JOURNAL_FILE, TICKETS_JOURNAL_COMPACT_RATIO,
+                    TICKETS_JOURNAL_COMPACT_MIN_BYTES, FSYNC_WRITES)
+
+logger = logging.getLogger(__name__)
+
+# Поля билета, от которых зависит его состояние (repository.ticket_state)
+STATE_FIELDS = frozenset(('state', 'numbers', 'status', 'matches'))
+
+# Больше изменений за раз - индексы и счетчики пересчитываются, а не правятся
+BULK_CHANGES = 1000
+
+
+class _DrawMasks:
+    """Упакованные маски и индекс комбинаций билетов одного розыгрыша
+
+    combinations - {маска: {ID ожидающего билета с этими числами: None}}
+    (упорядоченное множество, как корзины repository.Index). Покупка и
+    правка билета меняют индекс на месте; после массовых изменений (расчет
+    розыгрыша) индекс сбрасывается в None и строится заново по маскам при
+    следующем обращении.
+    """
+
+    __slots__ = ('ids', 'masks', 'pending', 'positions', 'combinations')
+
+    def __init__(self):
+        self.ids = array('q')
+        self.masks = new_mask_array()
+        self.pending = bytearray()
+        self.positions: Dict[int, int] = {}
+        self.combinations: Optional[Dict[int, Dict[int, None]]] = {}
+
+    def put(self, ticket: Dict):
+        """Добавить или перезаписать билет"""
+        position = self.positions.get(ticket['id'])
+        if position is None:
+            self.positions[ticket['id']] = len(self.ids)
+            self.ids.append(ticket['id'])
+            self.masks.append(0)
+            self.pending.append(0)
+        self.set_mask(ticket['id'], numbers_to_mask(ticket.get('numbers', [])))
+        self.set_status(ticket['id'], ticket.get('status'))
+
+    def set_mask(self, ticket_id: int, mask: int):
+        position = self.positions[ticket_id]
+        old_mask = self.masks[position]
+        if self.pending[position] and mask != old_mask:
+            self._unlink(old_mask, ticket_id)
+            self._link(mask, ticket_id)
+        self.masks[position] = mask
+
+    def set_status(self, ticket_id: int, status: Optional[str]):
+        position = self.positions[ticket_id]
+        is_pending = status == 'pending'
+        if is_pending != self.pending[position]:
+            self.pending[position] = is_pending
+            if is_pending:
+                self._link(self.masks[position], ticket_id)
+            else:
+                self._unlink(self.masks[position], ticket_id)
+
+    def update(self, ticket_ids: List[int], fields: Dict):
+        """Переиндексировать билеты после общих изменений fields"""
+        if len(ticket_ids) > BULK_CHANGES:
+            self.combinations = None
+        if 'numbers' in fields:
+            mask = numbers_to_mask(fields['numbers'])
+            for ticket_id in ticket_ids:
+                self.set_mask(ticket_id, mask)
+        if 'status' in fields:
+            for ticket_id in ticket_ids:
+                self.set_status(ticket_id, fields['status'])
+
+    def pending_combinations(self) -> Dict[int, Dict[int, None]]:
+        """Индекс комбинаций ожидающих билетов (перестраивается при необходимости)"""
+        if self.combinations is None:
+            combinations: Dict[int, Dict[int, None]] = {}
+            for ticket_id, mask in zip(compress(self.ids, self.pending), compress(self.masks, self.pending)):
+                bucket = combinations.get(mask)
+                if bucket is None:
+                    bucket = combinations[mask] = {}
+                bucket[ticket_id] = None
+            self.combinations = combinations
+        return self.combinations
+
+    def _link(self, mask: int, ticket_id: int):
+        """Добавить ожидающий билет в корзину комбинации"""
+        if self.combinations is None:
+            return
+        bucket = self.combinations.get(mask)
+        if bucket is None:
+            bucket = self.combinations[mask] = {}
+        bucket[ticket_id] = None
+
+    def _unlink(self, mask: int, ticket_id: int):
+        """Убрать билет из корзины комбинации (пустые корзины удаляются)"""
+        if self.combinations is None:
+            return
+        bucket = self.combinations.get(mask)
+        if bucket is not None:
+            bucket.pop(ticket_id, None)
+            if not bucket:
+                del self.combinations[mask]
+
+
+class _TicketGroup:
+    """Группа представления "Мои билеты": билеты одного розыгрыша
+
+    ids - ID билетов по возрастанию; states - {состояние: количество},
+    меняется на месте при покупке и правке; после массовых изменений
+    (расчет розыгрыша) сбрасывается в None и пересчитывается при чтении.
+    """
+
+    __slots__ = ('ids', 'states')
+
+    def __init__(self):
+        self.ids = array('q')
+        self.states: Optional[Dict[str, int]] = {}
+
+    def add(self, ticket_id: int):
+        if not self.ids or ticket_id > self.ids[-1]:
+            self.ids.append(ticket_id)
+        else:
+            insort(self.ids, ticket_id)
+
+    def count(self, state: str, delta: int):
+        """Изменить счетчик состояния (пустые состояния удаляются)"""
+        if self.states is None:
+            return
+        count = self.states.get(state, 0) + delta
+        if count > 0:
+            self.states[state] = count
+        else:
+            self.states.pop(state, None)
+
+
+class TicketStore:
+    """Билеты в памяти процесса, синхронизируемые со снимком и журналом"""
+
+    def __init__(self, snapshot_file: str, journal_file: str, compact_ratio: float, compact_min_bytes: int):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+
+        self._lock = threading.RLock()
+        self._tickets = IndexedCollection(
+            draw_id=Index('draw_id'),
+            status=Index('status'),
+            prize=Index('prize'),
+            price=Index('price'),
+            state=Index('state', key=ticket_state)
+        )
+        self._draw_masks: Dict[int, _DrawMasks] = {}
+        self._groups: Dict[int, _TicketGroup] = {}
+        self._draw_revenue: Dict[int, float] = {}
+        self._max_id = 0
+        self._loaded = False
+        self._snapshot_signature = None
+        self._journal_inode = None
+        self._journal_offset = 0
+        self._journal_lines = 0
+        self._compacting = False
+
+    # ========= ЧТЕНИЕ =========
+
+    def get_tickets(self, draw_id: Optional[int] = None, status: Optional[str] = None) -> List[Dict]:
+        """Все билеты или выборка по розыгрышу и статусу (копии, по индексам)"""
+        with self._lock:
+            self._refresh()
+            return [_copy_json(t) for t in self._tickets.find(**self._criteria(draw_id, status))]
+
+    def get_tickets_page(self, draw_id: Optional[int] = None, state: Optional[str] = None,
+                         after_id: int = 0, limit: int = 50, prize: Optional[float] = None) -> List[Dict]:
+        """Страница билетов по возрастанию ID после after_id (копии)
+
+        state - состояние билета для пользователя ('pending', 'confirmed',
+        'completed', 'winning'); выборка идет по индексам до обогащения билетов.
+        """
+        criteria = self._criteria(draw_id)
+        if state is not None:
+            criteria['state'] = state
+        if prize is not None:
+            criteria['prize'] = prize
+        with self._lock:
+            self._refresh()
+            return [_copy_json(t) for t in self._tickets.find_page([criteria], after_id, limit)]
+
+    def get_prize_levels(self, draw_id: int) -> List[float]:
+        """Различные ненулевые призы билетов розыгрыша по убыванию (по индексам)"""
+        with self._lock:
+            self._refresh()
+            return sorted(
+                (prize for prize in self._tickets.counts('prize')
+                 if prize and self._tickets.count(draw_id=draw_id, prize=prize)),
+                reverse=True
+            )
+
+    def get_ticket_groups(self, preview: int) -> List[Dict]:
+        """Представление "Мои билеты": группы по розыгрышам в порядке появления
+
+        Для каждой группы: draw_id, tickets_count, states - {состояние:
+        количество} и tickets - до preview последних билетов (копии, по
+        убыванию ID). Группы ведутся вместе с записями, поэтому стоимость
+        не зависит от общего числа билетов.
+        """
+        with self._lock:
+            self._refresh()
+            groups = []
+            for draw_id, group in self._groups.items():
+                if not group.ids:
+                    continue
+                if group.states is None:
+                    group.states = dict(Counter(ticket_state(self._tickets.get(ticket_id)) for ticket_id in group.ids))
+                groups.append({
+                    'draw_id': draw_id,
+                    'tickets_count': len(group.ids),
+                    'states': dict(group.states),
+                    'tickets': [_copy_json(self._tickets.get(ticket_id))
+                                for ticket_id in reversed(group.ids[-preview:] if preview > 0 else [])]
+                })
+            return groups
+
+    def count_tickets(self, draw_id: Optional[int] = None, status: Optional[str] = None,
+                      state: Optional[str] = None) -> int:
+        """Количество билетов по индексам (без условий - всего)"""
+        criteria = self._criteria(draw_id, status)
+        if state is not None:
+            criteria['state'] = state
+        with self._lock:
+            self._refresh()
+            return self._tickets.count(**criteria)
+
+    def get_counters(self) -> Dict:
+        """Счетчики билетов по размерам корзин индексов (без просмотра билетов)
+
+        Выигрыши и выручка - суммы по корзинам индексов prize и price,
+        число корзин равно числу различных сумм, а не билетов.
+        """
+        with self._lock:
+            self._refresh()
+            prizes = self._tickets.counts('prize')
+            prices = self._tickets.counts('price')
+            return {
+                'total_tickets': len(self._tickets),
+                'winning_tickets': sum(count for prize, count in prizes.items() if (prize or 0) > 0),
+                'pending_tickets': self._tickets.count(status='pending'),
+                'revenue': sum((price or 0) * count for price, count in prices.items()),
+                'prizes_paid': sum((prize or 0) * count for prize, count in prizes.items())
+            }
+
+    def ticket_counts(self, index: str) -> Dict:
+        """Количество билетов по каждому ключу индекса ('draw_id', 'status', 'prize', 'price')"""
+        with self._lock:
+            self._refresh()
+            return self._tickets.counts(index)
+
+    def get_draw_sales(self) -> Dict[int, Dict]:
+        """Продажи по розыгрышам: {ID розыгрыша: {'tickets_count', 'revenue'}}
+
+        Количество - размер корзины индекса draw_id, выручка ведется
+        вместе с записями, поэтому билеты не просматриваются.
+        """
+        with self._lock:
+            self._refresh()
+            return {
+                draw_id: {'tickets_count': count, 'revenue': self._draw_revenue.get(draw_id, 0)}
+                for draw_id, count in self._tickets.counts('draw_id').items()
+            }
+
+    def get_ticket(self, ticket_id: int) -> Optional[Dict]:
+        """Билет по ID (копия)"""
+        with self._lock:
+            self._refresh()
+            ticket = self._tickets.get(ticket_id)
+            return _copy_json(ticket) if ticket is not None else None
+
+    def get_masks(self, draw_id: int) -> Tuple[array, array]:
+        """Упакованные ID и маски всех билетов розыгрыша по возрастанию ID"""
+        with self._lock:
+            self._refresh()
+            draw_masks = self._draw_masks.get(draw_id)
+            if draw_masks is None:
+                return array('q'), new_mask_array()
+            ids, masks = draw_masks.ids[:], draw_masks.masks[:]
+
+        if any(a > b for a, b in zip(ids, islice(ids, 1, None))):
+            order = sorted(range(len(ids)), key=ids.__getitem__)
+            ids = array('q', (ids[i] for i in order))
+            masks = new_mask_array(masks[i] for i in order)
+        return ids, masks
+
+    def get_pending_combinations(self, draw_id: int) -> Dict[int, array]:
+        """Индекс комбинаций ожидающих билетов розыгрыша: {маска: ID билетов по возрастанию}"""
+        with self._lock:
+            self._refresh()
+            draw_masks = self._draw_masks.get(draw_id)
+            if draw_masks is None:
+                return {}
+            combinations = {mask: array('q', bucket) for mask, bucket in draw_masks.pending_combinations().items()}
+
+        for mask, ids in combinations.items():
+            if any(a > b for a, b in zip(ids, islice(ids, 1, None))):
+                combinations[mask] = array('q', sorted(ids))
+        return combinations
+
+    def get_combination_stats(self, draw_id: int) -> Dict:
+        """Количество ожидающих билетов и различных комбинаций среди них (по индексу комбинаций)"""
+        with self._lock:
+            self._refresh()
+            draw_masks = self._draw_masks.get(draw_id)
+            if draw_masks is None:
+                return {'tickets': 0, 'combinations': 0}
+            combinations = draw_masks.pending_combinations()
+            return {
+                'tickets': sum(map(len, combinations.values())),
+                'combinations': len(combinations)
+            }
+
+    def next_id(self) -> int:
+        """Следующий ID билета"""
+        return self._current_max_id() + 1
+
+    # ========= ЗАПИСЬ =========
+
+    def add_ticket(self, ticket: Dict) -> Optional[Dict]:
+        """Добавить билет; ID назначается, если не указан"""
+        tickets = self.add_tickets([ticket])
+        return tickets[0] if tickets else None
+
+    def add_tickets(self, tickets: List[Dict]) -> Optional[List[Dict]]:
+        """Добавить билеты одной дозаписью в журнал
+        
+        Билетам без ID назначается непрерывный диапазон после наибольшего
+        записанного ID. Выдача ID и дозапись идут под одной исключительной
+        блокировкой, поэтому порядок ID совпадает с порядком записи:
+        курсор страницы (after_id) не пропускает билеты, записанные позже.
+        """
+        tickets = [_copy_json(ticket) for ticket in tickets]
+        with DataManager.lock('tickets'):
+            new_tickets = [ticket for ticket in tickets if not ticket.get('id')]
+            if new_tickets:
+                first_id = self._current_max_id() + 1
+                for offset, ticket in enumerate(new_tickets):
+                    ticket['id'] = first_id + offset
+            if not self._append([{'op': 'add', 'ticket': ticket} for ticket in tickets]):
+                return None
+        with self._lock:
+            return [_copy_json(self._tickets.get(ticket['id']) or ticket) for ticket in tickets]
+
+    def update_ticket(self, ticket_id: int, fields: Dict) -> Optional[Dict]:
+        """Изменить поля билета"""
+        with DataManager.lock('tickets', shared=True):
+            with self._lock:
+                self._refresh()
+                if ticket_id not in self._tickets:
+                    return None
+
+            if not self._append([{'op': 'update', 'id': ticket_id, 'fields': fields}]):
+                return None
+        with self._lock:
+            return _copy_json(self._tickets.get(ticket_id))
+
+    def update_tickets(self, updates: Dict[int, Dict]) -> bool:
+        """Изменить поля нескольких билетов одной дозаписью в журнал"""
+        if not updates:
+            return True
+        records = [{'op': 'update', 'id': ticket_id, 'fields': fields}
+                   for ticket_id, fields in updates.items()]
+        with DataManager.lock('tickets', shared=True):
+            return self._append(records)
+
+    def update_ticket_groups(self, groups: List[Tuple[List[int], Dict]]) -> bool:
+        """Записать группы (ID билетов, общие изменения) одной дозаписью
+        
+        Каждая группа занимает в журнале одну строку update_many, поэтому
+        размер записи почти не зависит от количества билетов.
+        """
+        records = [{'op': 'update_many', 'ids': list(ticket_ids), 'fields': fields}
+                   for ticket_ids, fields in groups if len(ticket_ids)]
+        if not records:
+            return True
+        with DataManager.lock('tickets', shared=True):
+            return self._append(records)
+
+    def reload(self):
+        """Перечитать снимок и журнал целиком, построив индексы заново"""
+        with DataManager.lock('tickets', shared=True), self._lock:
+            self._loaded = False
+            self._refresh()
+
+    def compact(self) -> bool:
+        """Свернуть журнал в новый снимок tickets.json
+        
+        Снимок сериализуется (без отступов) под self._lock, но без файловой
+        блокировки, и пишется во временный файл без блокировок: покупки и
+        чтения в других процессах продолжаются. Исключительная блокировка
+        'tickets' берется только на замену файлов: новый журнал получает
+        записи, дописанные после сериализации. Одновременно сворачивает
+        журнал только один процесс.
+        """
+        snapshot_tmp = None
+        try:
+            with DataManager.lock('tickets-compaction', blocking=False):
+                with self._lock:
+                    self._refresh()
+                    started = time.perf_counter()
+                    payload = json.dumps({'tickets': list(self._tickets.values())},
+                                         ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+                    serialize_seconds = time.perf_counter() - started
+                    snapshot_signature = self._snapshot_signature
+                    journal_inode = self._journal_inode
+                    offset = self._journal_offset
+                    tickets_count = len(self._tickets)
+
+                snapshot_tmp = self._write_temp(self.snapshot_file, payload)
+                with DataManager.lock('tickets'):
+                    return self._swap(snapshot_tmp, snapshot_signature, journal_inode, offset,
+                                      len(payload), serialize_seconds, tickets_count)
+        except BlockingIOError:
+            logger.info("Журнал билетов уже сворачивает другой процесс")
+            return False
+        except Exception as e:
+            logger.error(f"Ошибка сворачивания журнала билетов: {e}")
+            return False
+        finally:
+            if snapshot_tmp is not None and os.path.exists(snapshot_tmp):
+                os.unlink(snapshot_tmp)
+            self._compacting = False
+
+    def _swap(self, snapshot_tmp: str, snapshot_signature, journal_inode, offset: int,
+              size: int, serialize_seconds: float, tickets_count: int) -> bool:
+        """Заменить снимок и журнал (под исключительной блокировкой 'tickets')
+        
+        Новый журнал - хвост старого после offset. Если процесс упадет между
+        двумя заменами, старый журнал применится к новому снимку повторно,
+        что безопасно (см. _apply).
+        """
+        try:
+            current_signature = DataManager._file_signature(self.snapshot_file)
+        except FileNotFoundError:
+            current_signature = None
+        try:
+            with open(self.journal_file, 'rb') as f:
+                if os.fstat(f.fileno()).st_ino != journal_inode or current_signature != snapshot_signature:
+                    # Файлы заменили (перечитывание хранилища) после сериализации
+                    logger.info("Сворачивание журнала билетов пропущено: файлы изменились")
+                    return False
+                f.seek(offset)
+                tail = f.read()
+        except FileNotFoundError:
+            tail = b''
+
+        journal_tmp = self._write_temp(self.journal_file, tail)
+        os.replace(snapshot_tmp, self.snapshot_file)
+        os.replace(journal_tmp, self.journal_file)
+        if FSYNC_WRITES:
+            _fsync_dir(os.path.dirname(self.snapshot_file) or '.')
+        DataManager._record_write(self.snapshot_file, 'replace', size, serialize_seconds, 0.0)
+
+        with self._lock:
+            applied = self._journal_offset - offset
+            if self._loaded and applied >= 0:
+                # Состояние уже совпадает со снимком плюс примененной частью хвоста
+                self._snapshot_signature = DataManager._file_signature(self.snapshot_file)
+                self._journal_inode = os.stat(self.journal_file).st_ino
+                self._journal_offset = applied
+                self._journal_lines = tail[:applied].count(b'\n')
+            else:
+                self._loaded = False
+        logger.info(f"Журнал билетов свернут, билетов в снимке: {tickets_count}, "
+                    f"снимок {size} байт, в новом журнале {len(tail)} байт")
+        return True
+
+    @staticmethod
+    def _write_temp(filename: str, payload: bytes) -> str:
+        """Записать данные во временный файл рядом с filename (для os.replace)"""
+        directory = os.path.dirname(filename) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(filename)}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+                f.flush()
+                if FSYNC_WRITES:
+                    os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o644)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return tmp_path
+
+    # ========= ВНУТРЕННЕЕ =========
+
+    def _append(self, records: List[Dict]) -> bool:
+        """Дописать записи в журнал (с групповой фиксацией) и применить их
+        
+        Вызывается под блокировкой 'tickets', но без self._lock, чтобы
+        дозаписи разных потоков могли попасть в один пакет.
+        """
+        if not records:
+            return True
+        payload = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records)
+
+        if not DataManager.append_text(self.journal_file, payload):
+            logger.error("Ошибка записи в журнал билетов")
+            return False
+
+        # Свои записи применяются тем же чтением хвоста журнала, что и чужие
+        with self._lock:
+            self._refresh()
+            self._maybe_compact()
+        return True
+
+    def _refresh(self):
+        """Синхронизировать состояние с файлами (полностью или только хвост журнала)"""
+        try:
+            snapshot_signature = DataManager._file_signature(self.snapshot_file)
+        except FileNotFoundError:
+            snapshot_signature = None
+        try:
+            journal_stat = os.stat(self.journal_file)
+        except FileNotFoundError:
+            journal_stat = None
+
+        journal_inode = journal_stat.st_ino if journal_stat else None
+        journal_size = journal_stat.st_size if journal_stat else 0
+
+        if (not self._loaded
+                or snapshot_signature != self._snapshot_signature
+                or journal_inode != self._journal_inode
+                or journal_size < self._journal_offset):
+            self._reload(snapshot_signature, journal_inode)
+        elif journal_size > self._journal_offset:
+            self._replay_journal()
+
+    def _reload(self, snapshot_signature, journal_inode):
+        """Построить состояние заново: снимок плюс весь журнал"""
+        tickets_data = DataManager.load_json(self.snapshot_file, copy=True)
+        tickets = tickets_data.get('tickets', []) if isinstance(tickets_data, dict) else []
+
+        self._tickets.load(tickets)
+        self._draw_masks = {}
+        self._draw_revenue = {}
+        self._groups = {}
+        for ticket in self._tickets.values():
+            self._index(ticket, True)
+            self._count_ticket(ticket, 1)
+        self._max_id = self._tickets.max_id()
+        self._snapshot_signature = snapshot_signature
+        self._journal_inode = journal_inode
+        self._journal_offset = 0
+        self._journal_lines = 0
+        self._loaded = True
+
+        self._replay_journal()
+        logger.info(f"Хранилище билетов загружено: {len(self._tickets)} билетов, "
+                    f"{self._journal_lines} записей в журнале")
+
+    def _replay_journal(self):
+        """Применить к состоянию новые строки журнала"""
+        try:
+            with open(self.journal_file, 'rb') as f:
+                f.seek(self._journal_offset)
+                chunk = f.read()
+        except FileNotFoundError:
+            return
+
+        # Недописанную последнюю строку оставляем до следующего чтения
+        end = chunk.rfind(b'\n') + 1
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError) as e:
+                logger.error(f"Пропущена поврежденная запись журнала билетов: {e}")
+            self._journal_lines += 1
+        self._journal_offset += end
+
+    def _apply(self, record: Dict):
+        """Применить одну запись журнала (повторное применение безопасно)"""
+        op = record['op']
+        if op == 'add':
+            ticket = record['ticket']
+            old_ticket = self._tickets.get(ticket['id'])
+            if old_ticket is not None:
+                self._count_ticket(old_ticket, -1)
+            self._tickets.put(ticket)
+            self._index(ticket, old_ticket is None)
+            self._count_ticket(ticket, 1)
+            self._max_id = max(self._max_id, ticket['id'])
+        elif op in ('update', 'update_many'):
+            fields = record['fields']
+            ticket_ids = record['ids'] if op == 'update_many' else [record['id']]
+            # Цена билета после покупки обычно не меняется, а состояние
+            # меняется массово при расчете: тогда счетчики состояний групп
+            # сбрасываются и пересчитываются при чтении
+            revenue_changed = 'price' in fields or 'draw_id' in fields
+            state_changed = not STATE_FIELDS.isdisjoint(fields)
+            per_ticket = revenue_changed or (state_changed and len(ticket_ids) <= BULK_CHANGES)
+            if per_ticket:
+                for ticket_id in dict.fromkeys(ticket_ids):
+                    old_ticket = self._tickets.get(ticket_id)
+                    if old_ticket is not None:
+                        self._count_ticket(old_ticket, -1)
+            tickets = self._tickets.update_many(ticket_ids, fields)
+            if per_ticket:
+                for ticket in tickets:
+                    self._count_ticket(ticket, 1)
+            elif state_changed:
+                for draw_id in set(map(itemgetter('draw_id'), tickets)):
+                    self._groups[draw_id].states = None
+            if not tickets or ('numbers' not in fields and 'status' not in fields):
+                return
+
+            # Группа обычно относится к одному розыгрышу: если все ID из
+            # масок розыгрыша первого билета, группа переиндексируется целиком
+            draw_masks = self._draw_masks.get(tickets[0].get('draw_id'))
+            if (draw_masks is not None and len(tickets) == len(ticket_ids)
+                    and all(map(draw_masks.positions.__contains__, ticket_ids))):
+                draw_masks.update(ticket_ids, fields)
+                return
+
+            # Иначе ID собираются подряд и переиндексируются пачками
+            draw_masks = None
+            batch: List[int] = []
+            for ticket in tickets:
+                ticket_id = ticket['id']
+                if draw_masks is None or ticket_id not in draw_masks.positions:
+                    if batch:
+                        draw_masks.update(batch, fields)
+                        batch = []
+                    draw_masks = self._draw_masks.get(ticket.get('draw_id'))
+                    if draw_masks is None:
+                        continue
+                batch.append(ticket_id)
+            if batch:
+                draw_masks.update(batch, fields)
+
+    def _index(self, ticket: Dict, is_new: bool):
+        """Добавить билет в массив масок и в группу "Мои билеты" его розыгрыша"""
+        draw_id = ticket.get('draw_id')
+        draw_masks = self._draw_masks.get(draw_id)
+        if draw_masks is None:
+            draw_masks = self._draw_masks[draw_id] = _DrawMasks()
+        draw_masks.put(ticket)
+
+        group = self._groups.get(draw_id)
+        if group is None:
+            group = self._groups[draw_id] = _TicketGroup()
+        if is_new:
+            group.add(ticket['id'])
+
+    def _count_ticket(self, ticket: Dict, sign: int):
+        """Учесть билет в выручке и счетчике состояний его розыгрыша (sign=-1 - исключить)"""
+        draw_id = ticket.get('draw_id')
+        price = ticket.get('price') or 0
+        if price:
+            self._draw_revenue[draw_id] = self._draw_revenue.get(draw_id, 0) + sign * price
+        group = self._groups.get(draw_id)
+        if group is not None:
+            group.count(ticket_state(ticket), sign)
+
+    @staticmethod
+    def _criteria(draw_id: Optional[int] = None, status: Optional[str] = None) -> Dict:
+        """Условия выборки по индексам (None - без условия)"""
+        criteria = {'draw_id': draw_id, 'status': status}
+        return {index: key for index, key in criteria.items() if key is not None}
+
+    def _current_max_id(self) -> int:
+        """Наибольший записанный ID билета"""
+        with self._lock:
+            self._refresh()
+            return self._max_id
+
+    def _maybe_compact(self):
+        """Запустить фоновое сворачивание, когда журнал вырос относительно снимка
+        
+        Порог пропорционален размеру снимка, поэтому затраты на
+        сворачивание в пересчете на одну запись журнала не растут с
+        количеством билетов.
+        """
+        snapshot_size = self._snapshot_signature[2] if self._snapshot_signature else 0
+        threshold = max(self.compact_min_bytes, snapshot_size * self.compact_ratio)
+        if self._compacting or self._journal_offset < threshold:
+            return
+        self._compacting = True
+        threading.Thread(target=self.compact, name='tickets-compaction', daemon=True).start()
+
+
+_ticket_store: Optional[TicketStore] = None
+_ticket_store_lock = threading.Lock()
+
+
+def get_ticket_store() -> TicketStore:
+    """Общее для процесса хранилище билетов"""
+    global _ticket_store
+    with _ticket_store_lock:
+        if _ticket_store is None:
+            _ticket_store = TicketStore(
+                JSON_FILES['tickets'],
+                TICKETS_JOURNAL_FILE,
+                TICKETS_JOURNAL_COMPACT_RATIO,
+                TICKETS_JOURNAL_COMPACT_MIN_BYTES
+            )
+        return _ticket_store
@@ -0,0 +1,175 @@
+"""
+Версии данных лотереи
+
+У каждой части данных ('draws', 'tickets', 'balance', 'packages',
+'banners') есть счетчик версий, который увеличивается после каждой
+зафиксированной записи этой части:
+- JSON хранилище - DataManager после записи файла из JSON_FILES (для
+  билетов - и журнала TICKETS_JOURNAL_FILE, для баланса - журнала
+  BALANCE_JOURNAL_FILE);
+- SQLite - после COMMIT транзакции, изменившей соответствующие таблицы.
+
+Счетчики лежат в файле VERSIONS_FILE, отображенном в память (mmap), и
+общие для всех процессов (воркеров gunicorn): чтение версии - это чтение
+памяти без обращения к хранилищу. Увеличение идет под fcntl.flock этого
+файла.
+
+Из версий строится строгий ETag GET ответов (utils/conditional.py). В ETag
+входит и случайная эпоха файла счетчиков: после удаления файла счетчики
+начинаются с нуля, но старые ETag уже не совпадут.
+
+Файлы данных, измененные вручную, версию не меняют - после правки:
+    python -m models.versions bump draws
+"""
+import fcntl
+import mmap
+import os
+import struct
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+from config import JSON_FILES, TICKETS_JOURNAL_FILE, BALANCE_JOURNAL_FILE, VERSIONS_FILE
+
+logger = logging.getLogger(__name__)
+
+# Части данных; позиция в кортеже - номер счетчика в файле,
+# поэтому новые части добавляются только в конец
+PARTITIONS = ('draws', 'tickets', 'balance', 'packages', 'banners')
+
+# Файл счетчиков: сигнатура, эпоха, затем счетчики по 8 байт
+_MAGIC = b'LVER'
+_HEADER = struct.Struct('<4s4xQ')
+_COUNTER = struct.Struct('<Q')
+_FILE_SIZE = 4096
+
+# Файлы JSON хранилища и части данных, которые они содержат
+FILE_PARTITIONS = {
+    **{os.path.normpath(path): partition for partition, path in JSON_FILES.items()},
+    os.path.normpath(TICKETS_JOURNAL_FILE): 'tickets',
+    os.path.normpath(BALANCE_JOURNAL_FILE): 'balance'
+}
+
+
+class VersionCounters:
+    """Общие для процессов счетчики версий частей данных"""
+
+    def __init__(self, filename: str = VERSIONS_FILE):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._epoch = 0
+        self._pid = None
+
+    def get(self, *partitions: str) -> Tuple[int, ...]:
+        """Текущие версии частей данных"""
+        counters = self._counters()
+        return tuple(_COUNTER.unpack_from(counters, self._offset(partition))[0] for partition in partitions)
+
+    def get_all(self) -> Dict[str, int]:
+        """Версии всех частей данных"""
+        return dict(zip(PARTITIONS, self.get(*PARTITIONS)))
+
+    def etag(self, *partitions: str) -> str:
+        """Значение строгого ETag для состояния частей данных (без кавычек)"""
+        versions = self.get(*partitions)
+        return f"{self._epoch:016x}-" + '.'.join(map(str, versions))
+
+    def bump(self, *partitions: str):
+        """Увеличить версии частей данных (после фиксации их записи)"""
+        try:
+            counters = self._counters()
+            with self._lock:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+                try:
+                    for partition in set(partitions):
+                        offset = self._offset(partition)
+                        version = _COUNTER.unpack_from(counters, offset)[0]
+                        _COUNTER.pack_into(counters, offset, version + 1)
+                finally:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+        except Exception as e:
+            # Запись данных уже зафиксирована, ее не отменяем
+            logger.error(f"Ошибка увеличения версий {partitions}: {e}")
+
+    def bump_file(self, filename: str):
+        """Увеличить версию части данных, которую содержит файл (если содержит)"""
+        partition = FILE_PARTITIONS.get(os.path.normpath(filename))
+        if partition is not None:
+            self.bump(partition)
+
+    # ========= ВНУТРЕННЕЕ =========
+
+    @staticmethod
+    def _offset(partition: str) -> int:
+        return _HEADER.size + PARTITIONS.index(partition) * _COUNTER.size
+
+    def _counters(self) -> mmap.mmap:
+        """Отображение файла счетчиков (открывается заново после fork)"""
+        if self._map is not None and self._pid == os.getpid():
+            return self._map
+        with self._lock:
+            if self._map is None or self._pid != os.getpid():
+                self._open()
+            return self._map
+
+    def _open(self):
+        """Открыть файл счетчиков, создав его с новой эпохой при отсутствии
+
+        После fork дескриптор открывается заново: блокировка flock общая
+        для всех копий унаследованного дескриптора и процессы не
+        исключали бы друг друга.
+        """
+        os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+        fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                header = os.pread(fd, _HEADER.size, 0)
+                if len(header) < _HEADER.size or header[:4] != _MAGIC:
+                    epoch = int.from_bytes(os.urandom(8), 'little')
+                    os.ftruncate(fd, 0)
+                    os.ftruncate(fd, _FILE_SIZE)
+                    os.pwrite(fd, _HEADER.pack(_MAGIC, epoch), 0)
+                    logger.info(f"Создан файл версий данных {self.filename}")
+                else:
+                    epoch = _HEADER.unpack(header)[1]
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            counters = mmap.mmap(fd, _FILE_SIZE)
+        except Exception:
+            os.close(fd)
+            raise
+
+        if self._fd is not None:
+            self._map.close()
+            os.close(self._fd)
+        self._fd, self._map, self._epoch, self._pid = fd, counters, epoch, os.getpid()
+
+
+_versions: Optional[VersionCounters] = None
+_versions_lock = threading.Lock()
+
+
+def get_versions() -> VersionCounters:
+    """Общие для процесса счетчики версий"""
+    global _versions
+    with _versions_lock:
+        if _versions is None:
+            _versions = VersionCounters()
+        return _versions
+
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    command = sys.argv[1:]
+    if command == ['show']:
+        print(get_versions().get_all())
+        sys.exit(0)
+    if command[:1] == ['bump'] and set(command[1:]) <= set(PARTITIONS):
+        get_versions().bump(*(command[1:] or PARTITIONS))
+        print(get_versions().get_all())
+        sys.exit(0)
+    print(f"Использование: python -m models.versions show|bump [{'|'.join(PARTITIONS)} ...]")
+    sys.exit(1)
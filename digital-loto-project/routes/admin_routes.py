@@ -1,17 +1,26 @@
 """
 Админские API маршруты
 """
+import os
 import logging
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, send_file
 from models.lottery import LotteryService
+from models.jobs import get_settlement_jobs
+from models.stats import check_counters, rebuild_counters
+from models.metrics import get_metrics
+from models.data_manager import DataManager
+from utils.json_stream import stream_json_response
+from utils.conditional import conditional
+from utils.request_profiler import list_profiles, profile_path, profile_report
 
 logger = logging.getLogger(__name__)
 
 # Создаем Blueprint для админских API маршрутов
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
-# Инициализируем сервис
+# Инициализируем сервисы
 lottery_service = LotteryService()
+settlement_jobs = get_settlement_jobs()
 
 # ========= УПРАВЛЕНИЕ БАЛАНСОМ =========
 
@@ -69,7 +78,12 @@ def update_balance():
 
 @admin_bp.route('/conduct_draw', methods=['POST'])
 def conduct_draw():
-    """Провести розыгрыш (для админки)"""
+    """Поставить проведение розыгрыша в очередь (для админки)
+    
+    Расчет билетов идет в фоне, ход выполнения - /api/admin/jobs/<job_id>.
+    С "sync": true небольшой розыгрыш проводится в запросе, и ответ
+    содержит итог со списком победителей.
+    """
     try:
         data = request.get_json()
         
@@ -89,15 +103,30 @@ def conduct_draw():
                 "code": "INVALID_DRAW_ID"
             }), 400
         
-        # Проводим розыгрыш через сервис
-        result = lottery_service.conduct_draw(draw_id)
-        
-        if result:
+        if data.get('sync'):
+            result = lottery_service.conduct_draw(draw_id)
+            if not result:
+                return jsonify({
+                    "success": False,
+                    "error": "Розыгрыш не найден или уже проведен",
+                    "code": "DRAW_ERROR"
+                }), 400
             return jsonify({
                 "success": True,
-                **result,
-                "message": f"Розыгрыш проведен. Победителей: {len(result['winners'])}"
+                "data": result,
+                "message": "Розыгрыш проведен"
             })
+        
+        # Ставим задачу проведения розыгрыша в очередь
+        job = settlement_jobs.submit(draw_id)
+        
+        if job:
+            return jsonify({
+                "success": True,
+                "job_id": job['id'],
+                "job": job,
+                "message": "Розыгрыш поставлен в очередь на проведение"
+            }), 202
         else:
             return jsonify({
                 "success": False,
@@ -113,24 +142,46 @@ def conduct_draw():
             "code": "INTERNAL_ERROR"
         }), 500
 
+@admin_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Состояние фоновой задачи: прогресс, скорость расчета, результат"""
+    try:
+        job = settlement_jobs.get_job(job_id)
+        
+        if not job:
+            return jsonify({
+                "success": False,
+                "error": "Задача не найдена",
+                "code": "JOB_NOT_FOUND"
+            }), 404
+        
+        return jsonify({
+            "success": True,
+            "job": job
+        })
+    except Exception as e:
+        logger.error(f"Ошибка получения задачи {job_id}: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Внутренняя ошибка сервера",
+            "code": "INTERNAL_ERROR"
+        }), 500
+
 @admin_bp.route('/draws', methods=['GET'])
+@conditional('draws', 'tickets')
 def get_draws():
-    draws = lottery_service.get_all_draws()
-    """Получить все розыгрыши"""
+    """Получить все розыгрыши с количеством проданных билетов и выручкой (потоком)"""
     try:
-        draws = lottery_service.get_all_draws()
-        tickets = lottery_service.get_user_tickets()
-        
-        # Добавляем счетчик билетов для каждого розыгрыша
-        for draw in draws:
-            draw['tickets_count'] = len([t for t in tickets if t.get('draw_id') == draw['id']])
-            draw['currency'] = 'COINS'
-            
-            # Форматирование времени для отображения
-            if draw.get('date') and draw.get('time'):
-                draw['time_left'] = f"{draw['date']} {draw['time']}"
-        
-        return jsonify(draws)
+        def listed_draws():
+            for draw in lottery_service.get_draws_with_sales():
+                listed = {**draw, 'currency': 'COINS'}
+                
+                # Форматирование времени для отображения
+                if draw.get('date') and draw.get('time'):
+                    listed['time_left'] = f"{draw['date']} {draw['time']}"
+                yield listed
+        
+        return stream_json_response(listed_draws())
     except Exception as e:
         logger.error(f"Ошибка получения розыгрышей: {e}")
         return jsonify([]), 500
@@ -236,9 +287,36 @@ def delete_draw(draw_id):
             "code": "INTERNAL_ERROR"
         }), 500
 
+@admin_bp.route('/draws/<int:draw_id>/combinations', methods=['GET'])
+@conditional('draws', 'tickets')
+def get_draw_combinations(draw_id):
+    """Количество ожидающих билетов и различных комбинаций розыгрыша"""
+    try:
+        stats = lottery_service.get_draw_combination_stats(draw_id)
+        
+        if stats is None:
+            return jsonify({
+                "success": False,
+                "error": "Розыгрыш не найден",
+                "code": "DRAW_NOT_FOUND"
+            }), 404
+        
+        return jsonify({
+            "success": True,
+            **stats
+        })
+    except Exception as e:
+        logger.error(f"Ошибка получения комбинаций розыгрыша {draw_id}: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Внутренняя ошибка сервера",
+            "code": "INTERNAL_ERROR"
+        }), 500
+
 # ========= УПРАВЛЕНИЕ ПАКЕТАМИ =========
 
 @admin_bp.route('/packages', methods=['GET'])
+@conditional('packages')
 def get_packages():
     """Получить все пакеты"""
     try:
@@ -349,9 +427,44 @@ def delete_package(package_id):
             "code": "INTERNAL_ERROR"
         }), 500
 
+# ========= ЖУРНАЛ ИЗМЕНЕНИЙ =========
+
+@admin_bp.route('/changes', methods=['GET'])
+def get_changes():
+    """Розыгрыши, пакеты, билеты и баланс, измененные после версии since
+    
+    Клиент передает в since значение version предыдущего ответа; при
+    reset он перечитывает все данные целиком. Без since возвращается
+    только текущая версия (с reset): клиент запоминает ее до первой
+    полной загрузки данных.
+    """
+    try:
+        since = request.args.get('since')
+        try:
+            since = int(since) if since is not None else None
+        except ValueError:
+            since = -1
+        if since is not None and since < 0:
+            return jsonify({
+                "success": False,
+                "error": "Неверная версия изменений",
+                "code": "INVALID_VERSION"
+            }), 400
+        
+        changes = lottery_service.get_changes(since)
+        return jsonify({"success": True, **changes})
+    except Exception as e:
+        logger.error(f"Ошибка получения журнала изменений: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Внутренняя ошибка сервера",
+            "code": "INTERNAL_ERROR"
+        }), 500
+
 # ========= СТАТИСТИКА =========
 
 @admin_bp.route('/stats', methods=['GET'])
+@conditional('draws', 'tickets', 'packages', 'balance')
 def get_stats():
     """Получить общую статистику"""
     try:
@@ -367,5 +480,108 @@ def get_stats():
             'current_balance': 0,
             'total_tickets': 0,
             'winning_tickets': 0,
-            'pending_tickets': 0
-        }), 500
\ No newline at end of file
+            'pending_tickets': 0,
+            'revenue': 0,
+            'prizes_paid': 0
+        }), 500
+
+@admin_bp.route('/stats/check', methods=['GET'])
+def check_stats():
+    """Сверить счетчики статистики с пересчетом по всем записям"""
+    try:
+        result = check_counters(lottery_service.storage)
+        return jsonify({"success": True, **result})
+    except Exception as e:
+        logger.error(f"Ошибка проверки счетчиков статистики: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Внутренняя ошибка сервера",
+            "code": "INTERNAL_ERROR"
+        }), 500
+
+@admin_bp.route('/stats/storage', methods=['GET'])
+def storage_stats():
+    """Ввод-вывод файлов данных всех воркеров и загрузки файлов по обработчикам
+    
+    files - загрузки, чтения с диска, байты и время разбора, кодирования
+    и fsync по файлам; endpoints - запросы и загрузки файлов по
+    обработчикам (loads_per_request выявляет повторные чтения); cache -
+    кэш разобранных файлов обрабатывающего воркера.
+    """
+    try:
+        return jsonify({"success": True, **DataManager.io_stats()})
+    except Exception as e:
+        logger.error(f"Ошибка получения статистики ввода-вывода: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Внутренняя ошибка сервера",
+            "code": "INTERNAL_ERROR"
+        }), 500
+
+@admin_bp.route('/stats/rebuild', methods=['POST'])
+def rebuild_stats():
+    """Построить счетчики статистики заново"""
+    try:
+        counters = rebuild_counters(lottery_service.storage)
+        return jsonify({"success": True, "counters": counters})
+    except Exception as e:
+        logger.error(f"Ошибка пересборки счетчиков статистики: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Внутренняя ошибка сервера",
+            "code": "INTERNAL_ERROR"
+        }), 500
+
+# ========= МЕТРИКИ =========
+
+@admin_bp.route('/metrics', methods=['GET'])
+def get_metrics_text():
+    """Метрики всех воркеров в текстовом формате Prometheus"""
+    try:
+        return Response(get_metrics().exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    except Exception as e:
+        logger.error(f"Ошибка выдачи метрик: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Внутренняя ошибка сервера",
+            "code": "INTERNAL_ERROR"
+        }), 500
+
+# ========= ПРОФИЛИ ЗАПРОСОВ =========
+
+@admin_bp.route('/profiles', methods=['GET'])
+def get_profiles():
+    """Сохраненные профили запросов (?__profile и выборочные), новые первыми"""
+    try:
+        return jsonify({"success": True, "profiles": list_profiles()})
+    except Exception as e:
+        logger.error(f"Ошибка получения списка профилей: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Внутренняя ошибка сервера",
+            "code": "INTERNAL_ERROR"
+        }), 500
+
+@admin_bp.route('/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Отчет профиля по накопленному времени (?download=1 - файл pstats)"""
+    try:
+        path = profile_path(profile_id)
+        if path is None:
+            return jsonify({
+                "success": False,
+                "error": "Профиль не найден",
+                "code": "PROFILE_NOT_FOUND"
+            }), 404
+        
+        if request.args.get('download') == '1':
+            return send_file(os.path.abspath(path), mimetype='application/octet-stream',
+                             as_attachment=True, download_name=f"{profile_id}.prof")
+        return Response(profile_report(profile_id), content_type='text/plain; charset=utf-8')
+    except Exception as e:
+        logger.error(f"Ошибка получения профиля {profile_id}: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Внутренняя ошибка сервера",
+            "code": "INTERNAL_ERROR"
+        }), 500
@@ -2,9 +2,14 @@
 API маршруты для AJAX запросов
 """
 import logging
-from flask import Blueprint, request, jsonify
+import queue
+from flask import Blueprint, Response, request, jsonify
 from models.lottery import LotteryService
+from models.events import get_event_broker, format_sse
 from utils.helpers import TicketGrouping
+from utils.json_stream import stream_json_response
+from utils.conditional import conditional
+from config import TICKETS_PAGE_SIZE, TICKETS_PAGE_MAX_SIZE, EVENTS_KEEPALIVE_INTERVAL, EVENTS_RETRY_MS
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +19,11 @@ api_bp = Blueprint('api', __name__, url_prefix='/api')
 # Инициализируем сервис
 lottery_service = LotteryService()
 
+# Значения, изменения которых рассылаются через /api/events
+event_broker = get_event_broker()
+event_broker.watch('balance', ('balance',), lambda: {'balance': lottery_service.get_balance()})
+event_broker.watch('stats', ('draws', 'tickets', 'packages', 'balance'), lottery_service.get_stats)
+
 @api_bp.route('/buy_ticket', methods=['POST'])
 def buy_ticket():
     """Покупка билета"""
@@ -55,6 +65,47 @@ def buy_ticket():
             "code": "INTERNAL_ERROR"
         }), 500
 
+@api_bp.route('/buy_tickets', methods=['POST'])
+def buy_tickets():
+    """Покупка нескольких билетов одного розыгрыша одной операцией"""
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({
+                "success": False,
+                "error": "Отсутствуют данные",
+                "code": "NO_DATA"
+            }), 400
+        
+        draw_id = data.get('draw_id')
+        numbers_list = data.get('numbers', [])
+        
+        # Валидация данных
+        if not draw_id or not numbers_list:
+            return jsonify({
+                "success": False,
+                "error": "Не указаны обязательные поля",
+                "code": "MISSING_FIELDS"
+            }), 400
+        
+        # Покупаем билеты через сервис
+        result = lottery_service.buy_tickets(draw_id, numbers_list)
+        
+        if result["success"]:
+            return jsonify(result)
+        else:
+            status_code = 404 if result["code"] == "DRAW_NOT_FOUND" else 400
+            return jsonify(result), status_code
+        
+    except Exception as e:
+        logger.error(f"Ошибка покупки билетов: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Внутренняя ошибка сервера",
+            "code": "INTERNAL_ERROR"
+        }), 500
+
 @api_bp.route('/buy_package', methods=['POST'])
 def buy_package():
     """Покупка пакета"""
@@ -94,6 +145,7 @@ def buy_package():
         }), 500
 
 @api_bp.route('/balance', methods=['GET'])
+@conditional('balance')
 def get_balance():
     """Получить текущий баланс"""
     try:
@@ -112,29 +164,67 @@ def get_balance():
         }), 500
 
 @api_bp.route('/tickets')
+@conditional('draws', 'tickets')
 def get_filtered_tickets():
-    """API для получения отфильтрованных билетов"""
+    """API для получения отфильтрованных билетов
+    
+    Параметры: status и draw_id (фильтры, 'all' - без фильтра). Без limit и
+    cursor отдаются все подходящие билеты; с ними - страница: limit (размер
+    страницы) и cursor (значение next_cursor предыдущей страницы).
+    count - билетов в ответе, total - всего подходящих билетов.
+    """
     try:
         status = request.args.get('status', 'all')
         draw_id = request.args.get('draw_id', 'all')
         
-        user_tickets = lottery_service.get_user_tickets()
-        draws = lottery_service.get_all_draws()
+        limit = None
+        if 'limit' in request.args or 'cursor' in request.args:
+            try:
+                limit = int(request.args.get('limit', TICKETS_PAGE_SIZE))
+            except (ValueError, TypeError):
+                limit = TICKETS_PAGE_SIZE
+            limit = min(max(limit, 1), TICKETS_PAGE_MAX_SIZE)
         
-        # Применяем фильтры
-        filtered_tickets = TicketGrouping.apply_ticket_filters(user_tickets, draws, status, draw_id)
+        after_id = 0
+        cursor = request.args.get('cursor')
+        if cursor:
+            after_id = TicketGrouping.decode_page_cursor(cursor)
+            if after_id is None:
+                return jsonify({
+                    "success": False,
+                    "error": "Неверный курсор страницы",
+                    "code": "INVALID_CURSOR"
+                }), 400
         
-        return jsonify({
+        # Фильтры применяются по индексам хранилища до обогащения билетов
+        try:
+            draw_filter = int(draw_id) if draw_id != 'all' else None
+        except (ValueError, TypeError):
+            draw_filter = None
+        state_filter = status if status != 'all' else None
+        
+        # Билеты отдаются потоком; количество и курсор известны после них
+        page = {}
+        tickets = lottery_service.iter_user_tickets_page(page, draw_filter, state_filter, after_id, limit)
+        total = lottery_service.count_user_tickets(draw_filter, state_filter)
+        
+        return stream_json_response({
             'success': True,
-            'tickets': filtered_tickets,
-            'count': len(filtered_tickets)
+            'tickets': tickets,
+            'count': lambda: page['count'],
+            'total': total,
+            'next_cursor': lambda: (
+                TicketGrouping.encode_page_cursor(page['next_after']) if page['next_after'] is not None else None
+            )
         })
     except Exception as e:
         logger.error(f"Ошибка получения билетов: {e}")
         return jsonify({
             'success': False,
             'tickets': [],
-            'count': 0
+            'count': 0,
+            'total': 0,
+            'next_cursor': None
         }), 500
 
 @api_bp.route('/tickets/<int:ticket_id>', methods=['PUT'])
@@ -174,4 +264,107 @@ def update_ticket(ticket_id):
             "success": False,
             "error": "Внутренняя ошибка сервера",
             "code": "INTERNAL_ERROR"
-        }), 500
\ No newline at end of file
+        }), 500
+@api_bp.route('/winners/<int:draw_id>', methods=['GET'])
+@conditional('draws', 'tickets')
+def get_winners(draw_id):
+    """Получить список победителей конкретного розыгрыша (потоком, по убыванию приза)"""
+    try:
+        draw = lottery_service.get_draw_by_id(draw_id)
+        if not draw:
+            return jsonify({
+                "success": False,
+                "error": "Розыгрыш не найден",
+                "code": "DRAW_NOT_FOUND"
+            }), 404
+        
+        if not draw.get('completed', False):
+            return jsonify({
+                "success": False,
+                "error": "Розыгрыш еще не проведен",
+                "code": "DRAW_NOT_COMPLETED"
+            }), 400
+        
+        # Итоги известны после выдачи победителей и идут после них
+        summary = {}
+        return stream_json_response({
+            "success": True,
+            "data": {
+                "draw": draw,
+                "winners": lottery_service.iter_draw_winners(draw_id, summary),
+                "total_winners": lambda: summary['total_winners'],
+                "total_prize_amount": lambda: summary['total_prize_amount']
+            },
+            "message": lambda: f"Найдено {summary['total_winners']} победителей"
+        })
+        
+    except Exception as e:
+        logger.error(f"Ошибка получения победителей розыгрыша {draw_id}: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Внутренняя ошибка сервера",
+            "code": "INTERNAL_ERROR"
+        }), 500
+
+@api_bp.route('/events', methods=['GET'])
+def events():
+    """Поток событий (Server-Sent Events)
+    
+    При подключении отправляются текущие баланс (balance) и статистика
+    (stats), затем - их новые значения с изменениями (changes) и
+    проведенные розыгрыши (draw_completed). Клиент с заголовком
+    Last-Event-ID получает пропущенные draw_completed.
+    """
+    try:
+        last_id = request.headers.get('Last-Event-ID', type=int)
+        if not event_broker.has_capacity():
+            return jsonify({
+                "success": False,
+                "error": "Слишком много подключений к потоку событий",
+                "code": "TOO_MANY_SUBSCRIBERS"
+            }), 503, {'Retry-After': str(max(1, EVENTS_RETRY_MS // 1000))}
+    except Exception as e:
+        logger.error(f"Ошибка подписки на события: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Внутренняя ошибка сервера",
+            "code": "INTERNAL_ERROR"
+        }), 500
+    
+    def stream():
+        # Подписка - только когда сервер начал отдавать поток: ответ, который
+        # так и не был отправлен, не оставляет подписчика в брокере
+        subscriber = event_broker.subscribe()
+        if subscriber is None:
+            # Место заняли между проверкой и началом потока: клиент переподключится
+            yield f"retry: {EVENTS_RETRY_MS}\n\n"
+            return
+        sent_id = last_id
+        try:
+            yield f"retry: {EVENTS_RETRY_MS}\n\n"
+            for event in event_broker.current():
+                yield format_sse(event)
+            if last_id is not None:
+                for event in event_broker.replay(last_id):
+                    sent_id = event['id']
+                    yield format_sse(event)
+            
+            while not subscriber.lost:
+                try:
+                    event = subscriber.events.get(timeout=EVENTS_KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    # Комментарий держит соединение и выявляет отключившихся клиентов
+                    yield ": keepalive\n\n"
+                    continue
+                # Пропущенные события могли прийти и из файла, и из очереди
+                if 'id' in event and sent_id is not None and event['id'] <= sent_id:
+                    continue
+                sent_id = event.get('id', sent_id)
+                yield format_sse(event)
+        finally:
+            event_broker.unsubscribe(subscriber)
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
@@ -2,12 +2,13 @@
 Веб-маршруты для отображения HTML страниц
 """
 import logging
+import os
 from flask import Blueprint, render_template, abort
 from models.lottery import LotteryService
 from models.data_manager import DataManager
-from utils.helpers import TicketGrouping
+from utils.conditional import conditional
 from config import JSON_FILES
-from flask import Blueprint, render_template, abort, redirect, url_for
+from flask import Blueprint, render_template, abort, redirect, url_for, current_app, send_file
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +19,13 @@ web_bp = Blueprint('web', __name__)
 lottery_service = LotteryService()
 data_manager = DataManager()
 
+# Файлы данных приложения в static/data: имя файла без .json -> часть данных
+STATIC_DATA_FEEDS = {
+    os.path.splitext(os.path.basename(path))[0]: partition
+    for partition, path in JSON_FILES.items()
+    if os.path.dirname(os.path.normpath(path)) == os.path.join('static', 'data')
+}
+
 @web_bp.route('/')
 def index():
     """Главная страница"""
@@ -41,15 +49,10 @@ def index():
 def tickets():
     """Страница "Мои билеты" с группировкой и фильтрами"""
     try:
-        user_tickets = lottery_service.get_user_tickets()
-        draws = lottery_service.get_all_draws()
         balance = lottery_service.get_balance()
         
-        # Группируем билеты по розыгрышам
-        grouped_tickets = TicketGrouping.group_tickets_by_draw(user_tickets, draws)
-        
-        # Получаем список розыгрышей для фильтра
-        draw_filters = TicketGrouping.get_draws_for_filter(user_tickets, draws)
+        # Группы по розыгрышам и фильтр берутся из готового представления
+        grouped_tickets, draw_filters = lottery_service.get_my_tickets_view()
         
         return render_template('tickets.html', 
                              grouped_tickets=grouped_tickets,
@@ -140,4 +143,24 @@ def buy_ticket(draw_id):
 def buy_ticket_redirect():
     """Редирект на главную если не указан ID розыгрыша"""
     logger.info("Попытка доступа к покупке билета без указания ID розыгрыша")
-    return redirect(url_for('web.index'))
\ No newline at end of file
+    return redirect(url_for('web.index'))
+
+
+@web_bp.route('/static/data/<name>.json')
+def static_data(name):
+    """JSON файлы static/data с ETag по версии данных
+    
+    Файлы, которые пишет приложение (розыгрыши), отдаются с ETag из
+    версии их части данных, и совпавший If-None-Match получает 304 без
+    обращения к файлу. Остальные (баннеры главной страницы) отдает
+    обработчик статики Flask с ETag по времени изменения и размеру файла.
+    """
+    partition = STATIC_DATA_FEEDS.get(name)
+    if partition is None:
+        return current_app.send_static_file(f'data/{name}.json')
+    
+    @conditional(partition)
+    def send_feed():
+        return send_file(os.path.abspath(JSON_FILES[partition]), mimetype='application/json',
+                         etag=False, conditional=False)
+    return send_feed()
@@ -221,16 +221,33 @@ class AdminAPI {
     }
 
     async conductDraw(drawId) {
-        const data = await this.makeRequest('/api/conduct_draw', {
+        const data = await this.makeRequest('/api/admin/conduct_draw', {
             method: 'POST',
             body: JSON.stringify({ draw_id: drawId })
         });
         
-        if (data.success) {
-            this.showSuccess(`Розыгрыш проведен! Выигрышные числа: ${data.winning_numbers.join(', ')}`);
-            return data;
+        if (!data.success) {
+            throw new Error(data.error);
         }
-        throw new Error(data.error);
+        
+        const job = await this.waitForJob(data.job_id);
+        if (job.status === 'completed') {
+            this.showSuccess(`Розыгрыш проведен! Выигрышные числа: ${job.result.winning_numbers.join(', ')}`);
+            return job.result;
+        }
+        throw new Error(job.error);
+    }
+
+    // Ожидание завершения фоновой задачи: опрос раз в секунду, не больше maxAttempts раз
+    async waitForJob(jobId, maxAttempts = 900) {
+        for (let attempt = 0; attempt < maxAttempts; attempt++) {
+            const data = await this.makeRequest(`/api/admin/jobs/${jobId}`);
+            if (data.job.status === 'completed' || data.job.status === 'failed') {
+                return data.job;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+        throw new Error(`Задача ${jobId} еще выполняется, ход выполнения: /api/admin/jobs/${jobId}`);
     }
 
     // Методы для работы с пакетами
@@ -278,7 +295,7 @@ class AdminAPI {
 
     // Методы для работы со статистикой
     async getStats() {
-        return await this.makeRequest('/api/stats');
+        return await this.makeRequest('/api/admin/stats');
     }
 
     async getTickets() {
@@ -288,6 +305,12 @@ class AdminAPI {
     async getBalance() {
         return await this.makeRequest('/api/balance');
     }
+
+    // Изменения после версии since (без since - только текущая версия)
+    async getChanges(since = null) {
+        const query = since === null ? '' : `?since=${since}`;
+        return await this.makeRequest(`/api/admin/changes${query}`);
+    }
 }
 
 // Расширенный класс AdminPanel с интеграцией API
@@ -295,11 +318,19 @@ class EnhancedAdminPanel extends AdminPanel {
     constructor() {
         super();
         this.api = new AdminAPI();
+        // Загруженные розыгрыши и пакеты по ID и версия журнала изменений,
+        // до которой они синхронизированы (null - данные еще не загружены)
+        this.draws = new Map();
+        this.packages = new Map();
+        this.changesVersion = null;
         this.initRealTimeUpdates();
     }
 
     async loadInitialData() {
         try {
+            // Версия запоминается до загрузки: изменения во время загрузки придут при синхронизации
+            const { version } = await this.api.getChanges();
+
             // Загружаем все данные параллельно
             const [draws, packages, tickets, balance, stats] = await Promise.all([
                 this.api.getDraws(),
@@ -309,6 +340,10 @@ class EnhancedAdminPanel extends AdminPanel {
                 this.api.getStats()
             ]);
 
+            this.draws = new Map(draws.map(draw => [draw.id, draw]));
+            this.packages = new Map(packages.map(pkg => [pkg.id, pkg]));
+            this.changesVersion = version;
+
             this.updateDrawsTable(draws);
             this.updatePackagesTable(packages);
             this.updateTicketsTable(tickets);
@@ -320,6 +355,36 @@ class EnhancedAdminPanel extends AdminPanel {
         }
     }
 
+    // Применить изменения после последней синхронизации вместо полной перезагрузки
+    async syncChanges() {
+        if (this.changesVersion === null) {
+            return await this.loadInitialData();
+        }
+
+        let changes;
+        do {
+            changes = await this.api.getChanges(this.changesVersion);
+            if (changes.reset) {
+                // Журнал уже не хранит изменений после нашей версии
+                return await this.loadInitialData();
+            }
+
+            // Розыгрыши приходят с продажами (tickets_count, revenue), в том числе
+            // розыгрыши купленных билетов
+            changes.draws.forEach(draw => this.draws.set(draw.id, draw));
+            changes.packages.forEach(pkg => this.packages.set(pkg.id, pkg));
+            changes.deleted.draws.forEach(id => this.draws.delete(id));
+            changes.deleted.packages.forEach(id => this.packages.delete(id));
+            if (changes.balance !== null) {
+                this.updateBalance(changes.balance);
+            }
+            this.changesVersion = changes.version;
+        } while (changes.has_more);
+
+        this.updateDrawsTable([...this.draws.values()]);
+        this.updatePackagesTable([...this.packages.values()]);
+    }
+
     async handleDrawSubmit(e) {
         e.preventDefault();
         const formData = new FormData(e.target);
@@ -368,8 +433,7 @@ class EnhancedAdminPanel extends AdminPanel {
 
     async refreshDrawsTable() {
         try {
-            const draws = await this.api.getDraws();
-            this.updateDrawsTable(draws);
+            await this.syncChanges();
         } catch (error) {
             console.error('Ошибка обновления таблицы розыгрышей:', error);
         }
@@ -377,8 +441,7 @@ class EnhancedAdminPanel extends AdminPanel {
 
     async refreshPackagesTable() {
         try {
-            const packages = await this.api.getPackages();
-            this.updatePackagesTable(packages);
+            await this.syncChanges();
         } catch (error) {
             console.error('Ошибка обновления таблицы пакетов:', error);
         }
@@ -492,7 +555,28 @@ class EnhancedAdminPanel extends AdminPanel {
     }
 
     initRealTimeUpdates() {
-        // Периодическое обновление данных (каждые 30 секунд)
+        // События сервера: статистика, баланс и проведенные розыгрыши
+        if (window.EventSource) {
+            const events = new EventSource('/api/events');
+            events.addEventListener('stats', (e) => {
+                this.updateStats(JSON.parse(e.data));
+            });
+            events.addEventListener('balance', (e) => {
+                this.updateBalance(JSON.parse(e.data).balance);
+            });
+            events.addEventListener('draw_completed', async (e) => {
+                const draw = JSON.parse(e.data);
+                this.api.showSuccess(`Розыгрыш ${draw.title} проведен, победителей: ${draw.winners_count}`);
+                try {
+                    await this.syncChanges();
+                } catch (error) {
+                    console.error('Ошибка обновления розыгрышей:', error);
+                }
+            });
+            return;
+        }
+
+        // Без EventSource - периодическое обновление данных (каждые 30 секунд)
         setInterval(async () => {
             if (document.visibilityState === 'visible') {
                 try {
@@ -216,8 +216,8 @@ class TicketFilter {
             
             if (data.success) {
                 this.renderTickets(data.tickets);
-                this.updateCounter(data.count);
-                this.toggleEmptyState(data.count === 0);
+                this.updateCounter(data.total);
+                this.toggleEmptyState(data.total === 0);
             } else {
                 console.error('Ошибка загрузки билетов:', data.error);
                 this.showError('Не удалось загрузить билеты');
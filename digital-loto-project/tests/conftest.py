@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import support
+
+# Модели держат общие для процесса хранилища, поэтому каталог данных один на сеанс
+support.configure(tempfile.mkdtemp(prefix='loto-tests-'))
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    return create_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def lottery_service():
+    from models.lottery import LotteryService
+    return LotteryService()
+
+
+@pytest.fixture
+def new_draw(lottery_service):
+    """Фабрика розыгрышей: у каждого теста свои билеты"""
+    def create(category: str = 'express') -> dict:
+        return lottery_service.add_draw({'title': 'Тест', 'category': category, 'cost': 5, 'time_left': '1'})
+    return create
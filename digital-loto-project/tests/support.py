@@ -0,0 +1,52 @@
+"""
+Окружение тестов: каталог данных, настройки и общие действия
+
+Пути файлов данных в config.py относительные, поэтому тесты работают в
+отдельном каталоге (текущий каталог процесса). Дочерние процессы тестов
+вызывают configure() с тем же каталогом до импорта моделей.
+"""
+import json
+import os
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Маленькие части расчета: задача розыгрыша из тысяч билетов идет в несколько частей
+TEST_CONFIG = {
+    'SETTLEMENT_JOB_CHUNK_SIZE': 500,
+    'FSYNC_WRITES': False
+}
+
+
+def configure(data_dir: str):
+    """Перейти в каталог данных, создать начальные файлы и применить TEST_CONFIG"""
+    if PROJECT_DIR not in sys.path:
+        sys.path.insert(0, PROJECT_DIR)
+    os.chdir(data_dir)
+    os.makedirs('static/data', exist_ok=True)
+    os.makedirs('data', exist_ok=True)
+    initial = {
+        'static/data/draws.json': {'draws': []},
+        'data/tickets.json': {'tickets': []},
+        'data/balance.json': {'balance': 1000000.0},
+        'data/packages.json': {'packages': []},
+        'data/banners.json': {'banners': []}
+    }
+    for filename, data in initial.items():
+        if not os.path.exists(filename):
+            with open(filename, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+
+    import config
+    for name, value in TEST_CONFIG.items():
+        setattr(config, name, value)
+
+
+def buy_tickets(client, draw_id: int, count: int) -> list:
+    """Купить count билетов розыгрыша по одному через API, вернуть их ID"""
+    ids = []
+    for position in range(count):
+        response = client.post('/api/buy_ticket', json={'draw_id': draw_id, 'numbers': [1, 2, 3, 4, 5, position + 6]})
+        assert response.status_code == 200, response.get_json()
+        ids.append(response.get_json()['data']['ticket']['id'])
+    return ids
@@ -0,0 +1,39 @@
+from models.lottery import LotteryService
+from config import MAX_TICKETS_PER_PURCHASE, TICKET_PRICES
+
+
+def test_bulk_buy_debits_once(client, new_draw, monkeypatch):
+    draw = new_draw('express')
+    debits = []
+    update_balance = LotteryService.update_balance
+    monkeypatch.setattr(LotteryService, 'update_balance',
+                        lambda self, balance: debits.append(balance) or update_balance(self, balance))
+    balance = client.get('/api/balance').get_json()['data']['balance']
+
+    numbers = [[1, 2, 3, 4, 5, position] for position in range(6, 16)]
+    response = client.post('/api/buy_tickets', json={'draw_id': draw['id'], 'numbers': numbers})
+    assert response.status_code == 200, response.get_json()
+
+    data = response.get_json()['data']
+    ids = [ticket['id'] for ticket in data['tickets']]
+    assert ids == list(range(ids[0], ids[0] + len(numbers)))
+    assert [ticket['numbers'] for ticket in data['tickets']] == numbers
+    assert debits == [data['new_balance']] == [balance - TICKET_PRICES['express'] * len(numbers)]
+
+
+def test_bulk_buy_rejects_whole_purchase(client, new_draw):
+    draw = new_draw('express')
+    balance = client.get('/api/balance').get_json()['data']['balance']
+
+    numbers = [[1, 2, 3, 4, 5, 6], [1, 1, 2, 3, 4, 5], [7, 8, 9, 10, 11, 12]]
+    response = client.post('/api/buy_tickets', json={'draw_id': draw['id'], 'numbers': numbers})
+    assert response.status_code == 400
+    assert response.get_json()['code'] == 'INVALID_NUMBERS' and response.get_json()['index'] == 1
+
+    response = client.post('/api/buy_tickets', json={
+        'draw_id': draw['id'], 'numbers': [[1, 2, 3, 4, 5, 6]] * (MAX_TICKETS_PER_PURCHASE + 1)
+    })
+    assert response.status_code == 400 and response.get_json()['code'] == 'TOO_MANY_TICKETS'
+
+    assert client.get('/api/balance').get_json()['data']['balance'] == balance
+    assert client.get(f"/api/tickets?draw_id={draw['id']}").get_json()['total'] == 0
@@ -0,0 +1,44 @@
+from models import changes
+from models.changes import ChangeLog
+from support import buy_tickets
+
+
+def test_changes_feed_sends_changed_records_with_sales(client, new_draw, lottery_service):
+    start = client.get('/api/admin/changes').get_json()
+    assert start['reset'] and not start['has_more']
+
+    draw, removed = new_draw('express'), new_draw('express')
+    bought = buy_tickets(client, draw['id'], 2)
+    assert lottery_service.delete_draw(removed['id'])
+
+    feed = client.get(f"/api/admin/changes?since={start['version']}").get_json()
+    assert feed['success'] and not feed['reset'] and not feed['has_more']
+    assert [ticket['id'] for ticket in feed['tickets']] == bought
+    assert [(item['id'], item['tickets_count'], item['revenue']) for item in feed['draws']] == [(draw['id'], 2, 10)]
+    assert feed['deleted']['draws'] == [removed['id']]
+    assert feed['balance'] == lottery_service.get_balance()
+
+    latest = client.get(f"/api/admin/changes?since={feed['version']}").get_json()
+    assert latest['version'] == feed['version'] and latest['tickets'] == latest['draws'] == []
+    assert latest['balance'] is None
+
+    assert client.get(f"/api/admin/changes?since={feed['version'] + 1}").get_json()['reset']
+    assert client.get('/api/admin/changes?since=abc').status_code == 400
+
+
+def test_change_log_pages_and_large_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(changes, 'CHANGES_MAX_IDS', 3)
+    change_log = ChangeLog(str(tmp_path / 'changes.jsonl'))
+    change_log.record('tickets', 'upsert', [1, 2])
+    change_log.record('tickets', 'update', range(10, 20), draw_ids=[7, 7])
+    change_log.record('balance', 'update')
+    change_log.record('draws', 'delete', [5])
+
+    first = change_log.collect(0, max_records=2)
+    assert first['version'] == 1 and first['has_more'] and first['ids']['tickets'] == {1, 2}
+
+    rest = change_log.collect(first['version'], max_records=100)
+    assert rest['version'] == change_log.version() == 4 and not rest['has_more']
+    # Изменение больше CHANGES_MAX_IDS билетов записано розыгрышем
+    assert rest['ticket_draws'] == {7} and rest['ids']['tickets'] == set()
+    assert rest['balance'] and rest['ids']['draws'] == {5}
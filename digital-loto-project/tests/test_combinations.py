@@ -0,0 +1,61 @@
+import random
+from array import array
+import pytest
+from models.data_manager import DataManager
+from models.ticket_store import BULK_CHANGES, TicketStore
+from utils import ticket_masks
+from utils.ticket_masks import group_by_matches, new_mask_array, numbers_to_mask
+
+A, B, C = [1, 2, 3, 4, 5, 6], [7, 8, 9, 10, 11, 12], [1, 2, 3, 10, 11, 12]
+
+
+def make_store(tmp_path) -> TicketStore:
+    return TicketStore(str(tmp_path / 'tickets.json'), str(tmp_path / 'tickets.journal.jsonl'), 0.5, 1 << 20)
+
+
+def new_tickets(numbers: list, count: int) -> list:
+    return [{'draw_id': 1, 'numbers': numbers, 'status': 'pending'} for _ in range(count)]
+
+
+def test_combination_index_follows_purchases_and_edits(tmp_path):
+    DataManager.save_json(str(tmp_path / 'tickets.json'), {'tickets': []})
+    store = make_store(tmp_path)
+    ids = [ticket['id'] for ticket in store.add_tickets(new_tickets(A, 3) + new_tickets(B, 2))]
+    assert store.get_combination_stats(1) == {'tickets': 5, 'combinations': 2}
+
+    store.update_ticket(ids[0], {'numbers': C})
+    store.update_ticket(ids[3], {'status': 'completed'})
+    assert store.get_combination_stats(1) == {'tickets': 4, 'combinations': 3}
+
+    # Другой процесс строит индекс по снимку и журналу
+    assert make_store(tmp_path).get_combination_stats(1) == {'tickets': 4, 'combinations': 3}
+
+    # Массовое изменение сбрасывает индекс, он строится заново по маскам
+    bulk = [ticket['id'] for ticket in store.add_tickets(new_tickets(C, BULK_CHANGES + 1))]
+    assert store.get_combination_stats(1) == {'tickets': BULK_CHANGES + 5, 'combinations': 3}
+    store.update_ticket_groups([(bulk, {'status': 'completed'})])
+    assert store.get_combination_stats(1) == {'tickets': 4, 'combinations': 3}
+    store.update_ticket(ids[4], {'numbers': A})
+    assert store.get_combination_stats(1) == {'tickets': 4, 'combinations': 2}
+    assert store.get_combination_stats(2) == {'tickets': 0, 'combinations': 0}
+
+
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_group_by_matches_counts_each_combination_once(monkeypatch, vectorized):
+    if vectorized and ticket_masks.np is None:
+        pytest.skip('NumPy не установлен')
+    if not vectorized:
+        monkeypatch.setattr(ticket_masks, 'np', None)
+
+    rng = random.Random(3)
+    numbers = [sorted(rng.sample(range(1, 13), 6)) for _ in range(2000)]
+    ids = array('q', rng.sample(range(1, 10000), len(numbers)))
+    winning = [1, 2, 3, 4, 5, 6]
+
+    groups = group_by_matches(ids, new_mask_array(map(numbers_to_mask, numbers)), numbers_to_mask(winning))
+
+    expected = {}
+    for ticket_id, ticket_numbers in zip(ids, numbers):
+        expected.setdefault(len(set(ticket_numbers) & set(winning)), []).append(ticket_id)
+    assert list(groups) == sorted(expected)
+    assert groups == {matches: sorted(group) for matches, group in expected.items()}
@@ -0,0 +1,37 @@
+from models.lottery import LotteryService
+from support import buy_tickets
+
+
+def test_etag_follows_data_versions(client, new_draw, monkeypatch):
+    draw = new_draw('express')
+    balance = client.get('/api/balance')
+    packages = client.get('/api/admin/packages')
+    etag = balance.headers['ETag']
+    assert balance.status_code == 200 and balance.headers['Cache-Control'] == 'no-cache'
+
+    # Совпавший ETag получает 304 без обращения к хранилищу
+    with monkeypatch.context() as patch:
+        patch.setattr(LotteryService, 'get_balance', lambda self: 1 / 0)
+        response = client.get('/api/balance', headers={'If-None-Match': etag})
+    assert response.status_code == 304 and response.headers['ETag'] == etag and not response.data
+
+    buy_tickets(client, draw['id'], 1)
+
+    # Покупка меняет версию баланса, но не пакетов
+    response = client.get('/api/balance', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+    assert response.get_json()['data']['balance'] == balance.get_json()['data']['balance'] - 5
+    response = client.get('/api/admin/packages', headers={'If-None-Match': packages.headers['ETag']})
+    assert response.status_code == 304
+
+
+def test_static_draws_feed_follows_draw_writes(client, new_draw):
+    feed = client.get('/static/data/draws.json')
+    assert feed.status_code == 200 and feed.headers['Cache-Control'] == 'no-cache'
+    etag = feed.headers['ETag']
+    assert client.get('/static/data/draws.json', headers={'If-None-Match': etag}).status_code == 304
+
+    draw = new_draw('express')
+    response = client.get('/static/data/draws.json', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+    assert draw['id'] in [item['id'] for item in response.get_json()['draws']]
@@ -0,0 +1,18 @@
+from support import buy_tickets
+
+
+def test_draw_sales_follow_purchases(client, new_draw):
+    draw, other = new_draw('express'), new_draw('big')
+    buy_tickets(client, draw['id'], 3)
+    response = client.post('/api/buy_tickets', json={'draw_id': draw['id'], 'numbers': [[1, 2, 3, 4, 5, 6]] * 2})
+    assert response.status_code == 200, response.get_json()
+    ticket_id = response.get_json()['data']['tickets'][0]['id']
+    # Изменение чисел билета не меняет продажи
+    assert client.put(f'/api/tickets/{ticket_id}', json={'numbers': [7, 8, 9, 10, 11, 12]}).status_code == 200
+
+    listed = {item['id']: item for item in client.get('/api/admin/draws').get_json()}
+    assert listed[draw['id']]['tickets_count'] == 5 and listed[draw['id']]['revenue'] == 25
+    assert listed[other['id']]['tickets_count'] == 0 and listed[other['id']]['revenue'] == 0
+
+    tickets = client.get(f"/api/tickets?draw_id={draw['id']}").get_json()['tickets']
+    assert listed[draw['id']]['revenue'] == sum(ticket['price'] for ticket in tickets)
@@ -0,0 +1,61 @@
+import json
+from models import events
+from models.events import EventBroker
+
+
+def read_events(chunks, count: int) -> list:
+    """Первые count событий потока text/event-stream (без retry и keepalive)"""
+    received = []
+    for chunk in chunks:
+        for block in chunk.decode('utf-8').split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line and line[0] != ':')
+            if 'event' in fields:
+                received.append({**fields, 'data': json.loads(fields['data'])})
+        if len(received) >= count:
+            return received[:count]
+    return received
+
+
+def test_broker_delivers_published_and_watched_events(tmp_path, monkeypatch):
+    monkeypatch.setattr(events, 'EVENTS_POLL_INTERVAL', 0.01)
+    broker = EventBroker(str(tmp_path / 'events.jsonl'), max_subscribers=1)
+    value = {'balance': 10}
+    broker.watch('balance', ('balance',), lambda: dict(value))
+    versions = events.get_versions()
+
+    subscriber = broker.subscribe()
+    assert subscriber is not None and broker.subscribe() is None
+    try:
+        published = broker.publish('draw_completed', {'draw_id': 1})
+        assert subscriber.events.get(timeout=5) == published
+        # Второе событие приходит на следующем проходе брокера: первый проход
+        # уже запомнил версии и значение отслеживаемого баланса
+        second = broker.publish('draw_completed', {'draw_id': 2})
+        assert subscriber.events.get(timeout=5) == second
+
+        value['balance'] = 7
+        versions.bump('balance')
+        assert subscriber.events.get(timeout=5) == {'type': 'balance', 'data': {'balance': 7, 'changes': {'balance': -3}}}
+    finally:
+        broker.unsubscribe(subscriber)
+
+    assert broker.has_capacity()
+    assert broker.replay(published['id']) == [second]
+
+
+def test_events_stream(client, monkeypatch):
+    published = events.get_event_broker().publish('draw_completed', {'draw_id': 1})
+
+    response = client.get('/api/events', headers={'Last-Event-ID': str(published['id'] - 1)}, buffered=False)
+    try:
+        assert response.mimetype == 'text/event-stream'
+        received = read_events(response.response, 3)
+        assert [event['event'] for event in received] == ['balance', 'stats', 'draw_completed']
+        assert received[2]['id'] == str(published['id']) and received[2]['data'] == published['data']
+    finally:
+        response.close()
+
+    monkeypatch.setattr(events.get_event_broker(), 'max_subscribers', 0)
+    response = client.get('/api/events')
+    assert response.status_code == 503 and response.get_json()['code'] == 'TOO_MANY_SUBSCRIBERS'
+    assert response.headers['Retry-After']
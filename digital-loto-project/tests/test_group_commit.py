@@ -0,0 +1,59 @@
+import os
+import threading
+from collections import Counter
+from models import data_manager
+from models.data_manager import DataManager
+from config import BALANCE_JOURNAL_FILE, JSON_FILES, TICKETS_JOURNAL_FILE
+
+PURCHASES = 16
+
+
+def test_concurrent_purchases_share_fsyncs(lottery_service, new_draw, monkeypatch):
+    draw = new_draw('express')
+    fsyncs = Counter()
+    fsync = os.fsync
+
+    def counting_fsync(fd):
+        fsyncs[os.path.relpath(os.readlink(f'/proc/self/fd/{fd}'))] += 1
+        fsync(fd)
+
+    monkeypatch.setattr(data_manager, 'FSYNC_WRITES', True)
+    monkeypatch.setattr(os, 'fsync', counting_fsync)
+    # Окно шире времени покупки: пакет собирает покупки, прошедшие транзакцию за окно
+    monkeypatch.setattr(data_manager._group_commit, 'window', 0.05)
+
+    start = threading.Barrier(PURCHASES)
+    results = []
+
+    def buy(position: int):
+        start.wait()
+        results.append(lottery_service.buy_ticket(draw['id'], [1, 2, 3, 4, 5, position + 6]))
+
+    threads = [threading.Thread(target=buy, args=(position,)) for position in range(PURCHASES)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(result['success'] for result in results), results
+    assert lottery_service.storage.count_tickets(draw['id']) == PURCHASES
+
+    # Покупки только дописывают журналы билетов и баланса, а их fsync
+    # выполняется общими пакетами после транзакций
+    assert 0 < fsyncs[os.path.normpath(TICKETS_JOURNAL_FILE)] < PURCHASES
+    assert 0 < fsyncs[os.path.normpath(BALANCE_JOURNAL_FILE)] < PURCHASES
+    assert sum(fsyncs.values()) < PURCHASES
+
+
+def test_balance_journal_skips_torn_line_and_compacts(monkeypatch):
+    balance = DataManager.load_balance()
+    assert DataManager.save_balance(balance - 1)
+    with open(BALANCE_JOURNAL_FILE, 'a') as f:
+        f.write('{"balance": 12')
+    assert DataManager.load_balance() == balance - 1
+
+    monkeypatch.setattr(data_manager, 'BALANCE_JOURNAL_MAX_BYTES', 1)
+    assert DataManager.save_balance(balance - 2)
+    assert os.path.getsize(BALANCE_JOURNAL_FILE) == 0
+    assert DataManager.load_json(JSON_FILES['balance']) == {'balance': balance - 2}
+    assert DataManager.load_balance() == balance - 2
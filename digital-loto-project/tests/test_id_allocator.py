@@ -0,0 +1,22 @@
+from models.id_allocator import IdAllocator
+
+
+def test_processes_get_disjoint_blocks(tmp_path):
+    sequences_file = str(tmp_path / 'sequences.json')
+    first, second = (IdAllocator(sequences_file, {'draws': 3}) for _ in range(2))
+
+    ids = [first.allocate('draws'), second.allocate('draws'), first.allocate('draws'), second.allocate('draws', 3)]
+    assert ids == [1, 4, 2, 7]
+    assert first.peek('draws') == 3
+    # Непрерывный диапазон больше остатка блока берется из нового блока
+    assert first.allocate('draws', 2) == 10
+
+    # Новый процесс продолжает после всех зарезервированных блоков и не ниже данных
+    assert IdAllocator(sequences_file, {'draws': 3}).allocate('draws') == 13
+    assert IdAllocator(sequences_file, {'draws': 3}).allocate('draws', floor=lambda: 40) == 41
+
+
+def test_deleted_draw_id_is_not_reused(lottery_service, new_draw):
+    draw = new_draw('express')
+    assert lottery_service.delete_draw(draw['id'])
+    assert new_draw('express')['id'] > draw['id']
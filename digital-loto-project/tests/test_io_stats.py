@@ -0,0 +1,47 @@
+import json
+from models.data_manager import DataManager, io_label
+from support import buy_tickets
+
+
+def test_io_labels_and_request_scope(tmp_path):
+    assert io_label('./data/tickets.json') == 'data/tickets.json'
+    assert io_label('data/jobs/17.json') == 'data/jobs/*.json'
+
+    filename = str(tmp_path / 'values.json')
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump({'value': 1}, f)
+    scope = DataManager.start_io_scope()
+    try:
+        DataManager.load_json(filename)
+        DataManager.load_json(filename)
+    finally:
+        DataManager.end_io_scope(scope)
+    DataManager.load_json(filename)
+
+    # Вторая загрузка взята из кэша, загрузка после конца учета не считается
+    assert scope.loads == {io_label(filename): 2} and scope.reads == {io_label(filename): 1}
+
+
+def test_storage_stats_endpoint(app, client, new_draw, monkeypatch):
+    def storage_stats() -> dict:
+        stats = client.get('/api/admin/stats/storage').get_json()
+        assert stats['success']
+        return stats
+
+    empty = {'requests': 0, 'loads': 0}
+    before = storage_stats()
+    buy_tickets(client, new_draw('express')['id'], 2)
+    after = storage_stats()
+
+    journal = 'data/balance.journal.jsonl'
+    assert after['files'][journal]['writes'] >= before['files'].get(journal, {'writes': 0})['writes'] + 2
+    buys = after['endpoints']['api.buy_ticket']
+    assert buys['requests'] == before['endpoints'].get('api.buy_ticket', empty)['requests'] + 2
+    assert buys['loads'] > before['endpoints'].get('api.buy_ticket', empty)['loads']
+    assert buys['loads_per_request'] == round(buys['loads'] / buys['requests'], 2)
+
+    # В режиме отладки ответ несет загрузки файлов запроса (ID розыгрыша - из файла последовательностей)
+    monkeypatch.setattr(app, 'debug', True)
+    response = client.post('/api/admin/draws', json={'title': 'Тест', 'category': 'express', 'cost': 5, 'time_left': '1'})
+    assert response.status_code == 200 and int(response.headers['X-Storage-Loads']) >= 1
+    assert 'data/sequences.json=' in response.headers['X-Storage-Files']
@@ -0,0 +1,136 @@
+import os
+import random
+import subprocess
+import sys
+import textwrap
+import time
+from collections import Counter
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Дочерний процесс ставит задачу и падает (os._exit) после трех записанных частей
+CRASHING_WORKER = textwrap.dedent('''
+    import os, sys, time
+    sys.path.insert(0, {tests_dir!r})
+    import support
+    support.configure(os.getcwd())
+    from models.lottery import LotteryService
+    from models.jobs import get_settlement_jobs
+
+    settle = LotteryService.settle_ticket_groups
+    calls = []
+
+    def crashing(self, *args):
+        if len(calls) == 3:
+            os._exit(1)
+        calls.append(1)
+        return settle(self, *args)
+
+    LotteryService.settle_ticket_groups = crashing
+    job = get_settlement_jobs().submit({draw_id})
+    print(job['id'], flush=True)
+    time.sleep(60)
+''')
+
+
+def wait_for_job(jobs, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get_job(job_id)
+        if job['status'] in ('completed', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Задача {job_id} не завершилась за {timeout} с")
+
+
+def test_job_resumes_after_worker_is_killed(app, lottery_service, new_draw):
+    from models.data_manager import DataManager
+    from models.jobs import get_settlement_jobs
+
+    draw = new_draw('express')
+    rng = random.Random(7)
+    tickets = lottery_service.storage.add_tickets([
+        {'draw_id': draw['id'], 'numbers': sorted(rng.sample(range(1, 37), 6)),
+         'status': 'pending', 'matches': 0, 'prize': 0, 'price': 5}
+        for _ in range(3000)
+    ])
+
+    worker = subprocess.run(
+        [sys.executable, '-c', CRASHING_WORKER.format(tests_dir=TESTS_DIR, draw_id=draw['id'])],
+        capture_output=True, text=True, timeout=120
+    )
+    assert worker.returncode == 1, worker.stderr
+    job_id = worker.stdout.strip()
+
+    checkpoint = DataManager.load_json(f"data/jobs/{job_id}.json", copy=True)
+    assert checkpoint['status'] == 'running'
+    assert len(checkpoint['settled_chunks']) == 3
+    assert checkpoint['chunks_total'] == 6
+
+    jobs = get_settlement_jobs()
+    assert jobs.resume_unfinished() == [job_id]
+    job = wait_for_job(jobs, job_id)
+    assert job['status'] == 'completed', job['error']
+    assert job['attempts'] == 2
+    assert job['chunks_settled'] == job['chunks_total'] == 6
+
+    winning = set(job['result']['winning_numbers'])
+    expected = {ticket['id']: len(set(ticket['numbers']) & winning) for ticket in tickets}
+    settled = {ticket['id']: ticket for ticket in lottery_service.storage.get_tickets(draw['id'])}
+    assert {ticket_id: ticket['matches'] for ticket_id, ticket in settled.items()} == expected
+    assert all(ticket['status'] == 'completed' for ticket in settled.values())
+
+    # Итог собран из частей двух попыток и совпадает с пересчетом
+    match_counts = Counter(expected.values())
+    assert job['result']['tickets_count'] == len(tickets)
+    assert job['result']['winners_count'] == sum(count for matches, count in match_counts.items() if matches >= 3)
+    assert {tier['matches']: tier['winners'] for tier in job['result']['tiers']} == {
+        matches: count for matches, count in match_counts.items() if matches >= 3
+    }
+
+
+def test_get_job_does_not_resume(app, new_draw):
+    from models.jobs import get_settlement_jobs
+
+    jobs = get_settlement_jobs()
+    assert jobs.get_job('missing') is None
+    job = jobs.submit(new_draw('express')['id'])
+    assert wait_for_job(jobs, job['id'])['status'] == 'completed'
+    assert jobs.resume_unfinished() == []
+
+
+def test_job_matches_sync_reference(app, lottery_service, new_draw, monkeypatch):
+    from models.jobs import get_settlement_jobs
+    from utils.helpers import LotteryHelpers
+
+    # Одинаковые выигрышные числа у обоих розыгрышей
+    monkeypatch.setattr(LotteryHelpers, 'generate_random_numbers', staticmethod(lambda count: list(range(1, count + 1))))
+    rng = random.Random(11)
+    numbers = [sorted(rng.sample(range(1, 13), 6)) for _ in range(3000)]
+    draws = [new_draw('express'), new_draw('express')]
+    for draw in draws:
+        lottery_service.storage.add_tickets([
+            {'draw_id': draw['id'], 'numbers': ticket_numbers, 'status': 'pending', 'matches': 0, 'prize': 0, 'price': 5}
+            for ticket_numbers in numbers
+        ])
+
+    jobs = get_settlement_jobs()
+    job = wait_for_job(jobs, jobs.submit(draws[0]['id'])['id'])
+    assert job['status'] == 'completed', job['error']
+    reference = lottery_service.conduct_draw(draws[1]['id'])
+
+    winners = reference.pop('winners')
+    assert {**job['result'], 'draw_id': None} == {**reference, 'draw_id': None}
+    assert reference['combinations_count'] == len({tuple(ticket_numbers) for ticket_numbers in numbers})
+
+    fields = ('status', 'state', 'status_text', 'matches', 'prize', 'draw_completed')
+    settled = []
+    for draw in draws:
+        completed_at = lottery_service.get_draw_by_id(draw['id'])['completed_at']
+        tickets = lottery_service.storage.get_tickets(draw['id'])
+        assert all(ticket['draw_date'] == completed_at for ticket in tickets)
+        settled.append([{field: ticket.get(field) for field in fields} for ticket in tickets])
+    assert settled[0] == settled[1]
+    reference_tickets = lottery_service.storage.get_tickets(draws[1]['id'])
+    assert winners == [{'ticket_id': ticket['id'], 'matches': ticket['matches'], 'prize': ticket['prize']}
+                       for ticket in reference_tickets if ticket['prize'] > 0]
@@ -0,0 +1,39 @@
+import json
+import pytest
+from models.data_manager import DataManager
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    filename = str(tmp_path / 'data.json')
+    DataManager.save_json(filename, {'balance': 10, 'items': [{'id': 1}]})
+    return filename
+
+
+def test_cache_hits_until_file_changes(data_file):
+    before = DataManager.cache_stats()
+    first = DataManager.load_json(data_file)
+    assert DataManager.load_json(data_file) is first
+    after = DataManager.cache_stats()
+    assert (after['misses'] - before['misses'], after['hits'] - before['hits']) == (1, 1)
+
+    DataManager.save_json(data_file, {'balance': 20, 'items': []})
+    saved = DataManager.load_json(data_file)
+    assert saved == {'balance': 20, 'items': []}
+    # Сохраненная версия попадает в кэш тоже только для чтения
+    with pytest.raises(TypeError):
+        saved['items'].append(1)
+
+
+def test_cached_data_is_read_only(data_file):
+    cached = DataManager.load_json(data_file)
+    for mutate in (lambda: cached.__setitem__('balance', 0), lambda: cached.update(balance=0),
+                   lambda: cached['items'].append({}), lambda: cached['items'][0].pop('id')):
+        with pytest.raises(TypeError):
+            mutate()
+    assert json.loads(json.dumps(cached)) == {'balance': 10, 'items': [{'id': 1}]}
+
+    copy = DataManager.load_json(data_file, copy=True)
+    copy['balance'] = 0
+    copy['items'][0]['id'] = 2
+    assert DataManager.load_json(data_file) == {'balance': 10, 'items': [{'id': 1}]}
@@ -0,0 +1,46 @@
+import json
+import pytest
+from utils.json_stream import iter_json_chunks, stream_json_response
+from config import JSON_STREAM_CHUNK_SIZE
+from support import buy_tickets
+
+VALUE = {'success': True, 'items': [{'id': i, 'name': 'Билет'} for i in range(200)], 'empty': [], 'total': 200}
+
+
+def test_chunks_join_into_the_same_json():
+    seen = []
+    streamed = {
+        **VALUE,
+        'items': (seen.append(item['id']) or item for item in VALUE['items']),
+        'empty': iter(()),
+        # Отложенное значение вычисляется после массива
+        'total': lambda: len(seen)
+    }
+    chunks = list(iter_json_chunks(streamed, chunk_size=256))
+
+    assert len(chunks) > 10 and all(len(chunk) >= 256 for chunk in chunks[:-1])
+    assert json.loads(b''.join(chunks)) == VALUE
+
+
+def test_stream_errors():
+    def failing(after: int):
+        yield from range(after)
+        raise ValueError('хранилище недоступно')
+
+    # Ошибка до первой части - исключение обработчика
+    with pytest.raises(ValueError):
+        stream_json_response({'items': failing(0)})
+
+    # Ошибка после заголовков обрывает поток
+    response = stream_json_response({'items': failing(JSON_STREAM_CHUNK_SIZE)})
+    with pytest.raises(ValueError):
+        b''.join(response.response)
+
+
+def test_tickets_are_streamed(client, new_draw):
+    draw = new_draw('express')
+    bought = buy_tickets(client, draw['id'], 3)
+
+    response = client.get(f"/api/tickets?draw_id={draw['id']}")
+    assert response.is_streamed and 'Content-Length' not in response.headers
+    assert [ticket['id'] for ticket in json.loads(response.get_data())['tickets']] == bought
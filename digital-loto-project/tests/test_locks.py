@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+import textwrap
+import pytest
+from models.data_manager import DataManager
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Код выхода 3 - блокировка занята другим процессом
+TRY_LOCK = textwrap.dedent('''
+    import os, sys
+    sys.path.insert(0, {tests_dir!r})
+    import support
+    support.configure(os.getcwd())
+    from models.data_manager import DataManager
+    try:
+        with DataManager.lock({resource!r}, shared={shared!r}, blocking=False):
+            pass
+    except BlockingIOError:
+        sys.exit(3)
+''')
+
+
+def try_lock_in_other_process(resource: str, shared: bool = False) -> int:
+    code = TRY_LOCK.format(tests_dir=TESTS_DIR, resource=resource, shared=shared)
+    return subprocess.run([sys.executable, '-c', code], timeout=60).returncode
+
+
+def test_transaction_excludes_other_processes():
+    with DataManager.transaction('test-a', 'test-b'):
+        assert try_lock_in_other_process('test-a') == 3
+        assert try_lock_in_other_process('test-b', shared=True) == 3
+    assert try_lock_in_other_process('test-a') == 0
+
+
+def test_shared_locks_allow_readers_but_not_writers():
+    with DataManager.lock('test-c', shared=True):
+        assert try_lock_in_other_process('test-c', shared=True) == 0
+        assert try_lock_in_other_process('test-c') == 3
+
+
+def test_lock_is_reentrant_but_not_upgradable():
+    with DataManager.lock('test-d'):
+        with DataManager.lock('test-d'):
+            pass
+    with DataManager.lock('test-e', shared=True):
+        with pytest.raises(RuntimeError):
+            with DataManager.lock('test-e'):
+                pass
+
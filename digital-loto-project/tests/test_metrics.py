@@ -0,0 +1,52 @@
+import os
+from models.metrics import Metrics
+from support import buy_tickets
+
+
+def samples(text: str) -> dict:
+    """Строки значений текстового формата Prometheus: {имя с метками: значение}"""
+    return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in text.splitlines() if line and not line.startswith('#')}
+
+
+def test_metrics_of_finished_processes_are_kept(tmp_path):
+    metrics = Metrics(str(tmp_path / 'metrics'))
+    metrics.inc('loto_tickets_sold_total', 3)
+    metrics.observe('loto_settlement_duration_seconds', 0.3)
+    metrics.observe('loto_settlement_duration_seconds', 1000)
+
+    pid = os.fork()
+    if pid == 0:
+        # Дочерний процесс пишет в свой файл
+        metrics.inc('loto_tickets_sold_total', 2)
+        metrics.gauge_add('loto_http_requests_in_flight', 1, endpoint='api.events', method='GET')
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+    values = samples(metrics.exposition())
+    assert values['loto_tickets_sold_total'] == 5
+    # Показатель завершившегося процесса отброшен, счетчики перенесены в архив
+    assert not any(name.startswith('loto_http_requests_in_flight') for name in values)
+    assert sorted(os.listdir(tmp_path / 'metrics')) == sorted(['.lock', 'archive.db', f'{os.getpid()}.db'])
+    assert samples(metrics.exposition())['loto_tickets_sold_total'] == 5
+
+    assert values['loto_settlement_duration_seconds_count'] == 2
+    assert values['loto_settlement_duration_seconds_sum'] == 1000.3
+    assert values['loto_settlement_duration_seconds_bucket{le="+Inf"}'] == 2
+    buckets = [value for name, value in values.items() if name.startswith('loto_settlement_duration_seconds_bucket')]
+    assert buckets == sorted(buckets) and buckets[0] == 0
+
+
+def test_metrics_endpoint(client, new_draw):
+    def scrape() -> dict:
+        response = client.get('/api/admin/metrics')
+        assert response.status_code == 200 and response.mimetype == 'text/plain'
+        return samples(response.get_data(as_text=True))
+
+    requests = 'loto_http_requests_total{endpoint="api.buy_ticket",method="POST",status="200"}'
+    before = scrape()
+    buy_tickets(client, new_draw('express')['id'], 2)
+    after = scrape()
+
+    assert after['loto_tickets_sold_total'] == before.get('loto_tickets_sold_total', 0) + 2
+    assert after[requests] == before.get(requests, 0) + 2
@@ -0,0 +1,29 @@
+from models import lottery
+from utils.helpers import LotteryHelpers
+
+
+def test_my_tickets_groups_keep_state_counts(client, new_draw, lottery_service, monkeypatch):
+    draw = new_draw('express')
+    numbers = [[1, 2, 3, 4, 5, 6], [7, 8, 9, 10, 11, 12], [1, 8, 9, 10, 11, 12]]
+    response = client.post('/api/buy_tickets', json={'draw_id': draw['id'], 'numbers': numbers})
+    ids = [ticket['id'] for ticket in response.get_json()['data']['tickets']]
+    monkeypatch.setattr(lottery, 'MY_TICKETS_GROUP_PREVIEW', 2)
+
+    def group_of_draw() -> dict:
+        grouped, draw_filters = lottery_service.get_my_tickets_view()
+        assert draw['id'] in [item['id'] for item in draw_filters]
+        return {group['draw_id']: group for group in grouped}[draw['id']]
+
+    group = group_of_draw()
+    assert group['tickets_count'] == 3 and group['status_counts'] == {'confirmed': 3}
+    # Последние билеты группы по убыванию ID
+    assert [ticket['id'] for ticket in group['tickets']] == ids[:0:-1]
+
+    monkeypatch.setattr(LotteryHelpers, 'generate_random_numbers', staticmethod(lambda count: list(range(1, count + 1))))
+    assert lottery_service.conduct_draw(draw['id'])
+
+    group = group_of_draw()
+    assert group['tickets_count'] == 3 and group['status_counts'] == {'winning': 2, 'completed': 1}
+    assert [ticket['status'] for ticket in group['tickets']] == ['winning', 'completed']
+
+    assert client.get('/tickets').status_code == 200
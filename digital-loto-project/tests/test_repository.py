@@ -0,0 +1,64 @@
+import json
+from models.repository import Index, IndexedCollection, JsonRepository
+
+
+def brute_find(records: list, **criteria) -> list:
+    return [record for record in records if all(record.get(name) == key for name, key in criteria.items())]
+
+
+def test_indexed_collection_matches_scan():
+    collection = IndexedCollection(status=Index('status'), draw_id=Index('draw_id'))
+    records = [{'id': i, 'draw_id': i % 20, 'status': 'pending'} for i in range(1, 101)]
+    collection.load(records)
+
+    # Общее изменение переносит записи между корзинами пачкой
+    collection.update_many(range(1, 101, 3), {'status': 'completed'})
+    # Корзин draw_id больше BULK_MAX_BUCKETS - записи переносятся по одной
+    assert len(collection.indexes['draw_id'].buckets) > Index.BULK_MAX_BUCKETS
+    collection.update_many(range(1, 101, 4), {'draw_id': 77})
+    collection.put({'id': 200, 'draw_id': 2, 'status': 'pending'})
+    collection.remove(10)
+
+    records = sorted(collection.values(), key=lambda record: record['id'])
+    for criteria in ({'status': 'completed'}, {'status': 'pending', 'draw_id': 2}, {'draw_id': 77}, {}):
+        expected = brute_find(records, **criteria)
+        assert sorted(record['id'] for record in collection.find(**criteria)) == [record['id'] for record in expected]
+        assert collection.count(**criteria) == len(expected)
+    assert collection.counts('status') == {
+        status: len(brute_find(records, status=status)) for status in ('pending', 'completed')
+    }
+
+    # Страницы по курсору для нескольких вариантов условий
+    alternatives = [{'draw_id': 77}, {'status': 'pending', 'draw_id': 2}]
+    expected = [record['id'] for record in records
+                if brute_find([record], draw_id=77) or brute_find([record], status='pending', draw_id=2)]
+    page, after = [], 0
+    while True:
+        ids = [record['id'] for record in collection.find_page(alternatives, after=after, limit=7)]
+        if not ids:
+            break
+        page += ids
+        after = ids[-1]
+    assert page == expected
+
+
+def test_json_repository_rereads_changed_file(tmp_path):
+    filename = str(tmp_path / 'draws.json')
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump({'draws': [{'id': 1, 'type': 'big'}], 'version': 3}, f)
+    repository = JsonRepository(filename, 'test_draws', 'draws', type=Index('type'))
+
+    added = repository.add({'type': 'express'}, allocate_id=lambda floor: floor() + 1)
+    assert added['id'] == 2 and repository.count(type='express') == 1
+    with open(filename, encoding='utf-8') as f:
+        assert json.load(f)['version'] == 3
+
+    # Файл изменен другим процессом (другой размер - другая сигнатура)
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump({'draws': [{'id': 5, 'type': 'express'}, {'id': 6, 'type': 'express'}]}, f)
+    assert [draw['id'] for draw in repository.find(type='express')] == [5, 6]
+    assert repository.max_id() == 6
+
+    # Читатели получают копии
+    repository.get(5)['type'] = 'big'
+    assert repository.get(5)['type'] == 'express'
@@ -0,0 +1,52 @@
+import pstats
+import pytest
+from utils import request_profiler
+
+
+@pytest.fixture
+def profiles_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(request_profiler, 'PROFILE_DIR', str(tmp_path / 'profiles'))
+    monkeypatch.setattr(request_profiler, 'PROFILE_KEY', 'secret')
+    return tmp_path / 'profiles'
+
+
+def test_profile_on_request(client, profiles_dir, monkeypatch):
+    # Без ключа и без PROFILE_ENABLED профилирование не включается
+    assert 'X-Profile' not in client.get('/api/balance?__profile=1').headers
+    assert 'X-Profile' not in client.get('/api/balance?__profile=wrong').headers
+
+    response = client.get('/api/admin/stats?__profile=secret&debug=1')
+    assert response.status_code == 200
+    link, summary = response.headers['X-Profile'], response.headers['X-Profile-Summary']
+    assert 'get_stats' in summary
+
+    profiles = client.get('/api/admin/profiles').get_json()['profiles']
+    assert [f"/api/admin/profiles/{meta['id']}" for meta in profiles] == [link]
+    assert profiles[0]['endpoint'] == 'admin.get_stats' and profiles[0]['args'] == {'debug': '1'}
+    assert profiles[0]['status'] == 200 and not profiles[0]['sampled']
+
+    assert 'function calls' in client.get(link).get_data(as_text=True)
+    download = client.get(f'{link}?download=1')
+    (profiles_dir.parent / 'downloaded.prof').write_bytes(download.data)
+    assert pstats.Stats(str(profiles_dir.parent / 'downloaded.prof')).total_calls > 0
+    assert client.get('/api/admin/profiles/../../config').status_code == 404
+    assert client.get('/api/admin/profiles/abc-123').status_code == 404
+
+    # Хранятся последние PROFILE_MAX_FILES профилей
+    monkeypatch.setattr(request_profiler, 'PROFILE_MAX_FILES', 2)
+    for _ in range(3):
+        client.get('/api/balance?__profile=secret')
+    assert len(client.get('/api/admin/profiles').get_json()['profiles']) == 2
+
+
+def test_streamed_and_sampled_profiles(client, profiles_dir, monkeypatch):
+    # Потоковый ответ профилируется до закрытия: в ответе только ссылка
+    response = client.get('/api/tickets?__profile=secret')
+    assert 'X-Profile' in response.headers and 'X-Profile-Summary' not in response.headers
+    response.close()
+    assert [meta['endpoint'] for meta in request_profiler.list_profiles()] == ['api.get_filtered_tickets']
+
+    monkeypatch.setattr(request_profiler, 'PROFILE_SAMPLE_RATE', 1.0)
+    response = client.get('/api/balance')
+    assert 'X-Profile' not in response.headers
+    assert request_profiler.list_profiles()[0]['sampled']
@@ -0,0 +1,47 @@
+import random
+from array import array
+import pytest
+from models import settlement
+from utils.ticket_masks import group_by_combination, new_mask_array, numbers_to_mask
+
+WINNING = [1, 2, 3, 4, 5, 6]
+
+
+@pytest.fixture
+def tickets():
+    rng = random.Random(5)
+    ids = array('q', range(1, 5001))
+    masks = new_mask_array(numbers_to_mask(rng.sample(range(1, 15), 6)) for _ in ids)
+    return ids, masks
+
+
+def settle(ticket_ids, masks):
+    chunks = list(settlement.iter_settled_chunks(ticket_ids, masks, WINNING, 700, skip={2}))
+    combinations = settlement.settle_combinations(group_by_combination(ticket_ids, masks), WINNING, 700)
+    return chunks, combinations
+
+
+def test_pool_matches_serial_settlement(tickets, monkeypatch):
+    monkeypatch.setattr(settlement, 'SETTLEMENT_WORKERS', 1)
+    serial = settle(*tickets)
+
+    submitted = []
+    with monkeypatch.context() as patch:
+        patch.setattr(settlement, 'SETTLEMENT_WORKERS', 2)
+        patch.setattr(settlement, 'SETTLEMENT_PARALLEL_MIN_TICKETS', 1)
+        executor = settlement._get_executor()
+        patch.setattr(executor, 'submit', lambda *args: submitted.append(args) or type(executor).submit(executor, *args))
+        try:
+            parallel = settle(*tickets)
+        finally:
+            executor.shutdown()
+            settlement._executor = None
+
+    # Обе части расчета прошли через пул: 7 частей по билетам и части комбинаций
+    assert len(submitted) > 7
+    assert parallel == serial
+
+    chunks, combinations = serial
+    assert [index for index, _ in chunks] == [0, 1, 3, 4, 5, 6, 7]
+    assert sum(len(ids) for _, groups in chunks for ids in groups.values()) == len(tickets[0]) - 700
+    assert sum(map(len, combinations.values())) == len(tickets[0])
@@ -0,0 +1,52 @@
+from models.sqlite_storage import SQLiteStorage
+from models.stats import check_counters
+from models.storage import JsonStorage
+from utils.ticket_masks import numbers_to_mask
+
+A, B = [1, 2, 3, 4, 5, 6], [7, 8, 9, 10, 11, 12]
+
+
+def new_tickets(draw_id: int, numbers: list, count: int) -> list:
+    return [{'draw_id': draw_id, 'numbers': numbers, 'status': 'pending', 'price': 5} for _ in range(count)]
+
+
+def test_sqlite_storage_keeps_counters_and_combinations(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / 'loto.db'))
+    draw = storage.add_draw({'title': 'Тест', 'category': 'express', 'completed': False})
+    tickets = storage.add_tickets(new_tickets(draw['id'], A, 3) + new_tickets(draw['id'], B, 2))
+
+    ids = [ticket['id'] for ticket in tickets]
+    assert ids == list(range(ids[0], ids[0] + 5))
+    assert storage.get_combination_stats(draw['id']) == {'tickets': 5, 'combinations': 2}
+    assert {mask: list(group) for mask, group in storage.get_pending_combinations(draw['id']).items()} == {
+        numbers_to_mask(A): ids[:3], numbers_to_mask(B): ids[3:]
+    }
+
+    storage.update_ticket_groups([(ids[:3], {'status': 'completed', 'matches': 6, 'prize': 100})])
+    assert storage.get_combination_stats(draw['id']) == {'tickets': 2, 'combinations': 1}
+    assert storage.get_ticket(ids[0])['prize'] == 100
+    assert storage.get_prize_levels(draw['id']) == [100]
+
+    counters = storage.get_counters()
+    assert counters['total_tickets'] == 5 and counters['pending_tickets'] == 2
+    assert counters['winning_tickets'] == 3 and counters['prizes_paid'] == 300
+    assert storage.get_draw_sales() == {draw['id']: {'tickets_count': 5, 'revenue': 25}}
+    assert check_counters(storage)['consistent']
+
+    # Новое соединение видит те же данные и счетчики
+    reopened = SQLiteStorage(str(tmp_path / 'loto.db'))
+    assert reopened.get_counters() == counters
+    assert [ticket['id'] for ticket in reopened.get_tickets_page(draw_id=draw['id'], after_id=ids[1], limit=2)] == ids[2:4]
+
+
+def test_migrate_from_json(tmp_path, new_draw, lottery_service):
+    draw = new_draw('express')
+    lottery_service.buy_ticket(draw['id'], A)
+
+    source = JsonStorage()
+    storage = SQLiteStorage(str(tmp_path / 'loto.db'))
+    result = storage.migrate_from_json(source)
+
+    assert result['tickets'] == len(source.get_tickets()) and result['draws'] == len(source.get_draws())
+    assert storage.get_counters() == source.get_counters()
+    assert storage.get_draw_sales() == source.get_draw_sales()
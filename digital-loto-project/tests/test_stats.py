@@ -0,0 +1,18 @@
+from support import buy_tickets
+
+
+def test_stats_counters_match_records(client, new_draw):
+    before = client.get('/api/admin/stats').get_json()
+    draw = new_draw('express')
+    buy_tickets(client, draw['id'], 3)
+    ticket_id = buy_tickets(client, draw['id'], 1)[0]
+    assert client.put(f'/api/tickets/{ticket_id}', json={'numbers': [7, 8, 9, 10, 11, 12]}).status_code == 200
+
+    stats = client.get('/api/admin/stats').get_json()
+    assert stats['total_draws'] == before['total_draws'] + 1
+    assert stats['total_tickets'] == before['total_tickets'] + 4
+    assert stats['pending_tickets'] == before['pending_tickets'] + 4
+    assert stats['revenue'] == before['revenue'] + 20
+
+    check = client.get('/api/admin/stats/check').get_json()
+    assert check['success'] and check['consistent'], check['mismatches']
@@ -0,0 +1,56 @@
+import io
+import json
+import logging
+import queue
+import sys
+from utils.structured_logging import JsonFormatter, LoggingPipeline, NonBlockingQueueHandler, RateLimitFilter
+
+
+def make_record(message: str = 'Куплен билет %s', level: int = logging.INFO, name: str = 'models.lottery',
+                lineno: int = 10, exc_info=None) -> logging.LogRecord:
+    return logging.LogRecord(name, level, 'models/lottery.py', lineno, message, (1,), exc_info)
+
+
+def test_rate_limit_by_call_site():
+    rate_filter = RateLimitFilter(rate=0.001, burst=2, sample_every=3, logger_rates={'werkzeug': None})
+
+    records = [make_record() for _ in range(8)]
+    passed = [(position, getattr(record, 'suppressed', 0))
+              for position, record in enumerate(records, 1) if rate_filter.filter(record)]
+    # Две записи запаса, затем каждая третья с числом отброшенных перед ней
+    assert passed == [(1, 0), (2, 0), (5, 2), (8, 2)]
+
+    # Другое место вызова, WARNING и логгер без ограничения проходят
+    assert rate_filter.filter(make_record(lineno=11))
+    assert rate_filter.filter(make_record(level=logging.WARNING))
+    assert all(rate_filter.filter(make_record(name='werkzeug')) for _ in range(5))
+
+
+def test_full_queue_drops_with_count():
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    for _ in range(3):
+        handler.handle(make_record())
+    first = handler.queue.get_nowait()
+    assert first.getMessage() == 'Куплен билет 1' and first.args is None
+
+    handler.handle(make_record())
+    assert handler.queue.get_nowait().dropped == 2 and handler.dropped == 0
+
+
+def test_pipeline_writes_json_lines():
+    output = io.StringIO()
+    handler = logging.StreamHandler(output)
+    handler.setFormatter(JsonFormatter())
+    pipeline = LoggingPipeline(handler, 16, RateLimitFilter(rate=100, burst=100, sample_every=0))
+    pipeline.start()
+    try:
+        raise ValueError('нет данных')
+    except ValueError:
+        pipeline.queue_handler.handle(make_record('Ошибка %s', logging.ERROR, exc_info=sys.exc_info()))
+    pipeline.queue_handler.handle(make_record())
+    pipeline.stop()
+
+    entries = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [entry['message'] for entry in entries] == ['Ошибка 1', 'Куплен билет 1']
+    assert entries[0]['level'] == 'ERROR' and entries[0]['logger'] == 'models.lottery'
+    assert 'ValueError: нет данных' in entries[0]['exception'] and 'exception' not in entries[1]
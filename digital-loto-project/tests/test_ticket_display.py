@@ -0,0 +1,24 @@
+from utils.helpers import LotteryHelpers
+
+
+def test_status_text_is_stored_with_state(client, new_draw, lottery_service, monkeypatch):
+    draw = new_draw('express')
+    numbers = [[1, 2, 3, 4, 5, 6], [7, 8, 9, 10, 11, 12]]
+    response = client.post('/api/buy_tickets', json={'draw_id': draw['id'], 'numbers': numbers})
+    winner, loser = (ticket['id'] for ticket in response.get_json()['data']['tickets'])
+
+    stored = lottery_service.storage.get_ticket(winner)
+    assert stored['state'] == 'confirmed' and stored['status_text'] == 'Ждет розыгрыша'
+    assert stored['formatted_time']
+
+    monkeypatch.setattr(LotteryHelpers, 'generate_random_numbers', staticmethod(lambda count: list(range(1, count + 1))))
+    assert lottery_service.conduct_draw(draw['id'])
+
+    for ticket_id, state in ((winner, 'winning'), (loser, 'completed')):
+        stored = lottery_service.storage.get_ticket(ticket_id)
+        assert stored['state'] == state
+        assert stored['status_text'] == LotteryHelpers.get_ticket_status_text(state)
+
+    # Ответ API проецирует сохраненные поля
+    listed = {ticket['id']: ticket for ticket in client.get(f"/api/tickets?draw_id={draw['id']}").get_json()['tickets']}
+    assert listed[winner]['status'] == 'winning' and listed[winner]['status_text'] == 'Выигрышный!'
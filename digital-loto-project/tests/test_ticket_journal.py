@@ -0,0 +1,53 @@
+import json
+from models.data_manager import DataManager
+from models.ticket_store import TicketStore
+
+
+def make_store(tmp_path) -> TicketStore:
+    return TicketStore(str(tmp_path / 'tickets.json'), str(tmp_path / 'tickets.journal.jsonl'), 0.5, 1 << 20)
+
+
+def new_tickets(count: int, draw_id: int = 1) -> list:
+    return [{'draw_id': draw_id, 'numbers': [1, 2, 3, 4, 5, 6], 'status': 'pending'} for _ in range(count)]
+
+
+def test_journal_replay_waits_for_partial_trailing_line(tmp_path):
+    DataManager.save_json(str(tmp_path / 'tickets.json'), {'tickets': []})
+    writer = make_store(tmp_path)
+    writer.add_tickets(new_tickets(3))
+
+    # Строка журнала, запись которой еще идет
+    line = json.dumps({'op': 'add', 'ticket': {'id': 4, 'draw_id': 1, 'numbers': [], 'status': 'pending'}}) + '\n'
+    journal = tmp_path / 'tickets.journal.jsonl'
+    with open(journal, 'a') as f:
+        f.write(line[:20])
+
+    reader = make_store(tmp_path)
+    assert [ticket['id'] for ticket in reader.get_tickets()] == [1, 2, 3]
+
+    with open(journal, 'a') as f:
+        f.write(line[20:])
+    assert [ticket['id'] for ticket in reader.get_tickets()] == [1, 2, 3, 4]
+
+
+def test_journal_append_after_torn_line_keeps_next_record(tmp_path):
+    DataManager.save_json(str(tmp_path / 'tickets.json'), {'tickets': []})
+    writer = make_store(tmp_path)
+    writer.add_tickets(new_tickets(3))
+
+    # Процесс упал посреди записи: строка оборвана навсегда
+    with open(tmp_path / 'tickets.journal.jsonl', 'a') as f:
+        f.write('{"op": "add", "ticket": {"id": 4, "dra')
+
+    reader = make_store(tmp_path)
+    assert len(reader.get_tickets()) == 3
+
+    writer = make_store(tmp_path)
+    added = writer.add_tickets(new_tickets(1, draw_id=2))
+    assert [ticket['id'] for ticket in added] == [4]
+
+    for store in (reader, make_store(tmp_path)):
+        tickets = store.get_tickets()
+        assert [ticket['id'] for ticket in tickets] == [1, 2, 3, 4]
+        assert tickets[-1]['draw_id'] == 2
+        assert store.count_tickets(draw_id=2) == 1
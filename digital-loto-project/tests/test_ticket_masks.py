@@ -0,0 +1,30 @@
+import random
+import pytest
+from utils import ticket_masks
+from utils.ticket_masks import count_matches, mask_to_numbers, new_mask_array, numbers_to_mask
+
+WINNING = [3, 17, 25, 36, 40, 63]
+
+
+def test_mask_roundtrip():
+    assert numbers_to_mask([]) == 0
+    assert mask_to_numbers(numbers_to_mask([36, 1, 63])) == [1, 36, 63]
+    # Маска с числом 63 помещается в беззнаковый 64-битный массив
+    assert list(new_mask_array([numbers_to_mask(WINNING)])) == [numbers_to_mask(WINNING)]
+
+
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_count_matches_equals_set_intersection(monkeypatch, vectorized):
+    if vectorized and ticket_masks.np is None:
+        pytest.skip('NumPy не установлен')
+    if not vectorized:
+        monkeypatch.setattr(ticket_masks, 'np', None)
+
+    rng = random.Random(7)
+    numbers = [rng.sample(range(1, 64), 6) for _ in range(1000)] + [WINNING]
+    masks = new_mask_array(map(numbers_to_mask, numbers))
+
+    expected = [len(set(ticket) & set(WINNING)) for ticket in numbers]
+    assert count_matches(masks, numbers_to_mask(WINNING)) == expected
+    assert count_matches(list(masks), numbers_to_mask(WINNING)) == expected
+    assert count_matches(new_mask_array(), numbers_to_mask(WINNING)) == []
@@ -0,0 +1,26 @@
+from support import buy_tickets
+
+
+def test_tickets_cursor_pagination(client, new_draw):
+    draw = new_draw('express')
+    bought = buy_tickets(client, draw['id'], 7)
+
+    pages, cursor = [], None
+    while True:
+        query = f"/api/tickets?draw_id={draw['id']}&limit=3" + (f"&cursor={cursor}" if cursor else '')
+        page = client.get(query).get_json()
+        assert page['success'] and page['total'] == 7
+        assert page['count'] == len(page['tickets']) <= 3
+        pages.append([ticket['id'] for ticket in page['tickets']])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert [len(ids) for ids in pages] == [3, 3, 1]
+    assert [ticket_id for ids in pages for ticket_id in ids] == sorted(bought)
+
+    # Без limit и cursor - весь список одним ответом
+    unpaged = client.get(f"/api/tickets?draw_id={draw['id']}").get_json()
+    assert unpaged['count'] == unpaged['total'] == 7 and unpaged['next_cursor'] is None
+
+    assert client.get('/api/tickets?cursor=bad').status_code == 400
@@ -0,0 +1,49 @@
+"""
+Условные GET запросы (ETag / If-None-Match)
+
+ETag ответа строится из версий частей данных (models/versions.py), от
+которых он зависит. Версии читаются до обработчика, поэтому совпавший
+If-None-Match получает 304 без обращения к хранилищу, а ответ, собранный
+во время записи, несет старый ETag и при следующем запросе будет выдан
+заново.
+
+    @api_bp.route('/balance', methods=['GET'])
+    @conditional('balance')
+    def get_balance():
+        ...
+"""
+from functools import wraps
+from typing import Callable
+from flask import Response, make_response, request
+from models.versions import get_versions
+
+
+def not_modified(etag: str) -> Response:
+    """Пустой ответ 304 с ETag"""
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def conditional(*partitions: str) -> Callable:
+    """Декоратор GET обработчика: строгий ETag по версиям partitions и 304 по If-None-Match
+
+    ETag ставится только на успешные (200) ответы. Cache-Control: no-cache
+    разрешает клиенту хранить ответ, но требует проверки перед каждым
+    использованием.
+    """
+    def decorator(view: Callable) -> Callable:
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = get_versions().etag(*partitions)
+            if request.if_none_match.contains_weak(etag):
+                return not_modified(etag)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -1,17 +1,28 @@
 """
 Вспомогательные функции для приложения лотереи
 """
+import json
+import base64
 import random
 import logging
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 from config import MAX_LOTTERY_NUMBER, PRIZE_TABLE
+from utils.ticket_masks import numbers_to_mask, popcount
 
 logger = logging.getLogger(__name__)
 
 class LotteryHelpers:
     """Класс с вспомогательными функциями для лотереи"""
     
+    # Текстовые описания состояний билета
+    TICKET_STATUS_TEXTS = {
+        'pending': 'Ждет выбора чисел',
+        'confirmed': 'Ждет розыгрыша', 
+        'completed': 'Розыгрыш завершен',
+        'winning': 'Выигрышный!'
+    }
+    
     @staticmethod
     def generate_random_numbers(count: int, max_number: int = MAX_LOTTERY_NUMBER) -> List[int]:
         """Генерация случайных чисел для розыгрыша"""
@@ -28,8 +39,8 @@ class LotteryHelpers:
     def check_winning_ticket(ticket_numbers: List[int], draw_numbers: List[int]) -> int:
         """Проверка выигрышного билета - возвращает количество совпадений"""
         try:
-            matches = len(set(ticket_numbers) & set(draw_numbers))
-            logger.info(f"Найдено {matches} совпадений")
+            matches = popcount(numbers_to_mask(ticket_numbers) & numbers_to_mask(draw_numbers))
+            logger.debug(f"Найдено {matches} совпадений")
             return matches
         except Exception as e:
             logger.error(f"Ошибка проверки билета: {e}")
@@ -57,13 +68,7 @@ class LotteryHelpers:
     @staticmethod
     def get_ticket_status_text(status: str) -> str:
         """Текстовое описание статуса билета"""
-        status_map = {
-            'pending': 'Ждет выбора чисел',
-            'confirmed': 'Ждет розыгрыша', 
-            'completed': 'Розыгрыш завершен',
-            'winning': 'Выигрышный!'
-        }
-        return status_map.get(status, 'Неизвестно')
+        return LotteryHelpers.TICKET_STATUS_TEXTS.get(status, 'Неизвестно')
 
     @staticmethod
     def get_draw_status_text(draw: Dict) -> str:
@@ -73,6 +78,21 @@ class LotteryHelpers:
         else:
             return f"Активный до {draw.get('time', '')}"
 
+    @staticmethod
+    def ticket_state(has_numbers: bool, matches: Optional[int] = None) -> str:
+        """Состояние билета, сохраняемое при записи (matches=None - билет еще не рассчитан)"""
+        if not has_numbers:
+            return 'pending'
+        if matches is None:
+            return 'confirmed'
+        return 'winning' if matches > 0 else 'completed'
+
+    @staticmethod
+    def ticket_state_fields(has_numbers: bool, matches: Optional[int] = None) -> Dict:
+        """Поля состояния для записи в билет: state и его текст status_text"""
+        state = LotteryHelpers.ticket_state(has_numbers, matches)
+        return {'state': state, 'status_text': LotteryHelpers.get_ticket_status_text(state)}
+
     @staticmethod
     def determine_ticket_status(ticket: Dict, draw: Dict) -> str:
         """Определение статуса билета"""
@@ -91,14 +111,22 @@ class LotteryHelpers:
 
     @staticmethod
     def enrich_ticket_data(ticket: Dict, draw: Dict) -> Dict:
-        """Обогащение данных билета"""
-        enriched = ticket.copy()
+        """Обогащение данных билета
         
-        enriched['formatted_time'] = LotteryHelpers.format_ticket_time(ticket.get('created_at', ''))
+        formatted_time, state и status_text записываются в билет при покупке,
+        правке и расчете, поэтому здесь только проецируются. Для билетов,
+        записанных до появления этих полей, они вычисляются по розыгрышу.
+        """
+        enriched = ticket.copy()
         
-        status = LotteryHelpers.determine_ticket_status(ticket, draw)
+        status = ticket.get('state')
+        if status is None or 'formatted_time' not in ticket:
+            enriched['formatted_time'] = LotteryHelpers.format_ticket_time(ticket.get('created_at', ''))
+            status = LotteryHelpers.determine_ticket_status(ticket, draw)
+            enriched['status_text'] = LotteryHelpers.get_ticket_status_text(status)
+        elif 'status_text' not in ticket:
+            enriched['status_text'] = LotteryHelpers.get_ticket_status_text(status)
         enriched['status'] = status
-        enriched['status_text'] = LotteryHelpers.get_ticket_status_text(status)
         
         numbers = ticket.get('numbers', [])
         enriched['is_pending'] = len(numbers) == 0
@@ -192,4 +220,20 @@ class TicketGrouping:
         if status != 'all':
             enriched_tickets = [t for t in enriched_tickets if t.get('status') == status]
         
-        return enriched_tickets
\ No newline at end of file
+        return enriched_tickets
+
+    @staticmethod
+    def encode_page_cursor(after_id: int) -> str:
+        """Непрозрачный курсор следующей страницы билетов"""
+        payload = json.dumps({'after': after_id}, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+    @staticmethod
+    def decode_page_cursor(cursor: str) -> Optional[int]:
+        """ID, после которого начинается страница (None - курсор поврежден)"""
+        try:
+            payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            after_id = json.loads(payload)['after']
+            return after_id if isinstance(after_id, int) and after_id >= 0 else None
+        except (ValueError, TypeError, KeyError):
+            return None
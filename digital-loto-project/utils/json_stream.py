@@ -0,0 +1,92 @@
+"""
+Потоковая выдача больших JSON ответов
+
+Ответ описывается обычной структурой из словарей и значений, в которой
+длинный массив задается итератором (генератором по хранилищу). Элементы
+массива кодируются и отправляются по мере получения, частями по
+JSON_STREAM_CHUNK_SIZE байт, без сборки всего списка в памяти; ответ
+уходит с Transfer-Encoding: chunked.
+
+Значение-функция вычисляется, когда до него доходит кодирование. Так
+итоги, известные только после массива (количество, сумма, курсор
+следующей страницы), ставятся после него:
+
+    stream_json_response({
+        'success': True,
+        'tickets': iter_tickets(page),
+        'count': lambda: page['count']
+    })
+
+Ошибки. Первая часть ответа кодируется еще в обработчике запроса: ошибка
+до нее (чтение хранилища, первая страница) - обычное исключение
+обработчика, и клиент получает ответ об ошибке с кодом 500. После
+отправки заголовков код ответа изменить нельзя, поэтому ошибка в середине
+потока пробрасывается серверу: тот обрывает соединение без завершающей
+части chunked, и клиент видит прерванную передачу, а не похожий на
+успешный ответ. Уже собранные, но не отправленные куски отбрасываются.
+"""
+import json
+import logging
+from typing import Any, Iterator
+from flask import Response
+from config import JSON_STREAM_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+
+def iter_json(value: Any) -> Iterator[str]:
+    """Куски JSON текста value (итераторы - массивы, функции - отложенные значения)"""
+    if isinstance(value, dict):
+        yield '{'
+        for position, (key, item) in enumerate(value.items()):
+            yield f"{',' if position else ''}{_encode(str(key))}:"
+            yield from iter_json(item)
+        yield '}'
+    elif isinstance(value, Iterator):
+        yield '['
+        for position, item in enumerate(value):
+            yield f"{',' if position else ''}{_encode(item)}"
+        yield ']'
+    elif callable(value):
+        yield from iter_json(value())
+    else:
+        yield _encode(value)
+
+
+def iter_json_chunks(value: Any, chunk_size: int = JSON_STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """JSON текст value частями не меньше chunk_size байт (кроме последней)"""
+    buffer, size = [], 0
+    try:
+        for piece in iter_json(value):
+            piece = piece.encode('utf-8')
+            buffer.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                yield b''.join(buffer)
+                buffer, size = [], 0
+    except Exception as e:
+        # Исключение обрывает передачу: ответ не завершается как успешный
+        logger.error(f"Ошибка потоковой выдачи JSON: {e}")
+        raise
+    if buffer:
+        yield b''.join(buffer)
+
+
+def stream_json_response(value: Any, status: int = 200) -> Response:
+    """Ответ с потоковым JSON (chunked, без Content-Length)
+
+    Первая часть кодируется сразу: ее ошибка выбрасывается здесь, в обработчике.
+    """
+    chunks = iter_json_chunks(value)
+    first = next(chunks, None)
+    return Response(_resume(first, chunks), status=status, mimetype='application/json')
+
+
+def _resume(first: Any, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """Уже закодированная первая часть, затем остальные"""
+    if first is not None:
+        yield first
+    yield from chunks
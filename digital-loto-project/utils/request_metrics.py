@@ -0,0 +1,69 @@
+"""
+Метрики HTTP запросов (models/metrics.py)
+
+Для каждого запроса учитываются запросы в обработке, длительность и код
+ответа по обработчику (endpoint) и методу, а также загрузки файлов
+данных (DataManager.load_json) по файлам. Обычный ответ завершает
+запрос сразу после обработчика; потоковый (списки JSON частями,
+/api/events) - когда сервер закрывает ответ, поэтому его длительность
+и загрузки включают отправку всего тела.
+
+В режиме отладки (app.debug) ответ несет загрузки, сделанные до его
+отправки: X-Storage-Loads - всего вызовов, X-Storage-Reads - чтений с
+диска, X-Storage-Files - вызовы по файлам.
+
+    app = Flask(__name__)
+    register_request_metrics(app)
+"""
+import time
+from flask import Flask, Response, g, request
+from models.data_manager import DataManager, IOScope
+from models.metrics import get_metrics
+
+# Обработчик запросов, не совпавших ни с одним маршрутом
+UNMATCHED_ENDPOINT = 'unmatched'
+
+
+def register_request_metrics(app: Flask):
+    """Подключить учет метрик к запросам приложения"""
+    metrics = get_metrics()
+
+    def finish(started: float, labels: dict, scope: IOScope, status: int):
+        DataManager.end_io_scope(scope)
+        metrics.gauge_add('loto_http_requests_in_flight', -1, **labels)
+        metrics.observe('loto_http_request_duration_seconds', time.perf_counter() - started, **labels)
+        metrics.inc('loto_http_requests_total', status=status, **labels)
+        for label, loads in scope.loads.items():
+            metrics.inc('loto_storage_request_loads_total', loads, endpoint=labels['endpoint'], file=label)
+
+    @app.before_request
+    def start_request_metrics():
+        labels = {'endpoint': request.endpoint or UNMATCHED_ENDPOINT, 'method': request.method}
+        g.request_metrics = (time.perf_counter(), labels, DataManager.start_io_scope())
+        metrics.gauge_add('loto_http_requests_in_flight', 1, **labels)
+
+    @app.after_request
+    def finish_request_metrics(response: Response) -> Response:
+        state = g.pop('request_metrics', None)
+        if state is None:
+            return response
+        if app.debug:
+            scope = state[2]
+            response.headers['X-Storage-Loads'] = str(sum(scope.loads.values()))
+            response.headers['X-Storage-Reads'] = str(sum(scope.reads.values()))
+            response.headers['X-Storage-Files'] = ', '.join(
+                f"{label}={loads}" for label, loads in sorted(scope.loads.items())
+            )
+        if response.is_streamed:
+            status = response.status_code
+            response.call_on_close(lambda: finish(*state, status))
+        else:
+            finish(*state, response.status_code)
+        return response
+
+    @app.teardown_request
+    def abort_request_metrics(error=None):
+        # Запрос, не дошедший до ответа (исключение вне обработчиков ошибок)
+        state = g.pop('request_metrics', None)
+        if state is not None:
+            finish(*state, 500)
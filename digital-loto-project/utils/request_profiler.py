@@ -0,0 +1,196 @@
+"""
+Профилирование запросов cProfile по требованию
+
+Любой маршрут приложения с параметром ?__profile=1 выполняется под
+cProfile, если это разрешено PROFILE_ENABLED; без него - только с
+?__profile=<PROFILE_KEY>. Кроме того, доля PROFILE_SAMPLE_RATE всех
+запросов профилируется постоянно (выборочно).
+
+Результат каждого профиля - файл pstats PROFILE_DIR/<id>.prof и описание
+запроса <id>.json; хранятся последние PROFILE_MAX_FILES профилей. Ответ
+профилированного по требованию запроса несет заголовки X-Profile (ссылка
+на отчет /api/admin/profiles/<id>) и X-Profile-Summary - функции с
+наибольшим накопленным временем. Потоковый ответ профилируется до
+закрытия, поэтому для него ставится только ссылка.
+
+Файл .prof открывается обычными средствами:
+    python -m pstats data/profiles/<id>.prof
+"""
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import secrets
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from flask import Flask, Response, g, request
+from models.data_manager import DataManager
+from config import (PROFILE_ENABLED, PROFILE_KEY, PROFILE_SAMPLE_RATE, PROFILE_SAMPLE_EXCLUDE,
+                    PROFILE_DIR, PROFILE_MAX_FILES, PROFILE_TOP_FUNCTIONS, PROFILE_HEADER_FUNCTIONS)
+
+logger = logging.getLogger(__name__)
+
+# Параметр запроса, включающий профилирование
+PROFILE_PARAM = '__profile'
+
+
+class _RequestProfile:
+    """Профиль одного запроса"""
+
+    def __init__(self, sampled: bool):
+        # ID начинается со времени до микросекунд: порядок имен - порядок профилей
+        self.id = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}-{secrets.token_hex(3)}"
+        self.sampled = sampled
+        self.meta = {
+            'id': self.id,
+            'method': request.method,
+            # Без параметра профилирования: в нем может быть PROFILE_KEY
+            'path': request.path,
+            'args': {key: value for key, value in request.args.items() if key != PROFILE_PARAM},
+            'endpoint': request.endpoint,
+            'sampled': sampled,
+            'started_at': datetime.now().isoformat()
+        }
+        self.profiler = cProfile.Profile()
+        self.started = time.perf_counter()
+        self.finished = False
+
+    def finish(self, status: int) -> Optional[pstats.Stats]:
+        """Остановить профилирование и сохранить профиль (один раз)"""
+        if self.finished:
+            return None
+        self.finished = True
+        self.profiler.disable()
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            self.profiler.dump_stats(_path(self.id, '.prof'))
+            DataManager.save_json(_path(self.id, '.json'), {
+                **self.meta,
+                'status': status,
+                'duration': round(time.perf_counter() - self.started, 6)
+            })
+            _remove_old_profiles()
+            return pstats.Stats(self.profiler)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения профиля {self.id}: {e}")
+            return None
+
+
+def _requested() -> bool:
+    """Запрошено ли профилирование параметром ?__profile и разрешено ли оно"""
+    value = request.args.get(PROFILE_PARAM)
+    if value is None:
+        return False
+    if PROFILE_ENABLED and value == '1':
+        return True
+    return bool(PROFILE_KEY) and hmac.compare_digest(value.encode(), PROFILE_KEY.encode())
+
+
+def register_request_profiler(app: Flask):
+    """Подключить профилирование запросов по ?__profile и выборочное"""
+
+    @app.before_request
+    def start_request_profile():
+        requested = _requested()
+        sampled = (not requested and PROFILE_SAMPLE_RATE > 0 and request.endpoint not in PROFILE_SAMPLE_EXCLUDE
+                   and random.random() < PROFILE_SAMPLE_RATE)
+        if not requested and not sampled:
+            return
+        profile = _RequestProfile(sampled)
+        try:
+            profile.profiler.enable()
+        except ValueError:
+            # В потоке уже работает другой профилировщик
+            logger.warning(f"Профилирование запроса {request.path} пропущено: профилировщик занят")
+            return
+        g.request_profile = profile
+
+    @app.after_request
+    def finish_request_profile(response: Response) -> Response:
+        profile = g.pop('request_profile', None)
+        if profile is None:
+            return response
+        if response.is_streamed:
+            status = response.status_code
+            # Тело потокового ответа собирается после обработчика - профилируем до закрытия
+            response.call_on_close(lambda: profile.finish(status))
+        else:
+            stats = profile.finish(response.status_code)
+            if stats is not None and not profile.sampled:
+                response.headers['X-Profile-Summary'] = header_summary(stats)
+        if not profile.sampled:
+            response.headers['X-Profile'] = f"/api/admin/profiles/{profile.id}"
+        return response
+
+    @app.teardown_request
+    def abort_request_profile(error=None):
+        profile = g.pop('request_profile', None)
+        if profile is not None:
+            profile.finish(500)
+
+
+# ========= ОТЧЕТЫ =========
+
+def header_summary(stats: pstats.Stats) -> str:
+    """Функции с наибольшим накопленным временем для заголовка ответа"""
+    rows = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:PROFILE_HEADER_FUNCTIONS]
+    parts = []
+    for (filename, line, function), (_, calls, _, cumulative, _) in rows:
+        location = f"{os.path.basename(filename)}:{line}" if line else filename
+        parts.append(f"{location}({function}) {cumulative:.4f}s x{calls}")
+    # Значение заголовка должно быть в latin-1
+    return '; '.join(parts).encode('latin-1', 'replace').decode('latin-1')
+
+
+def list_profiles() -> List[Dict]:
+    """Описания сохраненных профилей, новые первыми"""
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in sorted(names, reverse=True):
+        if name.endswith('.json'):
+            meta = DataManager.load_json(os.path.join(PROFILE_DIR, name))
+            if isinstance(meta, dict) and meta.get('id'):
+                profiles.append(meta)
+    return profiles
+
+
+def profile_report(profile_id: str) -> Optional[str]:
+    """Текстовый отчет pstats профиля: PROFILE_TOP_FUNCTIONS функций по накопленному времени"""
+    path = profile_path(profile_id)
+    if path is None:
+        return None
+    output = io.StringIO()
+    stats = pstats.Stats(path, stream=output)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP_FUNCTIONS)
+    return output.getvalue()
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """Файл pstats профиля (None - нет такого профиля)"""
+    # ID профиля - имя файла, поэтому допускаются только цифры, буквы a-f и дефис
+    if not profile_id or not all(c in '0123456789abcdef-' for c in profile_id):
+        return None
+    path = _path(profile_id, '.prof')
+    return path if os.path.exists(path) else None
+
+
+def _path(profile_id: str, suffix: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{profile_id}{suffix}")
+
+
+def _remove_old_profiles():
+    """Удалить профили сверх PROFILE_MAX_FILES (самые старые)"""
+    ids = sorted(name[:-len('.prof')] for name in os.listdir(PROFILE_DIR) if name.endswith('.prof'))
+    for profile_id in ids[:max(0, len(ids) - PROFILE_MAX_FILES)]:
+        for suffix in ('.prof', '.json'):
+            try:
+                os.remove(_path(profile_id, suffix))
+            except FileNotFoundError:
+                pass
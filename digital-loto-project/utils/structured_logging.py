@@ -0,0 +1,226 @@
+"""
+Журналирование строками JSON без записи в потоке запроса
+
+Обработчик логгеров - очередь (QueueHandler): поток запроса только
+кладет запись в очередь, а форматирует и пишет ее поток QueueListener.
+Каждая запись - одна строка JSON:
+
+    {"time": "2024-05-01T12:00:00.123", "level": "INFO", "logger": "models.lottery",
+     "message": "...", "process": 1234, "thread": "MainThread"}
+
+Записи ниже WARNING ограничиваются по месту вызова (логгер, файл,
+строка), а не по тексту: сообщения собираются f-строками, и повторяющиеся
+записи отличаются только подставленными значениями. С одного места
+проходит LOG_RATE_LIMIT записей в секунду (с запасом LOG_RATE_BURST),
+сверх этого - каждая LOG_SAMPLE_EVERY-я. Прошедшая запись несет поле
+suppressed - сколько записей этого места отброшено перед ней. При
+переполнении очереди записи отбрасываются, а их число передается полем
+dropped следующей записи: журнал не задерживает запросы.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись журнала - строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName
+        }
+        for field in ('suppressed', 'dropped'):
+            value = getattr(record, field, None)
+            if value:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _Site:
+    """Состояние ограничения одного места вызова"""
+
+    __slots__ = ('tokens', 'updated', 'suppressed')
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+        self.suppressed = 0
+
+
+class RateLimitFilter(logging.Filter):
+    """Ограничение частоты и выборка повторяющихся записей по месту вызова
+
+    rate - записей в секунду с одного места, burst - запас сверх частоты,
+    sample_every - какая по счету отброшенная запись все же проходит (0 -
+    никакая). logger_rates задает свою частоту логгерам по префиксу имени
+    (None - без ограничения). WARNING и выше проходят всегда.
+    """
+
+    def __init__(self, rate: float, burst: float, sample_every: int,
+                 logger_rates: Optional[Dict[str, Optional[float]]] = None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample_every = sample_every
+        self.logger_rates = logger_rates or {}
+        self._lock = threading.Lock()
+        self._sites: Dict[Tuple[str, str, int], _Site] = {}
+        self._rates: Dict[str, Optional[float]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate is None:
+            return True
+
+        now = time.monotonic()
+        key = (record.name, record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = _Site(max(self.burst, 1), now)
+            site.tokens = min(max(self.burst, 1), site.tokens + (now - site.updated) * rate)
+            site.updated = now
+            if site.tokens >= 1:
+                site.tokens -= 1
+            else:
+                site.suppressed += 1
+                if not self.sample_every or site.suppressed % self.sample_every:
+                    return False
+                # Выборочная запись: отброшенные до нее записи не считая ее самой
+                site.suppressed -= 1
+            suppressed, site.suppressed = site.suppressed, 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+    def _rate(self, name: str) -> Optional[float]:
+        """Частота логгера: самый длинный подходящий префикс logger_rates или общая"""
+        if name in self._rates:
+            return self._rates[name]
+        rate = self.rate
+        matched = -1
+        for prefix, prefix_rate in self.logger_rates.items():
+            if (name == prefix or name.startswith(prefix + '.')) and len(prefix) > matched:
+                rate, matched = prefix_rate, len(prefix)
+        self._rates[name] = rate
+        return rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который при заполненной очереди отбрасывает записи с подсчетом"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Копия записи без аргументов и исключения: текст собирается в потоке вызова,
+        а трассировка сохраняется отдельным полем, а не в тексте сообщения"""
+        prepared = logging.makeLogRecord(record.__dict__)
+        prepared.msg = record.getMessage()
+        prepared.args = None
+        if record.exc_info:
+            prepared.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+        prepared.exc_info = None
+        return prepared
+
+    def enqueue(self, record: logging.LogRecord):
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            record.dropped = dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += dropped + 1
+
+
+class LoggingPipeline:
+    """Очередь записей и поток, который пишет их в поток вывода или файл"""
+
+    def __init__(self, handler: logging.Handler, queue_size: int, rate_filter: logging.Filter):
+        self.handler = handler
+        self.queue_size = queue_size
+        self.queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+        self.queue_handler.addFilter(rate_filter)
+        self.rate_filter = rate_filter
+        self.listener: Optional[logging.handlers.QueueListener] = None
+
+    def start(self):
+        self.listener = logging.handlers.QueueListener(
+            self.queue_handler.queue, self.handler, respect_handler_level=True
+        )
+        self.listener.start()
+
+    def stop(self):
+        """Дописать записи из очереди и остановить поток"""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def restart_after_fork(self):
+        """В дочернем процессе (воркер gunicorn с --preload) потока записи нет:
+        заводится новая очередь и новый поток"""
+        # Блокировки могли остаться захваченными потоками родителя
+        self.rate_filter._lock = threading.Lock()
+        self.queue_handler._dropped_lock = threading.Lock()
+        self.queue_handler.queue = queue.Queue(maxsize=self.queue_size)
+        self.queue_handler.dropped = 0
+        self.start()
+
+
+_pipeline: Optional[LoggingPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def configure_logging(level: str, log_file: Optional[str], queue_size: int, rate: float, burst: float,
+                      sample_every: int, logger_rates: Optional[Dict[str, Optional[float]]] = None) -> LoggingPipeline:
+    """Заменить обработчики корневого логгера очередью с записью строк JSON (один раз на процесс)"""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is not None:
+            return _pipeline
+
+        if log_file:
+            os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+            # WatchedFileHandler переоткрывает файл после ротации (logrotate)
+            handler: logging.Handler = logging.handlers.WatchedFileHandler(log_file, encoding='utf-8')
+        else:
+            handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter())
+
+        pipeline = LoggingPipeline(handler, queue_size, RateLimitFilter(rate, burst, sample_every, logger_rates))
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(pipeline.queue_handler)
+        root.setLevel(level)
+
+        pipeline.start()
+        atexit.register(pipeline.stop)
+        os.register_at_fork(after_in_child=pipeline.restart_after_fork)
+        _pipeline = pipeline
+        return pipeline
@@ -0,0 +1,121 @@
+"""
+Битовые маски билетов и векторный подсчет совпадений
+
+Числа билета (1..MAX_LOTTERY_NUMBER <= 63) кодируются одним 64-битным
+целым: число n соответствует биту n. Количество совпадений с выигрышной
+комбинацией - это popcount(маска_билета & маска_розыгрыша).
+
+Если установлен NumPy, подсчет для массива масок выполняется векторно;
+без него используется array('Q') и int.bit_count. Совпадения считаются
+один раз на каждую различную комбинацию (маску) и раздаются билетам с
+этой комбинацией.
+"""
+from array import array
+from typing import Dict, Iterable, List, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # NumPy не обязателен
+    np = None
+
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+else:  # Python < 3.10
+    def popcount(value: int) -> int:
+        return bin(value).count('1')
+
+# Таблица popcount для байта (NumPy без bitwise_count)
+_POPCOUNT_BYTE = (
+    np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8) if np is not None else None
+)
+
+
+def numbers_to_mask(numbers: Iterable[int]) -> int:
+    """Маска набора чисел"""
+    mask = 0
+    for number in numbers:
+        mask |= 1 << number
+    return mask
+
+
+def mask_to_numbers(mask: int) -> List[int]:
+    """Отсортированные числа по маске"""
+    return [n for n in range(mask.bit_length()) if mask >> n & 1]
+
+
+def new_mask_array(masks: Iterable[int] = ()) -> array:
+    """Упакованный массив масок (8 байт на билет)"""
+    return array('Q', masks)
+
+
+def _np_counts(masks: Sequence[int], winning_mask: int):
+    """Векторный AND + popcount (NumPy)"""
+    if isinstance(masks, array) and masks.typecode == 'Q':
+        values = np.frombuffer(masks, dtype=np.uint64)
+    else:
+        values = np.asarray(masks, dtype=np.uint64)
+    hits = np.bitwise_and(values, np.uint64(winning_mask))
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(hits)
+    return _POPCOUNT_BYTE[hits.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def count_matches(masks: Sequence[int], winning_mask: int) -> List[int]:
+    """Количество совпадений для каждой маски из masks"""
+    if not len(masks):
+        return []
+    if np is not None:
+        return _np_counts(masks, winning_mask).tolist()
+    return [popcount(mask & winning_mask) for mask in masks]
+
+
+def group_by_combination(ids: Sequence[int], masks: Sequence[int]) -> Dict[int, List[int]]:
+    """ID билетов, сгруппированные по комбинации: {маска: [ID билетов]}"""
+    combinations: Dict[int, List[int]] = {}
+    for ticket_id, mask in zip(ids, masks):
+        group = combinations.get(mask)
+        if group is None:
+            group = combinations[mask] = []
+        group.append(ticket_id)
+    return combinations
+
+
+def group_combinations_by_matches(combinations: Dict[int, Sequence[int]],
+                                  winning_mask: int) -> Dict[int, List[int]]:
+    """Совпадения считаются один раз на комбинацию и раздаются ее билетам
+
+    combinations - {маска: [ID билетов]}; результат - {совпадения: [ID
+    билетов по возрастанию]} по возрастанию совпадений.
+    """
+    groups: Dict[int, List[int]] = {}
+    for ids, matches in zip(combinations.values(), count_matches(new_mask_array(combinations), winning_mask)):
+        group = groups.get(matches)
+        if group is None:
+            group = groups[matches] = []
+        group.extend(ids)
+    for group in groups.values():
+        group.sort()
+    return dict(sorted(groups.items()))
+
+
+def group_by_matches(ids: Sequence[int], masks: Sequence[int], winning_mask: int) -> Dict[int, List[int]]:
+    """ID билетов, сгруппированные по количеству совпадений
+
+    Совпадения считаются один раз на каждую различную комбинацию и
+    раздаются ее билетам. Результат - {совпадения: [ID билетов по
+    возрастанию]} по возрастанию совпадений.
+    """
+    if not len(masks):
+        return {}
+
+    if np is not None:
+        if isinstance(masks, array) and masks.typecode == 'Q':
+            values = np.frombuffer(masks, dtype=np.uint64)
+        else:
+            values = np.asarray(masks, dtype=np.uint64)
+        combinations, inverse = np.unique(values, return_inverse=True)
+        counts = _np_counts(combinations, winning_mask)[inverse.reshape(-1)]
+        id_values = np.asarray(ids, dtype=np.int64)
+        return {int(matches): np.sort(id_values[counts == matches]).tolist() for matches in np.unique(counts)}
+
+    return group_combinations_by_matches(group_by_combination(ids, masks), winning_mask)
@@ -12,6 +12,10 @@ class Validators:
         """Валидация чисел билета"""
         required_count = 8 if draw_type == 'big' else 6
         
+        # Проверяем тип данных
+        if not isinstance(numbers, list) or not all(type(num) is int for num in numbers):
+            return False
+        
         # Проверяем количество чисел
         if len(numbers) != required_count:
             return False
@@ -0,0 +1,27 @@
+"""
+Настройки gunicorn для продакшн
+
+gunicorn читает этот файл сам при запуске из корня проекта:
+
+    gunicorn wsgi:app
+
+Воркеры потоковые (gthread): поток событий /api/events занимает поток
+воркера на все время соединения, и с синхронными воркерами подключенные
+клиенты заняли бы все воркеры. Подписчиков в воркере не больше
+EVENTS_MAX_SUBSCRIBERS (config.py) - это число должно быть меньше threads.
+"""
+import os
+
+# Адрес и порт (PORT задает платформа)
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Процессы и потоки в каждом из них
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+
+# Запрос дольше timeout секунд перезапускает воркер; открытые потоки событий
+# его не задерживают - в gthread воркер отмечается живым главным потоком
+timeout = 30
+# Сколько держать простаивающее keep-alive соединение (сек.)
+keepalive = 5